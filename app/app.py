@@ -1,103 +1,723 @@
-# app.py
-
-from config.db_connection import DatabaseConnection
-from config.settings import HOST, USER, PASSWORD, DATABASE, SERVER_IP
-from models.dim_actividades_extractor import DimActividadesExtractor
-from models.rol_play_sim_extractor import RolPlaySimExtractor
-from utils.logger import logger
-
-from flask import Flask, jsonify, request
-
-app = Flask(__name__)
-
-# Establecer un límite máximo para page_size
-MAX_PAGE_SIZE = 50000  # Puedes ajustar este valor según tus necesidades
-
-# Lista de IDs válidos para Bancoppel
-BANCOPPEL_IDS = [182, 190, 213, 212, 219, 215, 214, 189, 217, 218, 221, 193, 216]
-
-# --------------------------------------------------------------------------------------------------------------------------------------------------------------------------------------------------------------------------
-
-# Nuevo endpoint para DimActividadesExtractor
-@app.route('/api/dim_actividades', methods=['GET'])
-def get_dim_actividades():
-    try:
-        # Obtener los parámetros de la solicitud
-        ids = request.args.getlist('id', type=int)
-        fecha_inicio = request.args.get('fecha_inicio', '').strip()
-        fecha_fin = request.args.get('fecha_fin', '').strip()
-        page = request.args.get('page', default=1, type=int)
-        page_size = request.args.get('page_size', default=10000, type=int)
-
-        if not ids:
-            return jsonify({"error": "Debes proporcionar al menos un ID."}), 400
-
-        # Asegurar que page_size no exceda el máximo permitido
-        if page_size > MAX_PAGE_SIZE:
-            page_size = MAX_PAGE_SIZE
-
-        logger.debug(f"Request to /api/dim_actividades received with ids: {ids}, date range: {fecha_inicio} - {fecha_fin}, page: {page}, page_size: {page_size}")
-
-        # Crear una instancia del extractor
-        db_conn = DatabaseConnection(HOST, USER, PASSWORD, DATABASE)
-        dim_actividades_extractor = DimActividadesExtractor(db_conn)
-
-        # Obtener datos paginados de DimActividadesExtractor
-        actividades_data = dim_actividades_extractor.get_data_paginated(
-            ids, fecha_inicio=fecha_inicio, fecha_fin=fecha_fin, page=page, page_size=page_size
-        )
-
-        # No es necesario cerrar la conexión aquí
-
-        return jsonify(actividades_data), 200
-
-    except Exception as e:
-        logger.error(f"Error al obtener las actividades: {e}")
-        return jsonify({"error": "Error al obtener las actividades"}), 500
-
-# --------------------------------------------------------------------------------------------------------------------------------------------------------------------------------------------------------------------------------------------------------------------------------------------------------------
-
-# Nuevo endpoint para RolPlaySimExtractor
-@app.route('/api/rol_play_sim_extractor', methods=['GET'])
-def get_rol_play_sim():
-    try:
-        # Obtener los parámetros de la solicitud
-        ids = request.args.getlist('id', type=int)
-        fecha_inicio = request.args.get('fecha_inicio', '').strip()
-        fecha_fin = request.args.get('fecha_fin', '').strip()
-        page = request.args.get('page', default=1, type=int)
-        page_size = request.args.get('page_size', default=10000, type=int)
-
-        if not ids:
-            return jsonify({"error": "Debes proporcionar al menos un ID."}), 400
-
-        # Asegurar que page_size no exceda el máximo permitido
-        if page_size > MAX_PAGE_SIZE:
-            page_size = MAX_PAGE_SIZE
-
-        logger.debug(f"Request to /api/rol_play_sim_extractor received with ids: {ids}, date range: {fecha_inicio} - {fecha_fin}, page: {page}, page_size: {page_size}")
-
-        # Crear una instancia del extractor
-        db_conn = DatabaseConnection(HOST, USER, PASSWORD, DATABASE)
-        rol_play_sim_extractor = RolPlaySimExtractor(db_conn)
-
-        # Obtener datos paginados de RolPlaySimExtractor
-        rol_play_sim_data = rol_play_sim_extractor.get_data_paginated(
-            ids, fecha_inicio=fecha_inicio, fecha_fin=fecha_fin, page=page, page_size=page_size
-        )
-
-        # No es necesario cerrar la conexión aquí
-
-        return jsonify(rol_play_sim_data), 200
-
-    except Exception as e:
-        logger.error(f"Error al obtener las actividades: {e}")
-        return jsonify({"error": "Error al obtener las actividades"}), 500
-
-if __name__ == '__main__':
-    app.run(debug=True, host=SERVER_IP, port=7001)
-
-
-
-
-
+# app.py
+
+from config.db_connection import DatabaseConnection
+from config.settings import (
+    HOST, USER, PASSWORD, DATABASE, SERVER_IP,
+    DB_POOL_SIZE, DB_POOL_MAX_LIFETIME, DB_POOL_TIMEOUT, DB_POOL_PING_INTERVAL, DB_USE_PURE,
+    STREAM_TAM_LOTE, ALMACEN_RUTA, ALMACEN_TAM_LOTE, ALMACEN_MAX_LOTES, ALMACEN_VENTANA_IDS,
+    CACHE_RESPUESTAS_DIR, CACHE_RESPUESTAS_TTL, CACHE_RESPUESTAS_MAX_BYTES,
+    COALESCENCIA_ENTRE_WORKERS, COALESCENCIA_DIR, COALESCENCIA_ESPERA_MAXIMA,
+    EXPORTACIONES_DIR, EXPORTACIONES_FILAS_POR_PARTE, EXPORTACIONES_MAX_ACTIVAS, EXPORTACIONES_LATIDO,
+    COMPRESION_NIVEL,
+    FRAGMENTOS_CONCURRENCIA, FRAGMENTOS_ESPERA_CONEXION, DELTA_VENTANA_IDS
+)
+from models.almacen_incremental import AlmacenIncremental, normalizar_fecha
+from models.agregados_manager import AgregadosManager
+from models.dim_actividades_extractor import DimActividadesExtractor
+from models.exportaciones_manager import ExportacionesManager
+from models.fragmentacion import dias_fragmento
+from models.rol_play_sim_extractor import RolPlaySimExtractor
+from models.sale_exercises_query import decodificar_cursor, decodificar_marca_agua
+from utils.cache_plantillas import estadisticas_caches
+from utils.cache_respuestas import CacheRespuestas, clave_respuesta, calcular_etag
+from utils.coalescencia import Coalescedor
+from utils.formatos import (
+    CODIFICACIONES, ProveedorJSON, a_columnar, comprimir, comprimir_stream, generar_csv, generar_ndjson,
+    generar_json_array
+)
+from utils.logger import continuar_errores_fila, iniciar_errores_fila, logger, terminar_errores_fila
+from utils.metricas import (
+    contar_filas_emitidas, iniciar_medicion, limpiar_metricas, medicion_actual, medir, registro_metricas,
+    terminar_medicion
+)
+from utils.procesamiento_paralelo import estadisticas_paralelo
+
+import itertools
+import os
+from mysql.connector.errors import PoolError
+from flask import Flask, Response, g, jsonify, request, send_file, stream_with_context, url_for
+
+app = Flask(__name__)
+app.json = ProveedorJSON(app)
+
+# Establecer un límite máximo para page_size
+MAX_PAGE_SIZE = 50000  # Puedes ajustar este valor según tus necesidades
+
+# Segundos sugeridos al cliente (Retry-After) cuando no hay conexiones libres con MySQL
+REINTENTAR_SIN_CONEXION = 5
+
+# Lista de IDs válidos para Bancoppel
+BANCOPPEL_IDS = [182, 190, 213, 212, 219, 215, 214, 189, 217, 218, 221, 193, 216]
+
+# Conexión compartida por todas las solicitudes del worker; el pool interno se crea una sola vez
+# por proceso (gunicorn importa la app en cada worker) y se precalienta en gunicorn.conf.py.
+db_conn = DatabaseConnection(
+    HOST, USER, PASSWORD, DATABASE,
+    pool_size=DB_POOL_SIZE,
+    max_lifetime=DB_POOL_MAX_LIFETIME,
+    pool_timeout=DB_POOL_TIMEOUT,
+    ping_interval=DB_POOL_PING_INTERVAL,
+    use_pure=DB_USE_PURE,
+)
+
+# Almacén incremental de filas procesadas; el archivo SQLite es el mismo para todos los workers
+almacen = AlmacenIncremental(ALMACEN_RUTA, tam_lote=ALMACEN_TAM_LOTE, max_lotes=ALMACEN_MAX_LOTES,
+                             ventana=ALMACEN_VENTANA_IDS)
+
+# Cache de respuestas en disco compartido por los workers (las respuestas en streaming no se guardan)
+cache_respuestas = CacheRespuestas(
+    CACHE_RESPUESTAS_DIR, ttl=CACHE_RESPUESTAS_TTL, max_bytes=CACHE_RESPUESTAS_MAX_BYTES
+)
+
+# Coalescencia de solicitudes idénticas en curso; entre workers sólo si COALESCENCIA_ENTRE_WORKERS
+# y el cache de respuestas está activo (es donde el líder deja el resultado para los demás)
+coalescedor = Coalescedor(
+    directorio_candados=COALESCENCIA_DIR if COALESCENCIA_ENTRE_WORKERS and CACHE_RESPUESTAS_TTL > 0 else None,
+    espera_maxima=COALESCENCIA_ESPERA_MAXIMA,
+)
+
+# Exportaciones en segundo plano: cada una corre en su propio proceso, fuera de los workers
+exportaciones_manager = ExportacionesManager(
+    EXPORTACIONES_DIR, filas_por_parte=EXPORTACIONES_FILAS_POR_PARTE, max_activas=EXPORTACIONES_MAX_ACTIVAS,
+    latido=EXPORTACIONES_LATIDO
+)
+
+# Formatos admitidos por el parámetro stream: generador de la respuesta y mimetype
+FORMATOS_STREAM = {
+    'ndjson': (generar_ndjson, 'application/x-ndjson'),
+    'json': (generar_json_array, 'application/json'),
+}
+
+# Formatos admitidos por el parámetro format para las páginas completas
+FORMATOS_SALIDA = ('json', 'columnar', 'csv')
+
+
+def respuesta_stream(lotes, formato):
+    """
+    Arma una respuesta en streaming a partir de un generador de lotes ya procesados.
+    El primer lote se obtiene antes de responder para que un error de conexión o de consulta
+    todavía pueda devolverse como 500; después, los lotes se serializan a medida que llegan.
+    """
+    generador, mimetype = FORMATOS_STREAM[formato]
+    primer_lote = next(lotes, [])
+    # Los lotes siguientes se procesan mientras se envía la respuesta, después de cerrar la
+    # solicitud: sus errores por fila se reportan en un solo resumen al terminar el stream
+    lotes = continuar_errores_fila(lotes, request.path)
+    cuerpo = generador(itertools.chain([primer_lote], lotes), app.json.dumps)
+    codificacion = codificacion_aceptada()
+    if codificacion:
+        cuerpo = comprimir_stream(cuerpo, codificacion, COMPRESION_NIVEL)
+    respuesta = Response(stream_with_context(cuerpo), mimetype=mimetype)
+    if codificacion:
+        respuesta.headers['Content-Encoding'] = codificacion
+    respuesta.vary.add('Accept-Encoding')
+    return respuesta
+
+
+def codificacion_aceptada():
+    # gzip o deflate según Accept-Encoding (respetando q=0); None si el cliente no acepta ninguna
+    return request.accept_encodings.best_match(CODIFICACIONES)
+
+
+def etag_variante(etag, codificacion):
+    # Cada codificación es un cuerpo distinto: su ETag lleva la codificación como sufijo
+    return f"{etag}-{codificacion}" if codificacion else etag
+
+
+def respuesta_cuerpo(cuerpo, mimetype, etag, codificacion):
+    """
+    Respuesta con el cuerpo comprimido según la codificación negociada, ETag de la variante y
+    Vary: Accept-Encoding para que los proxies no mezclen variantes.
+    """
+    if codificacion:
+        with medir('serializar'):
+            cuerpo = comprimir(cuerpo, codificacion, COMPRESION_NIVEL)
+    respuesta = Response(cuerpo, mimetype=mimetype)
+    if codificacion:
+        respuesta.headers['Content-Encoding'] = codificacion
+    respuesta.vary.add('Accept-Encoding')
+    respuesta.set_etag(etag_variante(etag, codificacion))
+    return respuesta.make_conditional(request)
+
+
+def serializar(datos, formato):
+    """
+    Cuerpo (bytes) y mimetype de `datos` en el formato pedido. En las respuestas con cursor sólo
+    cambia la forma de "data"; el CSV no admite cursor (se valida en las rutas).
+    """
+    registros = datos.get('data') if isinstance(datos, dict) else datos
+    if formato == 'csv':
+        return ''.join(generar_csv(registros)).encode('utf-8'), 'text/csv; charset=utf-8'
+    if formato == 'columnar':
+        datos = {**datos, 'data': a_columnar(registros)} if isinstance(datos, dict) else a_columnar(registros)
+    respuesta = jsonify(datos)
+    return respuesta.get_data(), respuesta.mimetype
+
+
+@app.before_request
+def iniciar_medicion_solicitud():
+    if request.path.startswith('/api/'):
+        g.medicion, g.token_medicion = iniciar_medicion()
+        # Los errores de parseo por fila se reportan en una sola línea al terminar la solicitud
+        _, g.token_errores_fila = iniciar_errores_fila()
+
+
+@app.after_request
+def reportar_medicion_solicitud(respuesta):
+    """
+    Agrega el encabezado Server-Timing y acumula las métricas de la ruta. En las respuestas en
+    streaming el cuerpo todavía no se generó: se reporta el tiempo hasta el primer lote y sin bytes.
+    """
+    medicion = medicion_actual()
+    if medicion is None or request.url_rule is None:
+        return respuesta
+    total = medicion.duracion()
+    bytes_respuesta = None if respuesta.is_streamed else respuesta.calculate_content_length()
+    respuesta.headers['Server-Timing'] = medicion.server_timing(total, bytes_respuesta)
+    registro_metricas.registrar(request.url_rule.rule, respuesta.status_code, medicion, total, bytes_respuesta)
+    return respuesta
+
+
+@app.teardown_request
+def terminar_medicion_solicitud(error=None):
+    token = g.pop('token_medicion', None)
+    if token is not None:
+        terminar_medicion(token)
+    token = g.pop('token_errores_fila', None)
+    if token is not None:
+        terminar_errores_fila(token, request.path)
+
+
+def respuesta_desde_cache(clave):
+    """
+    Respuesta guardada para `clave`, o None si no hay una vigente. Si el cliente ya tiene la misma
+    versión (If-None-Match) se responde 304 sin leer el cuerpo ni consultar la base de datos.
+    """
+    entrada = cache_respuestas.obtener(clave)
+    if entrada is None:
+        return None
+
+    codificacion = codificacion_aceptada()
+    if request.if_none_match.contains_weak(etag_variante(entrada.etag, codificacion)):
+        cache_respuestas.registrar_no_modificada()
+        respuesta = Response(status=304)
+        respuesta.vary.add('Accept-Encoding')
+        respuesta.set_etag(etag_variante(entrada.etag, codificacion))
+        return respuesta
+
+    cuerpo = cache_respuestas.leer_cuerpo(entrada)
+    if cuerpo is None:
+        return None
+    return respuesta_cuerpo(cuerpo, entrada.mimetype, entrada.etag, codificacion)
+
+
+def respuesta_json(clave, calcular, formato='json', guardar=True):
+    """
+    Ejecuta calcular() y responde su resultado en `formato` (ver serializar) con ETag. Las
+    solicitudes idénticas que llegan mientras la extracción está en curso esperan y comparten el
+    mismo cuerpo (coalescedor).
+    Los resultados vacíos no se guardan en el cache: los modelos también devuelven una lista
+    vacía cuando falla la consulta. Con guardar=False el resultado nunca se guarda (sólo se
+    comparte con las solicitudes idénticas en curso).
+    """
+    def generar():
+        datos = calcular()
+        contar_filas_emitidas(len(datos.get('data') or []) if isinstance(datos, dict) else len(datos))
+        with medir('serializar'):
+            cuerpo, mimetype = serializar(datos, formato)
+        if guardar and (datos.get('data') if isinstance(datos, dict) else datos):
+            cache_respuestas.guardar(clave, cuerpo, mimetype)
+        return cuerpo, mimetype, calcular_etag(cuerpo)
+
+    def revisar():
+        # Otro worker pudo haber guardado la misma respuesta mientras se esperaba su candado
+        entrada = cache_respuestas.obtener(clave)
+        cuerpo = cache_respuestas.leer_cuerpo(entrada) if entrada is not None else None
+        return (cuerpo, entrada.mimetype, entrada.etag) if cuerpo is not None else None
+
+    cuerpo, mimetype, etag = coalescedor.ejecutar(clave, generar, revisar=revisar)
+    return respuesta_cuerpo(cuerpo, mimetype, etag, codificacion_aceptada())
+
+
+def respuesta_sin_conexion(error):
+    """
+    503 con Retry-After cuando el pool del worker no entregó una conexión a tiempo (PoolError):
+    el cliente distingue la saturación de una consulta sin resultados.
+    """
+    logger.warning("Sin conexiones libres con la base de datos: %s", error)
+    respuesta = jsonify({"error": "No hay conexiones disponibles con la base de datos; intenta de nuevo."})
+    respuesta.headers['Retry-After'] = str(REINTENTAR_SIN_CONEXION)
+    return respuesta, 503
+
+# --------------------------------------------------------------------------------------------------------------------------------------------------------------------------------------------------------------------------
+
+# Nuevo endpoint para DimActividadesExtractor
+@app.route('/api/dim_actividades', methods=['GET'])
+def get_dim_actividades():
+    try:
+        # Obtener los parámetros de la solicitud
+        ids = request.args.getlist('id', type=int)
+        fecha_inicio = request.args.get('fecha_inicio', '').strip()
+        fecha_fin = request.args.get('fecha_fin', '').strip()
+        page = request.args.get('page', default=1, type=int)
+        page_size = request.args.get('page_size', default=10000, type=int)
+        # Si llega el parámetro cursor (vacío para la primera página) se pagina por keyset
+        cursor = request.args.get('cursor')
+        # stream=ndjson|json entrega la respuesta por partes leyendo con un cursor sin buffer
+        stream = request.args.get('stream', '').strip().lower()
+        # modo=dimension arma la dimensión con el primer y el último ejercicio de cada variante de plantilla por actividad
+        modo = request.args.get('modo', '').strip().lower()
+        # format=json|columnar|csv elige la forma de la página completa
+        formato = request.args.get('format', 'json').strip().lower() or 'json'
+        # fields=Campo1,Campo2 limita la salida, las columnas leídas y las etapas de procesamiento
+        campos = parametro_lista('fields')
+        # shard=dia|semana|mes|<días> lee el rango de fechas en fragmentos paralelos (paginación por keyset)
+        shard = request.args.get('shard', '').strip()
+
+        if not ids:
+            return jsonify({"error": "Debes proporcionar al menos un ID."}), 400
+
+        if stream and stream not in FORMATOS_STREAM:
+            return jsonify({"error": "El parámetro stream debe ser 'ndjson' o 'json'."}), 400
+
+        if stream and cursor is not None:
+            return jsonify({"error": "Los parámetros stream y cursor no se pueden combinar."}), 400
+
+        if modo not in ('', 'dimension'):
+            return jsonify({"error": "El parámetro modo sólo admite 'dimension'."}), 400
+
+        if modo and (stream or cursor is not None):
+            return jsonify({"error": "El modo dimension no admite los parámetros stream ni cursor."}), 400
+
+        if formato not in FORMATOS_SALIDA:
+            return jsonify({"error": "El parámetro format debe ser 'json', 'columnar' o 'csv'."}), 400
+
+        if formato != 'json' and stream:
+            return jsonify({"error": "El parámetro format no se puede combinar con stream."}), 400
+
+        if formato == 'csv' and (cursor is not None or shard):
+            return jsonify({"error": "El formato csv no admite los parámetros cursor ni shard."}), 400
+
+        if shard:
+            error_shard = validar_shard(shard, fecha_inicio, fecha_fin, stream or modo)
+            if error_shard:
+                return jsonify({"error": error_shard}), 400
+
+        try:
+            posicion_cursor = decodificar_cursor(cursor) if cursor else None
+        except ValueError:
+            return jsonify({"error": "El parámetro cursor no es válido."}), 400
+
+        # Crear una instancia del extractor sobre la conexión compartida del worker
+        try:
+            dim_actividades_extractor = DimActividadesExtractor(db_conn, campos=campos)
+        except ValueError as e:
+            return jsonify({"error": str(e)}), 400
+
+        # Asegurar que page_size no exceda el máximo permitido
+        if page_size > MAX_PAGE_SIZE:
+            page_size = MAX_PAGE_SIZE
+
+        logger.debug("Request to /api/dim_actividades received with ids: %s, date range: %s - %s, page: %s, page_size: %s", ids, fecha_inicio, fecha_fin, page, page_size)
+
+        if not stream:
+            clave = clave_respuesta(
+                request.path, ids, fecha_inicio, fecha_fin, page, page_size,
+                cursor=cursor, modo=modo, formato=formato, campos=sorted(campos) or None,
+                shard=dias_fragmento(shard) if shard else None
+            )
+            respuesta = respuesta_desde_cache(clave)
+            if respuesta is not None:
+                return respuesta
+
+        if modo == 'dimension':
+            return respuesta_json(clave, lambda: dim_actividades_extractor.get_dimension(
+                ids, fecha_inicio=fecha_inicio, fecha_fin=fecha_fin
+            ), formato=formato)
+
+        if shard:
+            def extraer_pagina_fragmentada():
+                actividades_data, next_cursor = dim_actividades_extractor.get_data_fragmentado(
+                    ids, fecha_inicio, fecha_fin, dias_fragmento(shard), cursor=posicion_cursor,
+                    page_size=page_size, concurrencia=FRAGMENTOS_CONCURRENCIA,
+                    espera_conexion=FRAGMENTOS_ESPERA_CONEXION
+                )
+                return {"data": actividades_data, "next_cursor": next_cursor}
+
+            return respuesta_json(clave, extraer_pagina_fragmentada, formato=formato)
+
+        if cursor is not None:
+            def extraer_pagina_cursor():
+                actividades_data, next_cursor = dim_actividades_extractor.get_data_cursor(
+                    ids, fecha_inicio=fecha_inicio, fecha_fin=fecha_fin, cursor=posicion_cursor, page_size=page_size
+                )
+                return {"data": actividades_data, "next_cursor": next_cursor}
+
+            return respuesta_json(clave, extraer_pagina_cursor, formato=formato)
+
+        if stream:
+            lotes = dim_actividades_extractor.iterar_lotes(
+                ids, fecha_inicio=fecha_inicio, fecha_fin=fecha_fin, page=page, page_size=page_size,
+                tam_lote=STREAM_TAM_LOTE
+            )
+            return respuesta_stream(lotes, stream)
+
+        # Obtener datos paginados de DimActividadesExtractor
+        return respuesta_json(clave, lambda: dim_actividades_extractor.get_data_paginated(
+            ids, fecha_inicio=fecha_inicio, fecha_fin=fecha_fin, page=page, page_size=page_size
+        ), formato=formato)
+
+    except PoolError as e:
+        return respuesta_sin_conexion(e)
+    except Exception as e:
+        logger.error("Error al obtener las actividades: %s", e)
+        return jsonify({"error": "Error al obtener las actividades"}), 500
+
+# --------------------------------------------------------------------------------------------------------------------------------------------------------------------------------------------------------------------------------------------------------------------------------------------------------------
+
+# Nuevo endpoint para RolPlaySimExtractor
+@app.route('/api/rol_play_sim_extractor', methods=['GET'])
+def get_rol_play_sim():
+    try:
+        # Obtener los parámetros de la solicitud
+        ids = request.args.getlist('id', type=int)
+        fecha_inicio = request.args.get('fecha_inicio', '').strip()
+        fecha_fin = request.args.get('fecha_fin', '').strip()
+        page = request.args.get('page', default=1, type=int)
+        page_size = request.args.get('page_size', default=10000, type=int)
+        # Si llega el parámetro cursor (vacío para la primera página) se pagina por keyset
+        cursor = request.args.get('cursor')
+        # stream=ndjson|json entrega la respuesta por partes leyendo con un cursor sin buffer
+        stream = request.args.get('stream', '').strip().lower()
+        # fuente=almacen sirve la página desde el almacén incremental en lugar de MySQL
+        fuente = request.args.get('fuente', '').strip().lower()
+        # since=<saex_id|fecha> devuelve sólo las filas agregadas después de esa marca de agua
+        since = request.args.get('since', '').strip()
+        # format=json|columnar|csv elige la forma de la página completa
+        formato = request.args.get('format', 'json').strip().lower() or 'json'
+        # fields=Campo1,Campo2 limita la salida, las columnas leídas y las etapas de procesamiento
+        campos = parametro_lista('fields')
+        # shard=dia|semana|mes|<días> lee el rango de fechas en fragmentos paralelos (paginación por keyset)
+        shard = request.args.get('shard', '').strip()
+
+        if not ids:
+            return jsonify({"error": "Debes proporcionar al menos un ID."}), 400
+
+        if stream and stream not in FORMATOS_STREAM:
+            return jsonify({"error": "El parámetro stream debe ser 'ndjson' o 'json'."}), 400
+
+        if stream and cursor is not None:
+            return jsonify({"error": "Los parámetros stream y cursor no se pueden combinar."}), 400
+
+        if fuente not in ('', 'almacen'):
+            return jsonify({"error": "El parámetro fuente sólo admite 'almacen'."}), 400
+
+        if fuente and (stream or cursor is not None):
+            return jsonify({"error": "La fuente almacen no admite los parámetros stream ni cursor."}), 400
+
+        if formato not in FORMATOS_SALIDA:
+            return jsonify({"error": "El parámetro format debe ser 'json', 'columnar' o 'csv'."}), 400
+
+        if formato != 'json' and stream:
+            return jsonify({"error": "El parámetro format no se puede combinar con stream."}), 400
+
+        if formato == 'csv' and (cursor is not None or shard):
+            return jsonify({"error": "El formato csv no admite los parámetros cursor ni shard."}), 400
+
+        if shard:
+            error_shard = validar_shard(shard, fecha_inicio, fecha_fin, stream or fuente)
+            if error_shard:
+                return jsonify({"error": error_shard}), 400
+
+        if since:
+            if stream or fuente or shard or cursor is not None or formato == 'csv':
+                return jsonify({"error": "El parámetro since no se puede combinar con stream, fuente, shard, cursor ni format=csv."}), 400
+            try:
+                desde_id, _ = decodificar_marca_agua(since)
+            except ValueError:
+                return jsonify({"error": "El parámetro since debe ser un saex_id o una fecha ISO."}), 400
+
+        try:
+            posicion_cursor = decodificar_cursor(cursor) if cursor else None
+        except ValueError:
+            return jsonify({"error": "El parámetro cursor no es válido."}), 400
+
+        # Crear una instancia del extractor sobre la conexión compartida del worker
+        try:
+            rol_play_sim_extractor = RolPlaySimExtractor(db_conn, campos=campos)
+        except ValueError as e:
+            return jsonify({"error": str(e)}), 400
+
+        if fuente and fecha_inicio and fecha_fin:
+            try:
+                normalizar_fecha(fecha_inicio)
+                normalizar_fecha(fecha_fin)
+            except ValueError:
+                return jsonify({"error": "Las fechas deben tener formato ISO (YYYY-MM-DD o YYYY-MM-DD HH:MM:SS)."}), 400
+
+        # Asegurar que page_size no exceda el máximo permitido
+        if page_size > MAX_PAGE_SIZE:
+            page_size = MAX_PAGE_SIZE
+
+        logger.debug("Request to /api/rol_play_sim_extractor received with ids: %s, date range: %s - %s, page: %s, page_size: %s", ids, fecha_inicio, fecha_fin, page, page_size)
+
+        if since:
+            # Los deltas no pasan por el cache de respuestas: una consulta repetida con el mismo
+            # since debe ver las filas que llegaron mientras tanto. Con un saex_id como since se
+            # repiten las filas de los DELTA_VENTANA_IDS saex_id anteriores ("window"): el cliente
+            # descarta por ID_Sim las que ya tenía.
+            ventana = DELTA_VENTANA_IDS if desde_id is not None else 0
+
+            def extraer_delta():
+                rol_play_sim_data, marca_agua, hay_mas = rol_play_sim_extractor.get_data_delta(
+                    ids, since, fecha_inicio=fecha_inicio, fecha_fin=fecha_fin, page_size=page_size,
+                    ventana=ventana
+                )
+                return {"data": rol_play_sim_data, "watermark": marca_agua, "has_more": hay_mas, "window": ventana}
+
+            clave = clave_respuesta(
+                request.path, ids, fecha_inicio, fecha_fin, None, page_size,
+                since=since, formato=formato, campos=sorted(campos) or None
+            )
+            return respuesta_json(clave, extraer_delta, formato=formato, guardar=False)
+
+        if not stream:
+            clave = clave_respuesta(
+                request.path, ids, fecha_inicio, fecha_fin, page, page_size,
+                cursor=cursor, fuente=fuente, formato=formato, campos=sorted(campos) or None,
+                shard=dias_fragmento(shard) if shard else None
+            )
+            respuesta = respuesta_desde_cache(clave)
+            if respuesta is not None:
+                return respuesta
+
+        if fuente == 'almacen':
+            return respuesta_json(clave, lambda: rol_play_sim_extractor.get_data_almacen(
+                almacen, ids, fecha_inicio=fecha_inicio, fecha_fin=fecha_fin, page=page, page_size=page_size
+            ), formato=formato)
+
+        if shard:
+            def extraer_pagina_fragmentada():
+                rol_play_sim_data, next_cursor = rol_play_sim_extractor.get_data_fragmentado(
+                    ids, fecha_inicio, fecha_fin, dias_fragmento(shard), cursor=posicion_cursor,
+                    page_size=page_size, concurrencia=FRAGMENTOS_CONCURRENCIA,
+                    espera_conexion=FRAGMENTOS_ESPERA_CONEXION
+                )
+                return {"data": rol_play_sim_data, "next_cursor": next_cursor}
+
+            return respuesta_json(clave, extraer_pagina_fragmentada, formato=formato)
+
+        if cursor is not None:
+            def extraer_pagina_cursor():
+                rol_play_sim_data, next_cursor = rol_play_sim_extractor.get_data_cursor(
+                    ids, fecha_inicio=fecha_inicio, fecha_fin=fecha_fin, cursor=posicion_cursor, page_size=page_size
+                )
+                return {"data": rol_play_sim_data, "next_cursor": next_cursor}
+
+            return respuesta_json(clave, extraer_pagina_cursor, formato=formato)
+
+        if stream:
+            lotes = rol_play_sim_extractor.iterar_lotes(
+                ids, fecha_inicio=fecha_inicio, fecha_fin=fecha_fin, page=page, page_size=page_size,
+                tam_lote=STREAM_TAM_LOTE
+            )
+            return respuesta_stream(lotes, stream)
+
+        # Obtener datos paginados de RolPlaySimExtractor
+        return respuesta_json(clave, lambda: rol_play_sim_extractor.get_data_paginated(
+            ids, fecha_inicio=fecha_inicio, fecha_fin=fecha_fin, page=page, page_size=page_size
+        ), formato=formato)
+
+    except PoolError as e:
+        return respuesta_sin_conexion(e)
+    except Exception as e:
+        logger.error("Error al obtener las actividades: %s", e)
+        return jsonify({"error": "Error al obtener las actividades"}), 500
+
+# --------------------------------------------------------------------------------------------------------------------------------------------------------------------------------------------------------------------------------------------------------------------------------------------------------------
+
+# Endpoint de KPIs agregados (conteos, promedios y tasas por grupo) sobre sale_exercises
+@app.route('/api/aggregates', methods=['GET'])
+def get_aggregates():
+    try:
+        # Obtener los parámetros de la solicitud; agrupar y metrica aceptan valores repetidos o separados por comas
+        ids = request.args.getlist('id', type=int)
+        fecha_inicio = request.args.get('fecha_inicio', '').strip()
+        fecha_fin = request.args.get('fecha_fin', '').strip()
+        dimensiones = parametro_lista('agrupar') or ['use_case']
+        metricas = parametro_lista('metrica') or ['conteo']
+
+        if not ids:
+            return jsonify({"error": "Debes proporcionar al menos un ID."}), 400
+
+        agregados_manager = AgregadosManager(db_conn, tam_lote=STREAM_TAM_LOTE)
+        try:
+            agregados_manager.validar(dimensiones, metricas)
+        except ValueError as e:
+            return jsonify({"error": str(e)}), 400
+
+        logger.debug("Request to /api/aggregates received with ids: %s, date range: %s - %s, agrupar: %s, metricas: %s", ids, fecha_inicio, fecha_fin, dimensiones, metricas)
+
+        clave = clave_respuesta(request.path, ids, fecha_inicio, fecha_fin, None, None, agrupar=dimensiones, metricas=metricas)
+        respuesta = respuesta_desde_cache(clave)
+        if respuesta is not None:
+            return respuesta
+
+        def calcular_agregados():
+            return {
+                "agrupar": dimensiones,
+                "metricas": metricas,
+                "data": agregados_manager.get_agregados(
+                    ids, dimensiones, metricas, fecha_inicio=fecha_inicio, fecha_fin=fecha_fin
+                ),
+            }
+
+        return respuesta_json(clave, calcular_agregados)
+
+    except PoolError as e:
+        return respuesta_sin_conexion(e)
+    except Exception as e:
+        logger.error("Error al calcular los agregados: %s", e)
+        return jsonify({"error": "Error al calcular los agregados"}), 500
+
+
+def validar_shard(shard, fecha_inicio, fecha_fin, incompatible):
+    """
+    Mensaje de error para el parámetro shard, o None si es válido. Necesita ambas fechas en
+    formato ISO y no se combina con stream, modo ni fuente.
+    """
+    if incompatible:
+        return "El parámetro shard no se puede combinar con stream, modo ni fuente."
+    if not (fecha_inicio and fecha_fin):
+        return "El parámetro shard necesita fecha_inicio y fecha_fin."
+    try:
+        dias_fragmento(shard)
+    except ValueError:
+        return "El parámetro shard debe ser 'dia', 'semana', 'mes' o un número de días."
+    try:
+        normalizar_fecha(fecha_inicio)
+        normalizar_fecha(fecha_fin)
+    except ValueError:
+        return "Las fechas deben tener formato ISO (YYYY-MM-DD o YYYY-MM-DD HH:MM:SS)."
+    return None
+
+
+def parametro_lista(nombre):
+    valores = (valor.strip() for texto in request.args.getlist(nombre) for valor in texto.split(','))
+    return list(dict.fromkeys(valor for valor in valores if valor))
+
+# --------------------------------------------------------------------------------------------------------------------------------------------------------------------------------------------------------------------------------------------------------------------------------------------------------------
+
+# Exportaciones masivas: se crean con los mismos parámetros que los endpoints de datos (más tipo)
+@app.route('/api/exportaciones', methods=['POST'])
+def crear_exportacion():
+    try:
+        tipo = request.args.get('tipo', '').strip().lower()
+        ids = request.args.getlist('id', type=int)
+        fecha_inicio = request.args.get('fecha_inicio', '').strip()
+        fecha_fin = request.args.get('fecha_fin', '').strip()
+
+        if not ids:
+            return jsonify({"error": "Debes proporcionar al menos un ID."}), 400
+
+        logger.debug("Request to /api/exportaciones received with ids: %s, date range: %s - %s, tipo: %s", ids, fecha_inicio, fecha_fin, tipo)
+
+        try:
+            estado = exportaciones_manager.crear(tipo, ids, fecha_inicio=fecha_inicio, fecha_fin=fecha_fin)
+        except ValueError as e:
+            return jsonify({"error": str(e)}), 400
+        except RuntimeError as e:
+            return jsonify({"error": str(e)}), 429
+
+        return jsonify(estado_exportacion(estado)), 202
+
+    except Exception as e:
+        logger.error("Error al crear la exportación: %s", e)
+        return jsonify({"error": "Error al crear la exportación"}), 500
+
+
+@app.route('/api/exportaciones/<job_id>', methods=['GET'])
+def get_exportacion(job_id):
+    estado = exportaciones_manager.leer_estado(job_id)
+    if estado is None:
+        return jsonify({"error": "La exportación no existe."}), 404
+    return jsonify(estado_exportacion(estado)), 200
+
+
+@app.route('/api/exportaciones/<job_id>/reanudar', methods=['POST'])
+def reanudar_exportacion(job_id):
+    try:
+        estado = exportaciones_manager.reanudar(job_id)
+    except RuntimeError as e:
+        return jsonify({"error": str(e)}), 409
+    if estado is None:
+        return jsonify({"error": "La exportación no existe."}), 404
+    return jsonify(estado_exportacion(estado)), 202
+
+
+@app.route('/api/exportaciones/<job_id>/partes/<int:numero>', methods=['GET'])
+def descargar_parte_exportacion(job_id, numero):
+    # conditional=True responde ETag/304 y Range/206, así una descarga cortada se puede continuar
+    ruta = exportaciones_manager.ruta_parte(job_id, numero)
+    if ruta is None:
+        return jsonify({"error": "La parte solicitada no existe."}), 404
+    return send_file(
+        os.path.abspath(ruta), mimetype='application/gzip', as_attachment=True,
+        download_name=f"{job_id}_{os.path.basename(ruta)}", conditional=True
+    )
+
+
+def estado_exportacion(estado):
+    """
+    Estado de una exportación con la URL de su estado y de cada parte ya escrita.
+    """
+    job_id = estado['id']
+    return {
+        **estado,
+        'url_estado': url_for('get_exportacion', job_id=job_id),
+        'partes': [
+            {**parte, 'url': url_for('descargar_parte_exportacion', job_id=job_id, numero=parte['numero'])}
+            for parte in estado['partes']
+        ],
+    }
+
+# --------------------------------------------------------------------------------------------------------------------------------------------------------------------------------------------------------------------------------------------------------------------------------------------------------------
+
+# Histogramas por ruta y fase, sumados entre todos los workers (METRICAS_DIR), en formato de Prometheus
+@app.route('/metrics', methods=['GET'])
+def get_metrics():
+    return Response(registro_metricas.exponer(), mimetype='text/plain; version=0.0.4; charset=utf-8')
+
+# Estadísticas del pool de conexiones del worker que atiende la solicitud
+@app.route('/api/pool_stats', methods=['GET'])
+def get_pool_stats():
+    return jsonify(db_conn.pool.estadisticas()), 200
+
+# Estadísticas de los caches de plantillas, del cache de respuestas y de la coalescencia del worker
+@app.route('/api/cache_stats', methods=['GET'])
+def get_cache_stats():
+    return jsonify({
+        **estadisticas_caches(),
+        'respuestas': cache_respuestas.estadisticas(),
+        'coalescencia': coalescedor.estadisticas(),
+    }), 200
+
+# Uso del pool de procesamiento paralelo del worker
+@app.route('/api/paralelo_stats', methods=['GET'])
+def get_paralelo_stats():
+    return jsonify(estadisticas_paralelo()), 200
+
+# Filas guardadas y marcas de agua del almacén incremental
+@app.route('/api/almacen_stats', methods=['GET'])
+def get_almacen_stats():
+    return jsonify(almacen.estadisticas()), 200
+
+if __name__ == '__main__':
+    # Sin gunicorn no hay on_starting: se descartan los volcados de métricas de ejecuciones anteriores
+    limpiar_metricas()
+    app.run(debug=True, host=SERVER_IP, port=7001)
+
+
+
+
+
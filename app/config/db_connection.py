@@ -1,41 +1,298 @@
-import mysql.connector
-import os
-from utils.logger import logger
-
-class DatabaseConnection:
-    def __init__(self, host, user, password, database, ssl_ca=None):
-        self.host = host
-        self.user = user
-        self.password = password
-        self.database = database
-        self.ssl_ca = ssl_ca
-
-    def ejecutar_query(self, query, params=None):
-        try:
-            logger.info(f"Iniciando la conexión a la base de datos {self.database}")
-
-            # Intentar conectarse a la base de datos usando SSL si se proporciona
-            connection_params = {
-                "host": self.host,
-                "user": self.user,
-                "password": self.password,
-                "database": self.database
-            }
-
-            if self.ssl_ca:
-                connection_params["ssl_ca"] = self.ssl_ca
-
-            with mysql.connector.connect(**connection_params) as conn:
-                if conn.is_connected():
-                    logger.info(f"Conexión a la base de datos {self.database} exitosa")
-
-                with conn.cursor(dictionary=True) as cursor:
-                    logger.debug(f"Ejecutando la consulta: {query} con parámetros: {params}")
-                    cursor.execute(query, params)
-                    resultados = cursor.fetchall()
-                    logger.info("Consulta ejecutada correctamente")
-                    return resultados
-
-        except mysql.connector.Error as err:
-            logger.error(f"Error en la consulta a la base de datos: {err}")
-            return []
+import mysql.connector
+import os
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from utils.filas import filas_tupla
+from utils.logger import logger
+from utils.metricas import contar_filas_leidas, medir
+
+
+class ConexionAgrupada:
+    """
+    Conexión física del pool junto con los datos necesarios para reciclarla.
+    """
+    __slots__ = ('conn', 'creada', 'ultimo_uso')
+
+    def __init__(self, conn):
+        self.conn = conn
+        self.creada = time.monotonic()
+        self.ultimo_uso = self.creada
+
+
+class PoolConexiones:
+    """
+    Pool de conexiones MySQL de tamaño fijo por proceso (un pool por worker de gunicorn).
+    Las conexiones se crean bajo demanda hasta pool_size, se validan con ping cuando llevan
+    más de ping_interval segundos inactivas y se reciclan al superar max_lifetime.
+    """
+
+    def __init__(self, connection_params, pool_size=4, max_lifetime=1800, timeout=30, ping_interval=30):
+        self.connection_params = dict(connection_params)
+        # autocommit evita que una conexión reutilizada conserve el snapshot REPEATABLE READ
+        # de la consulta anterior y devuelva datos viejos.
+        self.connection_params.setdefault('autocommit', True)
+        self.pool_size = pool_size
+        self.max_lifetime = max_lifetime
+        self.timeout = timeout
+        self.ping_interval = ping_interval
+        self._reiniciar_estado()
+
+    def _reiniciar_estado(self):
+        self._pid = os.getpid()
+        self._condicion = threading.Condition()
+        self._inactivas = deque()
+        self._en_uso = 0
+        self._creadas = 0
+        self._recicladas = 0
+        self._descartadas = 0
+        self._prestamos = 0
+        self._esperas = 0
+        self._tiempo_espera_total = 0.0
+        self._tiempo_espera_max = 0.0
+
+    def _verificar_proceso(self):
+        # Tras un fork (gunicorn, multiprocessing) las conexiones heredadas comparten socket con
+        # el proceso padre: se abandonan sin cerrarlas y el hijo arranca con un pool vacío.
+        if self._pid != os.getpid():
+            self._reiniciar_estado()
+
+    def _crear_conexion(self):
+        logger.info("Abriendo nueva conexión del pool a la base de datos %s", self.connection_params.get('database'))
+        return ConexionAgrupada(mysql.connector.connect(**self.connection_params))
+
+    def _cerrar_conexion(self, agrupada):
+        try:
+            agrupada.conn.close()
+        except Exception as e:
+            logger.debug("Error al cerrar conexión del pool: %s", e)
+
+    def _es_valida(self, agrupada):
+        # Se llama fuera del lock (el ping es una ida y vuelta a MySQL); sólo los contadores lo toman
+        ahora = time.monotonic()
+        if ahora - agrupada.creada > self.max_lifetime:
+            with self._condicion:
+                self._recicladas += 1
+            return False
+        if ahora - agrupada.ultimo_uso > self.ping_interval:
+            try:
+                agrupada.conn.ping(reconnect=False)
+            except mysql.connector.Error as err:
+                logger.warning("Conexión del pool descartada por fallo de ping: %s", err)
+                with self._condicion:
+                    self._descartadas += 1
+                return False
+        return True
+
+    def obtener(self, timeout=None):
+        """
+        Presta una conexión del pool. Espera hasta `timeout` segundos (por omisión el del pool) si
+        todas están en uso y después lanza PoolError.
+        """
+        self._verificar_proceso()
+        timeout = self.timeout if timeout is None else timeout
+        inicio = time.monotonic()
+        espero = False
+        with self._condicion:
+            while True:
+                if self._inactivas:
+                    agrupada = self._inactivas.pop()
+                    break
+                if self._en_uso < self.pool_size:
+                    agrupada = None
+                    break
+                restante = timeout - (time.monotonic() - inicio)
+                if restante <= 0:
+                    raise mysql.connector.errors.PoolError(
+                        f"No hay conexiones disponibles en el pool tras {timeout}s de espera"
+                    )
+                espero = True
+                self._condicion.wait(restante)
+            self._en_uso += 1
+            self._prestamos += 1
+            if espero:
+                espera = time.monotonic() - inicio
+                self._esperas += 1
+                self._tiempo_espera_total += espera
+                self._tiempo_espera_max = max(self._tiempo_espera_max, espera)
+
+        # La validación y la apertura se hacen fuera del lock para no bloquear a otros hilos.
+        try:
+            if agrupada is not None and not self._es_valida(agrupada):
+                self._cerrar_conexion(agrupada)
+                agrupada = None
+            if agrupada is None:
+                agrupada = self._crear_conexion()
+                with self._condicion:
+                    self._creadas += 1
+        except Exception:
+            with self._condicion:
+                self._en_uso -= 1
+                self._condicion.notify()
+            raise
+        return agrupada
+
+    def devolver(self, agrupada, descartar=False):
+        """
+        Devuelve una conexión al pool. Con descartar=True se cierra en lugar de volver al pool.
+        """
+        if self._pid != os.getpid():
+            return
+        if descartar:
+            self._cerrar_conexion(agrupada)
+        else:
+            agrupada.ultimo_uso = time.monotonic()
+        with self._condicion:
+            self._en_uso -= 1
+            if descartar:
+                self._descartadas += 1
+            else:
+                self._inactivas.append(agrupada)
+            self._condicion.notify()
+
+    @contextmanager
+    def conexion(self, timeout=None):
+        with medir('connect'):
+            agrupada = self.obtener(timeout)
+        descartar = False
+        try:
+            yield agrupada.conn
+        except mysql.connector.Error:
+            descartar = not agrupada.conn.is_connected()
+            raise
+        except BaseException:
+            # Un error a mitad de una lectura deja resultados pendientes en el socket.
+            descartar = True
+            raise
+        finally:
+            self.devolver(agrupada, descartar=descartar)
+
+    def precalentar(self, cantidad=1):
+        """
+        Abre hasta `cantidad` conexiones por adelantado (se usa al arrancar cada worker).
+        """
+        self._verificar_proceso()
+        agrupadas = []
+        try:
+            for _ in range(min(cantidad, self.pool_size)):
+                agrupadas.append(self.obtener())
+        finally:
+            for agrupada in agrupadas:
+                self.devolver(agrupada)
+
+    def cerrar(self):
+        with self._condicion:
+            while self._inactivas:
+                self._cerrar_conexion(self._inactivas.pop())
+
+    def estadisticas(self):
+        self._verificar_proceso()
+        with self._condicion:
+            return {
+                'pid': self._pid,
+                'pool_size': self.pool_size,
+                'en_uso': self._en_uso,
+                'inactivas': len(self._inactivas),
+                'creadas': self._creadas,
+                'recicladas': self._recicladas,
+                'descartadas': self._descartadas,
+                'prestamos': self._prestamos,
+                'esperas': self._esperas,
+                'tiempo_espera_total_s': round(self._tiempo_espera_total, 6),
+                'tiempo_espera_max_s': round(self._tiempo_espera_max, 6),
+            }
+
+
+class DatabaseConnection:
+    def __init__(self, host, user, password, database, ssl_ca=None, pool_size=4, max_lifetime=1800,
+                 pool_timeout=30, ping_interval=30, use_pure=False):
+        self.host = host
+        self.user = user
+        self.password = password
+        self.database = database
+        self.ssl_ca = ssl_ca
+
+        connection_params = {
+            "host": self.host,
+            "user": self.user,
+            "password": self.password,
+            "database": self.database
+        }
+
+        if self.ssl_ca:
+            connection_params["ssl_ca"] = self.ssl_ca
+
+        # Driver de Python puro: necesario con workers gevent (ver DB_USE_PURE en settings.py)
+        if use_pure:
+            connection_params["use_pure"] = True
+
+        self.pool = PoolConexiones(
+            connection_params,
+            pool_size=pool_size,
+            max_lifetime=max_lifetime,
+            timeout=pool_timeout,
+            ping_interval=ping_interval,
+        )
+
+    def ejecutar_query(self, query, params=None, como_tuplas=False):
+        """
+        Devuelve las filas como dicts o, con como_tuplas=True, como FilaTupla (tuplas de un cursor
+        normal con un índice de columnas compartido), que ocupan bastante menos memoria.
+        Ante un error de la consulta devuelve una lista vacía; si no se obtiene una conexión libre
+        del pool lanza PoolError, para que la ruta responda 503 en lugar de datos vacíos.
+        """
+        try:
+            with self.pool.conexion() as conn:
+                with conn.cursor(dictionary=not como_tuplas) as cursor:
+                    logger.debug("Ejecutando la consulta: %s con parámetros: %s", query, params)
+                    with medir('execute'):
+                        cursor.execute(query, params)
+                    with medir('fetch'):
+                        resultados = cursor.fetchall()
+                        if como_tuplas:
+                            resultados = filas_tupla(cursor.column_names, resultados)
+                    contar_filas_leidas(len(resultados))
+                    logger.debug("Consulta ejecutada correctamente")
+                    return resultados
+
+        except mysql.connector.errors.PoolError as err:
+            logger.warning("Sin conexión disponible para la consulta: %s", err)
+            raise
+        except mysql.connector.Error as err:
+            logger.error("Error en la consulta a la base de datos: %s", err)
+            return []
+
+    def ejecutar_query_stream(self, query, params=None, tam_lote=1000, como_tuplas=False, pool_timeout=None):
+        """
+        Ejecuta la consulta con un cursor sin buffer y entrega las filas en lotes de `tam_lote`
+        (fetchmany), de modo que nunca se materializa el resultado completo en memoria.
+        La conexión queda prestada hasta que el generador termina o se cierra; si se abandona
+        a mitad de lectura, la conexión se descarta en lugar de volver al pool.
+        Con como_tuplas=True los lotes son de FilaTupla, igual que en ejecutar_query.
+        `pool_timeout` limita la espera por una conexión libre (por omisión la del pool).
+        """
+        with self.pool.conexion(pool_timeout) as conn:
+            cursor = conn.cursor(dictionary=not como_tuplas, buffered=False)
+            try:
+                logger.debug("Ejecutando la consulta en modo stream: %s con parámetros: %s", query, params)
+                with medir('execute'):
+                    cursor.execute(query, params)
+                while True:
+                    with medir('fetch'):
+                        filas = cursor.fetchmany(tam_lote)
+                    if not filas:
+                        break
+                    if como_tuplas:
+                        filas = filas_tupla(cursor.column_names, filas)
+                    contar_filas_leidas(len(filas))
+                    yield filas
+                logger.debug("Consulta en modo stream ejecutada correctamente")
+            except mysql.connector.Error as err:
+                logger.error("Error en la consulta a la base de datos (stream): %s", err)
+                raise
+            finally:
+                try:
+                    cursor.close()
+                except Exception as e:
+                    logger.debug("Error al cerrar el cursor sin buffer: %s", e)
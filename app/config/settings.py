@@ -1,16 +1,103 @@
-import os
-from dotenv import load_dotenv
-
-# Load environment variables from .env file
-load_dotenv()
-
-# Database configuration
-HOST = os.getenv('DB_HOST')
-USER = os.getenv('DB_USER')
-PASSWORD = os.getenv('DB_PASSWORD')
-DATABASE = os.getenv('DB_NAME')
-SSL_CA = os.getenv('DB_SSL_CA')  # Añadir la variable para el certificado SSL
-
-# Server configuration
-SERVER_IP = os.getenv('SERVER_IP', '0.0.0.0')
-
+import os
+from dotenv import load_dotenv
+
+# Load environment variables from .env file
+load_dotenv()
+
+# Database configuration
+HOST = os.getenv('DB_HOST')
+USER = os.getenv('DB_USER')
+PASSWORD = os.getenv('DB_PASSWORD')
+DATABASE = os.getenv('DB_NAME')
+SSL_CA = os.getenv('DB_SSL_CA')  # Añadir la variable para el certificado SSL
+
+# Server configuration
+SERVER_IP = os.getenv('SERVER_IP', '0.0.0.0')
+
+# Nivel de log (DEBUG, INFO, WARNING, ERROR). En DEBUG se registran cada consulta SQL y cada request
+# con sus parámetros (las líneas que usa benchmarks/reproducir_trafico.py); en producción INFO evita
+# formatearlas y escribirlas. Un valor desconocido se advierte en el log y se usa DEBUG.
+LOG_LEVEL = os.getenv('LOG_LEVEL', '').strip().upper() or 'DEBUG'
+
+# Workers de gunicorn (gunicorn.conf.py). GUNICORN_WORKER_CLASS: 'sync' (un request por worker),
+# 'gthread' (GUNICORN_THREADS hilos por worker) o 'gevent' (hasta GUNICORN_WORKER_CONNECTIONS
+# requests cooperativos por worker). Con gthread y gevent un worker que espera a MySQL sigue
+# atendiendo otros requests; conviene subir DB_POOL_SIZE para que no esperen todos por una conexión.
+GUNICORN_WORKER_CLASS = os.getenv('GUNICORN_WORKER_CLASS', 'sync')
+GUNICORN_WORKERS = int(os.getenv('GUNICORN_WORKERS', '5'))
+GUNICORN_THREADS = int(os.getenv('GUNICORN_THREADS', '8'))
+GUNICORN_WORKER_CONNECTIONS = int(os.getenv('GUNICORN_WORKER_CONNECTIONS', '100'))
+GUNICORN_TIMEOUT = int(os.getenv('GUNICORN_TIMEOUT', '300'))
+
+# En modo cooperativo (gevent) todo el worker corre en un solo hilo: el driver de MySQL debe ser el
+# de Python puro, cuyos sockets parchea gevent (la extensión en C bloquearía el worker completo), y
+# las páginas se procesan en bloques de COOPERATIVO_TAM_BLOQUE filas cediendo el control entre
+# bloques (utils/procesamiento_paralelo.py) para no frenar a los demás requests.
+MODO_COOPERATIVO = GUNICORN_WORKER_CLASS == 'gevent'
+DB_USE_PURE = os.getenv('DB_USE_PURE', '1' if MODO_COOPERATIVO else '0') == '1'
+COOPERATIVO_TAM_BLOQUE = int(os.getenv('COOPERATIVO_TAM_BLOQUE', '100'))
+
+
+# Connection pool configuration (one pool per gunicorn worker)
+DB_POOL_SIZE = int(os.getenv('DB_POOL_SIZE', '4'))
+DB_POOL_MAX_LIFETIME = int(os.getenv('DB_POOL_MAX_LIFETIME', '1800'))  # segundos antes de reciclar una conexión
+DB_POOL_TIMEOUT = int(os.getenv('DB_POOL_TIMEOUT', '30'))  # segundos de espera por una conexión libre
+DB_POOL_PING_INTERVAL = int(os.getenv('DB_POOL_PING_INTERVAL', '30'))  # inactividad tras la cual se valida con ping
+
+# Streaming responses: filas leídas por fetchmany y procesadas en cada lote
+STREAM_TAM_LOTE = int(os.getenv('STREAM_TAM_LOTE', '1000'))
+
+# Parámetro since (deltas por saex_id): saex_id anteriores a la marca de agua que se vuelven a
+# leer en cada consulta, para entregar las filas que se confirmaron después que otras de saex_id mayor
+DELTA_VENTANA_IDS = int(os.getenv('DELTA_VENTANA_IDS', '200'))
+
+# Memoización de plantillas (retroPrompt y fragmentos de cierre): entradas máximas por cache
+CACHE_PLANTILLAS_MAX_ENTRADAS = int(os.getenv('CACHE_PLANTILLAS_MAX_ENTRADAS', '20000'))
+
+
+# Almacén incremental de filas procesadas (SQLite compartido por los workers)
+ALMACEN_RUTA = os.getenv('ALMACEN_RUTA', 'data/almacen_incremental.sqlite3')
+ALMACEN_TAM_LOTE = int(os.getenv('ALMACEN_TAM_LOTE', '5000'))  # filas leídas de MySQL por lote de sincronización
+ALMACEN_MAX_LOTES = int(os.getenv('ALMACEN_MAX_LOTES', '4'))  # lotes por solicitud; mientras tanto se lee de MySQL
+ALMACEN_VENTANA_IDS = int(os.getenv('ALMACEN_VENTANA_IDS', '200'))  # saex_id bajo la marca que se revisan
+
+# Cache de respuestas en disco compartido por los workers; CACHE_RESPUESTAS_TTL=0 lo desactiva
+CACHE_RESPUESTAS_DIR = os.getenv('CACHE_RESPUESTAS_DIR', 'data/cache_respuestas')
+CACHE_RESPUESTAS_TTL = int(os.getenv('CACHE_RESPUESTAS_TTL', '300'))  # segundos
+CACHE_RESPUESTAS_MAX_BYTES = int(os.getenv('CACHE_RESPUESTAS_MAX_BYTES', str(512 * 1024 * 1024)))
+
+# Procesamiento paralelo de páginas grandes (pool de procesos por worker); PARALELO_PROCESOS=0 lo desactiva.
+# No se usa con workers gevent
+PARALELO_PROCESOS = int(os.getenv('PARALELO_PROCESOS', '0'))
+PARALELO_UMBRAL_FILAS = int(os.getenv('PARALELO_UMBRAL_FILAS', '5000'))  # filas mínimas de una página para usar el pool
+PARALELO_TAM_BLOQUE = int(os.getenv('PARALELO_TAM_BLOQUE', '2000'))  # filas enviadas a cada proceso por tarea
+
+# Métricas de /metrics (utils/metricas.py): cada worker vuelca las suyas en METRICAS_DIR y /metrics
+# suma las de todos. Vacío: cada /metrics expone sólo el worker que lo atiende
+METRICAS_DIR = os.getenv('METRICAS_DIR', 'data/metricas')
+
+# Coalescencia de solicitudes idénticas en curso (utils/coalescencia.py). Dentro del worker sólo
+# actúa con workers gthread o gevent: un worker sync (el de omisión) atiende una solicitud a la vez.
+# Entre workers usa un candado flock por clave en COALESCENCIA_DIR y el cache de respuestas, así
+# que sólo se activa si CACHE_RESPUESTAS_TTL > 0. Quien encuentra la clave en curso en otro worker
+# espera a lo sumo COALESCENCIA_ESPERA_MAXIMA segundos y después calcula él mismo la respuesta.
+COALESCENCIA_ENTRE_WORKERS = os.getenv('COALESCENCIA_ENTRE_WORKERS', '1') == '1'
+COALESCENCIA_DIR = os.getenv('COALESCENCIA_DIR', 'data/coalescencia')
+COALESCENCIA_ESPERA_MAXIMA = int(os.getenv('COALESCENCIA_ESPERA_MAXIMA', '10'))  # segundos
+
+# Exportaciones masivas en segundo plano (partes NDJSON comprimidas con gzip)
+EXPORTACIONES_DIR = os.getenv('EXPORTACIONES_DIR', 'data/exportaciones')
+EXPORTACIONES_FILAS_POR_PARTE = int(os.getenv('EXPORTACIONES_FILAS_POR_PARTE', '20000'))
+EXPORTACIONES_MAX_ACTIVAS = int(os.getenv('EXPORTACIONES_MAX_ACTIVAS', '2'))  # exportaciones simultáneas
+EXPORTACIONES_LATIDO = int(os.getenv('EXPORTACIONES_LATIDO', '30'))  # segundos entre renovaciones del estado en curso
+
+# Compresión gzip/deflate negociada con Accept-Encoding (1 = más rápida, 9 = más pequeña). Con
+# páginas de 10000 filas el nivel 1 deja el JSON en ~18% y tarda ~4 veces menos que el 6 (bench_formatos.py)
+COMPRESION_NIVEL = int(os.getenv('COMPRESION_NIVEL', '1'))
+
+# Lectura fragmentada de rangos de fechas (parámetro shard): fragmentos consultados a la vez por
+# solicitud, cada uno con su propia conexión del pool. Se limita a DB_POOL_SIZE - 1 para que siempre
+# quede una conexión para las demás solicitudes del worker. Un fragmento que no obtiene conexión en
+# FRAGMENTOS_ESPERA_CONEXION segundos falla (y con él la página) en lugar de seguir esperando
+FRAGMENTOS_CONCURRENCIA = max(1, min(int(os.getenv('FRAGMENTOS_CONCURRENCIA', '3')), DB_POOL_SIZE - 1))
+FRAGMENTOS_ESPERA_CONEXION = int(os.getenv('FRAGMENTOS_ESPERA_CONEXION', '5'))  # segundos
@@ -0,0 +1,66 @@
+# gunicorn.conf.py
+# Configuración de los workers (desde las variables GUNICORN_* de config/settings.py) y hooks de
+# gunicorn para inicializar recursos una sola vez por worker.
+
+from config.settings import (
+    GUNICORN_WORKER_CLASS, GUNICORN_WORKERS, GUNICORN_THREADS, GUNICORN_WORKER_CONNECTIONS, GUNICORN_TIMEOUT
+)
+from utils.logger import logger
+
+worker_class = GUNICORN_WORKER_CLASS
+workers = GUNICORN_WORKERS
+# Con threads > 1 gunicorn cambia los workers sync por gthread: los hilos sólo se piden para gthread
+threads = GUNICORN_THREADS if worker_class == 'gthread' else 1
+worker_connections = GUNICORN_WORKER_CONNECTIONS
+timeout = GUNICORN_TIMEOUT
+
+
+def on_starting(server):
+    from utils.metricas import limpiar_metricas
+
+    # Los volcados de métricas de una ejecución anterior no corresponden a ningún worker nuevo
+    limpiar_metricas()
+
+
+def post_worker_init(worker):
+    from app import db_conn
+    from config.settings import (
+        COOPERATIVO_TAM_BLOQUE, MODO_COOPERATIVO, PARALELO_PROCESOS, PARALELO_UMBRAL_FILAS, PARALELO_TAM_BLOQUE
+    )
+    from utils.procesamiento_paralelo import activar_modo_cooperativo, iniciar_pool
+
+    if MODO_COOPERATIVO:
+        # El pool de procesos no es compatible con gevent (ver utils/procesamiento_paralelo.py)
+        if PARALELO_PROCESOS > 0:
+            logger.warning("PARALELO_PROCESOS se ignora con workers gevent (worker %s)", worker.pid)
+        activar_modo_cooperativo(tam_bloque=COOPERATIVO_TAM_BLOQUE)
+    else:
+        # El pool de procesos se crea antes de abrir conexiones para que los hijos no hereden sockets
+        try:
+            iniciar_pool(PARALELO_PROCESOS, umbral_filas=PARALELO_UMBRAL_FILAS, tam_bloque=PARALELO_TAM_BLOQUE)
+        except Exception as e:
+            logger.error("No se pudo iniciar el pool de procesamiento paralelo en el worker %s: %s", worker.pid, e)
+
+    # La app ya está importada en el worker: abrir una conexión del pool para que la primera
+    # solicitud no pague el handshake (TLS incluido) con MySQL.
+    try:
+        db_conn.pool.precalentar()
+        logger.info("Pool de conexiones inicializado en el worker %s", worker.pid)
+    except Exception as e:
+        logger.error("No se pudo precalentar el pool de conexiones en el worker %s: %s", worker.pid, e)
+
+
+def worker_exit(server, worker):
+    from utils.procesamiento_paralelo import cerrar_pool
+
+    cerrar_pool()
+
+
+def child_exit(server, worker):
+    from utils.metricas import plegar_metricas_proceso
+
+    # En el master: las métricas del worker terminado (o muerto por timeout) pasan a terminados.json
+    try:
+        plegar_metricas_proceso(worker.pid)
+    except OSError as e:
+        logger.error("No se pudieron conservar las métricas del worker %s: %s", worker.pid, e)
@@ -0,0 +1,158 @@
+import json
+from datetime import date, datetime
+from decimal import Decimal
+from models.sale_exercises_query import (
+    DIMENSIONES_AGREGADOS, METRICAS_SQL_AGREGADOS, construir_query_agregados, construir_query_blobs_agregados
+)
+from utils.cache_plantillas import analizar_retro_prompt
+from utils.logger import registrar_error_fila
+from utils.metricas import medir
+
+# Métricas que dependen de saex_retroContents y se calculan en una pasada en streaming
+METRICAS_BLOB_AGREGADOS = ('puntos_por_pregunta', 'tasa_info_correcta')
+
+METRICAS_AGREGADOS = tuple(METRICAS_SQL_AGREGADOS) + METRICAS_BLOB_AGREGADOS
+
+
+class AcumuladorPreguntas:
+    """
+    Acumula por número de pregunta la suma de puntos y los veredictos de Info_Correcta de un grupo.
+    """
+    __slots__ = ('puntos', 'veredictos')
+
+    def __init__(self):
+        self.puntos = {}
+        self.veredictos = {}
+
+    def agregar_puntos(self, pregunta, puntos):
+        suma, cantidad = self.puntos.get(pregunta, (0.0, 0))
+        self.puntos[pregunta] = (suma + puntos, cantidad + 1)
+
+    def agregar_veredicto(self, pregunta, veredicto):
+        si, total = self.veredictos.get(pregunta, (0, 0))
+        self.veredictos[pregunta] = (si + (veredicto == 'si'), total + 1)
+
+    def puntos_por_pregunta(self):
+        return {p: round(suma / cantidad, 4) for p, (suma, cantidad) in sorted(self.puntos.items(), key=_orden_pregunta)}
+
+    def tasa_info_correcta(self):
+        return {p: round(si / total, 4) for p, (si, total) in sorted(self.veredictos.items(), key=_orden_pregunta)}
+
+
+class AgregadosManager:
+    """
+    KPIs agrupados sobre sale_exercises con los mismos filtros que los demás endpoints. Las
+    métricas simples se calculan en MySQL con GROUP BY; las que dependen de saex_retroContents se
+    calculan en una sola lectura en streaming que sólo conserva un acumulador por grupo.
+    """
+
+    def __init__(self, db_conn, tam_lote=1000):
+        self.db_conn = db_conn
+        self.tam_lote = tam_lote
+
+    def validar(self, dimensiones, metricas):
+        """
+        Lanza ValueError si alguna dimensión o métrica no existe.
+        """
+        desconocidas = [d for d in dimensiones if d not in DIMENSIONES_AGREGADOS]
+        if desconocidas:
+            raise ValueError(f"Dimensiones no válidas: {', '.join(desconocidas)}. "
+                             f"Disponibles: {', '.join(DIMENSIONES_AGREGADOS)}")
+        desconocidas = [m for m in metricas if m not in METRICAS_AGREGADOS]
+        if desconocidas:
+            raise ValueError(f"Métricas no válidas: {', '.join(desconocidas)}. "
+                             f"Disponibles: {', '.join(METRICAS_AGREGADOS)}")
+
+    def get_agregados(self, ids, dimensiones, metricas, fecha_inicio=None, fecha_fin=None):
+        self.validar(dimensiones, metricas)
+        metricas_sql = [m for m in metricas if m in METRICAS_SQL_AGREGADOS]
+        metricas_blob = [m for m in metricas if m in METRICAS_BLOB_AGREGADOS]
+        grupos = {}
+
+        if metricas_sql:
+            query, query_params = construir_query_agregados(
+                ids, dimensiones, metricas_sql, fecha_inicio=fecha_inicio, fecha_fin=fecha_fin
+            )
+            for fila in self.db_conn.ejecutar_query(query, query_params):
+                clave = tuple(valor_json(fila[d]) for d in dimensiones)
+                grupo = grupos.setdefault(clave, {})
+                for metrica in metricas_sql:
+                    grupo[metrica] = valor_json(fila[metrica])
+
+        if metricas_blob:
+            for clave, acumulador in self.acumular_blobs(ids, dimensiones, fecha_inicio, fecha_fin).items():
+                grupo = grupos.setdefault(clave, {})
+                for metrica in metricas_blob:
+                    grupo[metrica] = getattr(acumulador, metrica)()
+
+        resultado = []
+        for clave in sorted(grupos, key=_orden_clave):
+            grupo = dict(zip(dimensiones, clave))
+            grupo.update(grupos[clave])
+            resultado.append(grupo)
+        return resultado
+
+    def acumular_blobs(self, ids, dimensiones, fecha_inicio=None, fecha_fin=None):
+        query, query_params = construir_query_blobs_agregados(
+            ids, dimensiones, fecha_inicio=fecha_inicio, fecha_fin=fecha_fin
+        )
+        acumuladores = {}
+
+        for lote in self.db_conn.ejecutar_query_stream(query, query_params, tam_lote=self.tam_lote):
+            with medir('procesar'):
+                for fila in lote:
+                    clave = tuple(valor_dimension(d, fila) for d in dimensiones)
+                    acumulador = acumuladores.get(clave)
+                    if acumulador is None:
+                        acumulador = acumuladores[clave] = AcumuladorPreguntas()
+
+                    retro_contents_str = fila.get('saex_retroContents')
+                    if not retro_contents_str:
+                        continue
+                    try:
+                        retro_contents = json.loads(retro_contents_str)
+                    except json.JSONDecodeError as e:
+                        # Se resume con los demás errores por fila de la solicitud
+                        registrar_error_fila('saex_retroContents', e)
+                        continue
+                    if not isinstance(retro_contents, dict):
+                        continue
+
+                    for pregunta, contenido in retro_contents.items():
+                        # Mismo criterio que RolPlaySimExtractor: sólo cuentan las preguntas con retroPrompt
+                        if not pregunta.isdigit() or not isinstance(contenido, dict) or not contenido.get('retroPrompt'):
+                            continue
+                        veredicto = analizar_retro_prompt(contenido['retroPrompt']).info_correcta
+                        if veredicto in ('si', 'no'):
+                            acumulador.agregar_veredicto(pregunta, veredicto)
+                        try:
+                            acumulador.agregar_puntos(pregunta, float(contenido.get('puntos')))
+                        except (TypeError, ValueError):
+                            pass
+
+        return acumuladores
+
+
+def valor_json(valor):
+    if isinstance(valor, (datetime, date)):
+        return valor.isoformat()
+    if isinstance(valor, Decimal):
+        return float(round(valor, 4))
+    return valor
+
+
+def valor_dimension(dimension, fila):
+    # Equivalente en Python de la expresión SQL de cada dimensión
+    valor = fila.get(DIMENSIONES_AGREGADOS[dimension][1])
+    if dimension == 'dia' and isinstance(valor, datetime):
+        return valor.date().isoformat()
+    return valor_json(valor)
+
+
+def _orden_pregunta(elemento):
+    return int(elemento[0])
+
+
+def _orden_clave(clave):
+    # Los None (sin fecha, sin actividad) van al final sin comparar tipos distintos
+    return tuple((valor is None, valor if valor is not None else '') for valor in clave)
@@ -0,0 +1,294 @@
+import json
+import os
+import sqlite3
+import threading
+from datetime import date, datetime
+from models.sale_exercises_query import (
+    construir_query_ids_incremental, construir_query_incremental, construir_query_por_ids
+)
+from utils.logger import logger
+
+# Almacén local (SQLite) con la salida ya procesada de cada ejercicio, indexada por saex_id.
+# Cada modelo guarda por caso de uso una marca de agua con el último saex_id procesado: en cada
+# sincronización sólo se leen de MySQL y se procesan los ejercicios posteriores a la marca, y las
+# consultas por rango de fechas se resuelven con el índice local. Supone, como el resto del
+# dashboard, que un ejercicio no cambia después de registrarse.
+#
+# - Un saex_id se asigna al insertar y no al confirmar: un ejercicio de saex_id menor que la marca
+#   puede hacerse visible después. Cada sincronización compara los saex_id de los `ventana` ids
+#   anteriores a la marca (sólo enteros) con los guardados y procesa los que falten.
+# - Cada sincronización lee a lo sumo max_lotes lotes: un almacén vacío se llena a lo largo de
+#   varias solicitudes en lugar de procesar todo el histórico dentro de una. Mientras no esté al
+#   día, quien llama sirve la página desde MySQL.
+# - Las filas se guardan como JSON con la versión del modelo que las produjo (parámetro version de
+#   sincronizar). Si el modelo cambia su salida y sube su versión, los casos de uso guardados con
+#   otra versión se borran y se vuelven a sincronizar. Un archivo con otro formato de almacén
+#   (_VERSION_FORMATO, en PRAGMA user_version) se vacía completo al abrirlo.
+
+_VERSION_FORMATO = 2
+
+_ESQUEMA = (
+    """
+    CREATE TABLE IF NOT EXISTS filas_procesadas (
+        modelo TEXT NOT NULL,
+        saex_id INTEGER NOT NULL,
+        use_case INTEGER NOT NULL,
+        fecha TEXT,
+        datos TEXT NOT NULL,
+        PRIMARY KEY (modelo, saex_id)
+    )
+    """,
+    """
+    CREATE INDEX IF NOT EXISTS idx_filas_procesadas_rango
+        ON filas_procesadas (modelo, use_case, fecha, saex_id)
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS marcas_agua (
+        modelo TEXT NOT NULL,
+        use_case INTEGER NOT NULL,
+        ultimo_id INTEGER NOT NULL,
+        ultima_fecha TEXT,
+        version INTEGER NOT NULL,
+        actualizado TEXT NOT NULL,
+        PRIMARY KEY (modelo, use_case)
+    )
+    """,
+)
+
+
+def _valor_json(valor):
+    # Las filas crudas de MySQL pueden traer fechas; cualquier otro valor se guarda como texto
+    if isinstance(valor, (datetime, date)):
+        return valor.isoformat()
+    return str(valor)
+
+
+def normalizar_fecha(valor):
+    """
+    Lleva una fecha (datetime o texto ISO) al formato 'YYYY-MM-DD HH:MM:SS' con el que se guarda
+    en el almacén, de modo que las comparaciones de texto en SQLite equivalgan al BETWEEN de MySQL
+    ('2025-01-31' equivale a '2025-01-31 00:00:00'). Lanza ValueError si el texto no es una fecha.
+    """
+    if valor is None or valor == '':
+        return None
+    if not isinstance(valor, datetime):
+        valor = datetime.fromisoformat(str(valor).strip())
+    return valor.isoformat(sep=' ')
+
+
+class AlmacenIncremental:
+    """
+    Almacén de filas procesadas compartido por todos los workers (un archivo SQLite en modo WAL).
+    Cada hilo abre su propia conexión y, tras un fork, el proceso hijo abre conexiones nuevas.
+    """
+
+    def __init__(self, ruta, tam_lote=5000, max_lotes=4, ventana=200):
+        self.ruta = ruta
+        self.tam_lote = tam_lote
+        self.max_lotes = max_lotes
+        self.ventana = ventana
+        self._local = threading.local()
+        self._pid = None
+        self._esquema_creado = False
+        self._lock = threading.Lock()
+
+    def _conexion(self):
+        if self._pid != os.getpid():
+            # Las conexiones heredadas del proceso padre no se reutilizan
+            self._local = threading.local()
+            self._pid = os.getpid()
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            directorio = os.path.dirname(self.ruta)
+            if directorio:
+                os.makedirs(directorio, exist_ok=True)
+            conn = sqlite3.connect(self.ruta, timeout=30, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            with self._lock:
+                if not self._esquema_creado:
+                    self._crear_esquema(conn)
+                    self._esquema_creado = True
+            self._local.conn = conn
+        return conn
+
+    @staticmethod
+    def _crear_esquema(conn):
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            version = conn.execute("PRAGMA user_version").fetchone()[0]
+            if version != _VERSION_FORMATO:
+                # Archivo nuevo o de otro formato (las versiones anteriores guardaban pickle)
+                conn.execute("DROP TABLE IF EXISTS filas_procesadas")
+                conn.execute("DROP TABLE IF EXISTS marcas_agua")
+                conn.execute(f"PRAGMA user_version = {_VERSION_FORMATO}")
+            for sentencia in _ESQUEMA:
+                conn.execute(sentencia)
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+
+    def marca_agua(self, modelo, use_case, version):
+        """
+        Último saex_id sincronizado del caso de uso. Si se guardó con otra versión del modelo,
+        borra sus filas y devuelve 0 para que se vuelva a sincronizar.
+        """
+        conn = self._conexion()
+        fila = conn.execute(
+            "SELECT ultimo_id, version FROM marcas_agua WHERE modelo = ? AND use_case = ?", (modelo, use_case)
+        ).fetchone()
+        if fila is None:
+            return 0
+        if fila[1] == version:
+            return fila[0]
+
+        logger.info("Almacén incremental (%s): caso de uso %s guardado con la versión %s; se reconstruye con la %s",
+                    modelo, use_case, fila[1], version)
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            conn.execute("DELETE FROM filas_procesadas WHERE modelo = ? AND use_case = ?", (modelo, use_case))
+            conn.execute("DELETE FROM marcas_agua WHERE modelo = ? AND use_case = ?", (modelo, use_case))
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        return 0
+
+    def sincronizar(self, modelo, ids, db_conn, procesar, version=1):
+        """
+        Procesa y guarda los ejercicios nuevos de cada caso de uso en `ids`, a lo sumo
+        self.max_lotes lotes de self.tam_lote filas entre todos los casos de uso (0: sin límite).
+        `procesar(filas_crudas)` debe devolver la lista de resultados (valores serializables como
+        JSON) en el mismo orden. Devuelve True si todos los casos de uso quedaron al día y False si
+        se agotaron los lotes; lo sincronizado se conserva y la siguiente llamada continúa.
+        """
+        nuevas = 0
+        lotes = 0
+        al_dia = True
+        for use_case in ids:
+            ultimo_id = self.marca_agua(modelo, use_case, version)
+            if ultimo_id and self.ventana:
+                nuevas += self._recuperar_tardias(modelo, use_case, ultimo_id, db_conn, procesar, version)
+            while True:
+                if self.max_lotes and lotes >= self.max_lotes:
+                    al_dia = False
+                    break
+                query, query_params = construir_query_incremental(use_case, ultimo_id, self.tam_lote)
+                filas_crudas = db_conn.ejecutar_query(query, query_params)
+                if not filas_crudas:
+                    break
+                # Sólo cuentan los lotes con filas: los casos de uso ya al día no gastan el límite
+                lotes += 1
+
+                self._procesar_y_guardar(modelo, use_case, filas_crudas, procesar, version)
+                ultimo_id = filas_crudas[-1]['saex_id']
+                nuevas += len(filas_crudas)
+                if len(filas_crudas) < self.tam_lote:
+                    break
+            if not al_dia:
+                break
+
+        if nuevas:
+            logger.info("Almacén incremental (%s): %s filas nuevas sincronizadas", modelo, nuevas)
+        if not al_dia:
+            logger.info("Almacén incremental (%s): sincronización parcial (%s lotes); continúa en la siguiente solicitud",
+                        modelo, lotes)
+        return al_dia
+
+    def _recuperar_tardias(self, modelo, use_case, ultimo_id, db_conn, procesar, version):
+        """
+        Procesa los ejercicios de la ventana anterior a la marca que no están guardados (los que se
+        confirmaron después de que la marca los pasara). Devuelve cuántos se agregaron.
+        """
+        desde_id = max(ultimo_id - self.ventana, 0)
+        query, query_params = construir_query_ids_incremental(use_case, desde_id, ultimo_id)
+        en_mysql = {fila['saex_id'] for fila in db_conn.ejecutar_query(query, query_params)}
+        if not en_mysql:
+            return 0
+        guardados = {fila[0] for fila in self._conexion().execute(
+            "SELECT saex_id FROM filas_procesadas WHERE modelo = ? AND use_case = ? AND saex_id > ? AND saex_id <= ?",
+            (modelo, use_case, desde_id, ultimo_id),
+        )}
+        faltantes = sorted(en_mysql - guardados)
+        if not faltantes:
+            return 0
+
+        query, query_params = construir_query_por_ids(faltantes)
+        filas_crudas = db_conn.ejecutar_query(query, query_params)
+        if filas_crudas:
+            self._procesar_y_guardar(modelo, use_case, filas_crudas, procesar, version)
+            logger.info("Almacén incremental (%s): %s ejercicios confirmados después de la marca de agua",
+                        modelo, len(filas_crudas))
+        return len(filas_crudas)
+
+    def _procesar_y_guardar(self, modelo, use_case, filas_crudas, procesar, version):
+        # Se toman antes de procesar, porque el procesamiento puede modificar la fila cruda
+        claves = [(fila['saex_id'], normalizar_fecha(fila.get('saex_DateTime'))) for fila in filas_crudas]
+        self._guardar_lote(modelo, use_case, claves, procesar(filas_crudas), version)
+
+    def _guardar_lote(self, modelo, use_case, claves, procesadas, version):
+        registros = [
+            (modelo, saex_id, use_case, fecha, json.dumps(datos, ensure_ascii=False, default=_valor_json))
+            for (saex_id, fecha), datos in zip(claves, procesadas)
+        ]
+        ultimo_id, ultima_fecha = claves[-1]
+        conn = self._conexion()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            conn.executemany(
+                "INSERT OR REPLACE INTO filas_procesadas (modelo, saex_id, use_case, fecha, datos) VALUES (?, ?, ?, ?, ?)",
+                registros,
+            )
+            # Si otro worker sincronizó en paralelo, la marca nunca retrocede
+            conn.execute(
+                """
+                INSERT INTO marcas_agua (modelo, use_case, ultimo_id, ultima_fecha, version, actualizado)
+                VALUES (?, ?, ?, ?, ?, ?)
+                ON CONFLICT (modelo, use_case) DO UPDATE SET
+                    ultimo_id = MAX(ultimo_id, excluded.ultimo_id),
+                    ultima_fecha = CASE WHEN excluded.ultimo_id > ultimo_id THEN excluded.ultima_fecha ELSE ultima_fecha END,
+                    version = excluded.version,
+                    actualizado = excluded.actualizado
+                """,
+                (modelo, use_case, ultimo_id, ultima_fecha, version,
+                 datetime.now().isoformat(sep=' ', timespec='seconds')),
+            )
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+
+    def consultar(self, modelo, ids, fecha_inicio=None, fecha_fin=None, page=1, page_size=10000):
+        """
+        Lee del almacén una página de resultados procesados, ordenados por saex_id, con el mismo
+        filtro que la consulta a MySQL (saex_useCases y, si llegan ambas fechas, BETWEEN). Cada
+        resultado es el valor JSON que devolvió `procesar` al sincronizar.
+        """
+        format_strings = ','.join(['?'] * len(ids))
+        filtros = [f"modelo = ? AND use_case IN ({format_strings})"]
+        query_params = [modelo, *ids]
+        if fecha_inicio and fecha_fin:
+            filtros.append("fecha BETWEEN ? AND ?")
+            query_params.extend([normalizar_fecha(fecha_inicio), normalizar_fecha(fecha_fin)])
+        query_params.extend([page_size, (page - 1) * page_size])
+
+        filas = self._conexion().execute(
+            f"SELECT datos FROM filas_procesadas WHERE {' AND '.join(filtros)} ORDER BY saex_id LIMIT ? OFFSET ?",
+            query_params,
+        ).fetchall()
+        return [json.loads(fila[0]) for fila in filas]
+
+    def estadisticas(self):
+        conn = self._conexion()
+        marcas = conn.execute(
+            "SELECT modelo, use_case, ultimo_id, ultima_fecha, version, actualizado FROM marcas_agua ORDER BY modelo, use_case"
+        ).fetchall()
+        return {
+            'ruta': self.ruta,
+            'filas': conn.execute("SELECT COUNT(*) FROM filas_procesadas").fetchone()[0],
+            'marcas_agua': [
+                {'modelo': m, 'use_case': u, 'ultimo_id': i, 'ultima_fecha': f, 'version': v, 'actualizado': a}
+                for m, u, i, f, v, a in marcas
+            ],
+        }
@@ -1,135 +1,243 @@
-import json
-from utils.functions_la import extract_key_questions_answers
-from utils.logger import logger
-
-class BancoppelDashboardModel:
-    def __init__(self, db_conn):
-        self.db_conn = db_conn
-
-    def get_data_paginated(self, ids, fecha_inicio=None, fecha_fin=None, page=1, page_size=10000):
-        """
-        Método para obtener una página específica de datos procesados.
-        Se ha incrementado el valor predeterminado de page_size a 10000.
-        """
-        offset = (page - 1) * page_size
-        format_strings = ','.join(['%s'] * len(ids))
-
-        # Construir el filtro de fechas si se proporcionan fecha_inicio y fecha_fin
-        date_filter = ""
-        query_params = list(ids)
-        if fecha_inicio and fecha_fin:
-            date_filter = "AND saex_DateTime BETWEEN %s AND %s"
-            query_params.extend([fecha_inicio, fecha_fin])
-
-        query = f"""
-            SELECT 
-                saex_id,
-                saex_user,
-                saex_useCases,
-                saex_useCasesTitle,
-                saex_username,
-                saex_retroContents,
-                saex_closingContents,
-                saex_DateTime,
-                saex_iterations,
-                saex_score,
-                saex_scoreData,
-                saex_sold,
-                saex_rp_id,
-                saex_rp_email,
-                saex_rp_activity,
-                saex_rp_client
-            FROM 
-                sale_exercises
-            WHERE 
-                saex_useCases IN ({format_strings})
-                {date_filter}
-            LIMIT %s OFFSET %s
-        """
-
-        query_params.extend([page_size, offset])
-
-        resultado = self.db_conn.ejecutar_query(query, tuple(query_params))
-        if resultado:
-            for fila in resultado:
-                self.procesar_fila(fila)
-            return resultado
-        else:
-            return []
-
-    def procesar_fila(self, fila):
-        """
-        Método para procesar cada fila individual.
-        """
-        retro_contents = fila.get('saex_retroContents')
-        if retro_contents:
-            try:
-                retro_dict = json.loads(retro_contents)
-                for i in range(1, 11):
-                    pregunta_key = f'pregunta{i}'
-                    respuesta_key = f'respuesta{i}'
-                    puntaje_key = f'puntaje{i}'
-                    pregunta = retro_dict.get(str(i), {}).get('question', '')
-                    fila[pregunta_key] = pregunta
-                    respuesta = retro_dict.get(str(i), {}).get('answer', '')
-                    fila[respuesta_key] = respuesta
-                    puntaje = retro_dict.get(str(i), {}).get('puntos', '0')
-                    try:
-                        fila[puntaje_key] = float(puntaje)
-                    except ValueError:
-                        fila[puntaje_key] = 0.0
-                if 'puntaje_total' not in fila or not isinstance(fila['puntaje_total'], (int, float)):
-                    total_puntaje = sum(fila.get(f'puntaje{i}', 0.0) for i in range(1, 11))
-                    fila['puntaje_total'] = total_puntaje
-            except json.JSONDecodeError as e:
-                logger.error(f"Error al parsear saex_retroContents: {e}")
-                for i in range(1, 11):
-                    fila[f'pregunta{i}'] = ''
-                    fila[f'respuesta{i}'] = ''
-                    fila[f'puntaje{i}'] = 0.0
-                fila['puntaje_total'] = 0.0
-        else:
-            for i in range(1, 11):
-                fila[f'pregunta{i}'] = ''
-                fila[f'respuesta{i}'] = ''
-                fila[f'puntaje{i}'] = 0.0
-            fila['puntaje_total'] = 0.0
-
-        score_data = fila.get('saex_scoreData')
-        if score_data:
-            try:
-                score_dict = json.loads(score_data)
-                fila['saex_scoreData_sum'] = float(score_dict.get('sum', 0))
-                fila['saex_scoreData_item'] = int(score_dict.get('item', 0))
-                fila['saex_scoreData_avg'] = float(score_dict.get('avg', 0.0))
-            except json.JSONDecodeError as e:
-                logger.error(f"Error al parsear saex_scoreData: {e}")
-                fila['saex_scoreData_sum'] = 0.0
-                fila['saex_scoreData_item'] = 0
-                fila['saex_scoreData_avg'] = 0.0
-        else:
-            fila['saex_scoreData_sum'] = 0.0
-            fila['saex_scoreData_item'] = 0
-            fila['saex_scoreData_avg'] = 0.0
-
-        # Procesar saex_closingContents para extraer preguntas y respuestas clave
-        saex_closingContents = fila.get('saex_closingContents')
-        if saex_closingContents:
-            key_data = extract_key_questions_answers(saex_closingContents)
-            fila.update(key_data)
-        else:
-            fila['veredicto_compra'] = ''
-            fila['veredicto_compra_resultado'] = ''
-            fila['min_puntos_compra'] = ''
-            fila['min_puntos_compra_resultado'] = ''
-            fila['puntaje_final_obtenido'] = 0
-            fila['max_puntaje'] = 0
-
-        # Remover campos innecesarios
-        fila.pop('saex_retroContents', None)
-        fila.pop('saex_scoreData', None)
-        fila.pop('saex_closingContents', None)
-
-
-
-
+import json
+from functools import partial
+from models.proyeccion import ETAPA_CLOSING_CONTENTS, ETAPA_RETRO_CONTENTS, ETAPA_SCORE_DATA, Proyeccion
+from models.sale_exercises_query import (
+    COLUMNAS_SALE_EXERCISES, construir_query_delta, construir_query_sale_exercises, codificar_cursor,
+    decodificar_marca_agua
+)
+from utils.functions_la import extract_key_questions_answers
+from utils.logger import registrar_error_fila
+from utils.metricas import medir
+from utils.procesamiento_paralelo import procesar_en_bloques
+
+# Nombre con el que este modelo guarda sus filas en el almacén incremental
+MODELO_ALMACEN = 'bancoppel'
+# Versión de las filas guardadas en el almacén: subirla al cambiar el procesamiento o los campos
+# de salida hace que el almacén las reconstruya
+VERSION_ALMACEN = 1
+
+# Columnas que se procesan y no se devuelven
+COLUMNAS_BLOB = ('saex_retroContents', 'saex_scoreData', 'saex_closingContents')
+
+# Campos que admite fields=: las columnas de sale_exercises que se devuelven tal cual más los
+# campos calculados a partir de cada blob (pregunta/respuesta/puntaje se piden por familia)
+CAMPOS_BANCOPPEL = {
+    **{columna: ((columna,), None) for columna in COLUMNAS_SALE_EXERCISES if columna not in COLUMNAS_BLOB},
+    'pregunta': (('saex_retroContents',), ETAPA_RETRO_CONTENTS),
+    'respuesta': (('saex_retroContents',), ETAPA_RETRO_CONTENTS),
+    'puntaje': (('saex_retroContents',), ETAPA_RETRO_CONTENTS),
+    'puntaje_total': (('saex_retroContents',), ETAPA_RETRO_CONTENTS),
+    'saex_scoreData_sum': (('saex_scoreData',), ETAPA_SCORE_DATA),
+    'saex_scoreData_item': (('saex_scoreData',), ETAPA_SCORE_DATA),
+    'saex_scoreData_avg': (('saex_scoreData',), ETAPA_SCORE_DATA),
+    'veredicto_compra': (('saex_closingContents',), ETAPA_CLOSING_CONTENTS),
+    'veredicto_compra_resultado': (('saex_closingContents',), ETAPA_CLOSING_CONTENTS),
+    'min_puntos_compra': (('saex_closingContents',), ETAPA_CLOSING_CONTENTS),
+    'min_puntos_compra_resultado': (('saex_closingContents',), ETAPA_CLOSING_CONTENTS),
+    'puntaje_final_obtenido': (('saex_closingContents',), ETAPA_CLOSING_CONTENTS),
+    'max_puntaje': (('saex_closingContents',), ETAPA_CLOSING_CONTENTS),
+}
+
+class BancoppelDashboardModel:
+    def __init__(self, db_conn, campos=None):
+        """
+        `campos` (fields=) limita la salida a esos campos y la consulta y el procesamiento a lo
+        que necesitan; None devuelve todos. Lanza ValueError si algún campo no existe.
+        """
+        self.db_conn = db_conn
+        self.campos = tuple(campos) if campos else None
+        self.proyeccion = Proyeccion(self.campos, CAMPOS_BANCOPPEL) if self.campos else None
+        self.columnas = self.proyeccion.columnas if self.proyeccion else None
+
+    def requiere(self, etapa):
+        return self.proyeccion is None or etapa in self.proyeccion.etapas
+
+    def get_data_paginated(self, ids, fecha_inicio=None, fecha_fin=None, page=1, page_size=10000, por_id=False):
+        """
+        Método para obtener una página específica de datos procesados.
+        Se ha incrementado el valor predeterminado de page_size a 10000.
+        """
+        query, query_params = construir_query_sale_exercises(
+            ids, fecha_inicio=fecha_inicio, fecha_fin=fecha_fin, page=page, page_size=page_size,
+            columnas=self.columnas, por_id=por_id
+        )
+
+        resultado = self.db_conn.ejecutar_query(query, query_params)
+        if resultado:
+            return self.procesar_filas(resultado)
+        else:
+            return []
+
+    def get_data_cursor(self, ids, fecha_inicio=None, fecha_fin=None, cursor=None, page_size=10000):
+        """
+        Paginación por keyset sobre (saex_DateTime, saex_id). `cursor` es la tupla devuelta por
+        decodificar_cursor (None para la primera página). Devuelve (filas, next_cursor).
+        """
+        query, query_params = construir_query_sale_exercises(
+            ids, fecha_inicio=fecha_inicio, fecha_fin=fecha_fin, page_size=page_size, cursor=cursor, keyset=True,
+            columnas=self.columnas
+        )
+
+        resultado = self.db_conn.ejecutar_query(query, query_params)
+        if resultado:
+            next_cursor = codificar_cursor(resultado[-1]) if len(resultado) == page_size else None
+            return self.procesar_filas(resultado), next_cursor
+        else:
+            return [], None
+
+    def get_data_delta(self, ids, since, fecha_inicio=None, fecha_fin=None, page_size=10000, ventana=0):
+        """
+        Filas agregadas después de la marca de agua `since` (saex_id o fecha ISO, ver
+        decodificar_marca_agua), a lo sumo page_size, en orden de saex_id. Devuelve
+        (datos, marca_agua, hay_mas): marca_agua es el saex_id de la última fila entregada (o el
+        mismo since si no hubo filas nuevas) y es lo que el cliente envía en la siguiente consulta.
+        Lanza ValueError si since no es válido.
+
+        Con un saex_id como since también se entregan de nuevo las filas de los `ventana` saex_id
+        anteriores (ver construir_query_delta); el cliente descarta por saex_id las que ya tenía.
+        """
+        desde_id, desde_fecha = decodificar_marca_agua(since)
+        query, query_params = construir_query_delta(
+            ids, desde_id=desde_id, desde_fecha=desde_fecha, fecha_inicio=fecha_inicio, fecha_fin=fecha_fin,
+            limite=page_size, columnas=self.columnas, ventana=ventana
+        )
+
+        # Ante un error ejecutar_query devuelve una lista vacía: la marca no avanza y el cliente
+        # vuelve a pedir lo mismo en la siguiente consulta
+        resultado = self.db_conn.ejecutar_query(query, query_params)
+        if not resultado:
+            return [], desde_id if desde_id is not None else since, False
+        if desde_id is None:
+            nuevas = len(resultado)
+        else:
+            # Las filas nuevas que sobren tras la ventana quedan para la siguiente consulta
+            repetidas = sum(1 for fila in resultado if fila['saex_id'] <= desde_id)
+            resultado = resultado[:repetidas + page_size]
+            nuevas = len(resultado) - repetidas
+        marca_agua = resultado[-1]['saex_id'] if nuevas else desde_id
+        return self.procesar_filas(resultado), marca_agua, nuevas == page_size
+
+    def get_data_almacen(self, almacen, ids, fecha_inicio=None, fecha_fin=None, page=1, page_size=10000):
+        """
+        Igual que get_data_paginated, pero servido desde el almacén incremental: sólo se procesan
+        las filas posteriores a la marca de agua de cada caso de uso, y si el almacén no alcanza a
+        ponerse al día en esta solicitud la página se lee de MySQL. El almacén guarda las filas
+        completas, con las fechas como texto ISO; la proyección de campos se aplica al leer.
+        """
+        completo = BancoppelDashboardModel(self.db_conn) if self.proyeccion else self
+        if not almacen.sincronizar(MODELO_ALMACEN, ids, self.db_conn, completo.procesar_para_almacen,
+                                   version=VERSION_ALMACEN):
+            return self.get_data_paginated(ids, fecha_inicio=fecha_inicio, fecha_fin=fecha_fin, page=page,
+                                           page_size=page_size, por_id=True)
+        pagina = almacen.consultar(
+            MODELO_ALMACEN, ids, fecha_inicio=fecha_inicio, fecha_fin=fecha_fin, page=page, page_size=page_size
+        )
+        return [self.proyeccion.filtrar(fila) for fila in pagina] if self.proyeccion else pagina
+
+    def procesar_para_almacen(self, filas_crudas):
+        return self.procesar_filas(filas_crudas)
+
+    def procesar_filas(self, filas):
+        """
+        Procesa cada fila y devuelve la lista procesada en el mismo orden. Las páginas grandes se
+        reparten en bloques entre el pool de procesos del worker, si está activo; en ese caso las
+        filas devueltas son copias y no las mismas instancias recibidas.
+        """
+        with medir('procesar'):
+            return procesar_en_bloques(filas, partial(procesar_bloque_bancoppel, campos=self.campos))
+
+    def procesar_bloque(self, filas):
+        for fila in filas:
+            self.procesar_fila(fila)
+        if self.proyeccion:
+            return [self.proyeccion.filtrar(fila) for fila in filas]
+        return filas
+
+    def procesar_fila(self, fila):
+        """
+        Método para procesar cada fila individual. Con proyección sólo corren las etapas de los
+        campos pedidos.
+        """
+        if self.requiere(ETAPA_RETRO_CONTENTS):
+            self.extraer_retro_contents(fila)
+        if self.requiere(ETAPA_SCORE_DATA):
+            self.extraer_score_data(fila)
+        if self.requiere(ETAPA_CLOSING_CONTENTS):
+            self.extraer_closing_contents(fila)
+
+        # Remover campos innecesarios
+        fila.pop('saex_retroContents', None)
+        fila.pop('saex_scoreData', None)
+        fila.pop('saex_closingContents', None)
+
+    def extraer_retro_contents(self, fila):
+        retro_contents = fila.get('saex_retroContents')
+        if retro_contents:
+            try:
+                retro_dict = json.loads(retro_contents)
+                for i in range(1, 11):
+                    pregunta_key = f'pregunta{i}'
+                    respuesta_key = f'respuesta{i}'
+                    puntaje_key = f'puntaje{i}'
+                    pregunta = retro_dict.get(str(i), {}).get('question', '')
+                    fila[pregunta_key] = pregunta
+                    respuesta = retro_dict.get(str(i), {}).get('answer', '')
+                    fila[respuesta_key] = respuesta
+                    puntaje = retro_dict.get(str(i), {}).get('puntos', '0')
+                    try:
+                        fila[puntaje_key] = float(puntaje)
+                    except ValueError:
+                        fila[puntaje_key] = 0.0
+                if 'puntaje_total' not in fila or not isinstance(fila['puntaje_total'], (int, float)):
+                    total_puntaje = sum(fila.get(f'puntaje{i}', 0.0) for i in range(1, 11))
+                    fila['puntaje_total'] = total_puntaje
+            except json.JSONDecodeError as e:
+                registrar_error_fila('saex_retroContents', e)
+                for i in range(1, 11):
+                    fila[f'pregunta{i}'] = ''
+                    fila[f'respuesta{i}'] = ''
+                    fila[f'puntaje{i}'] = 0.0
+                fila['puntaje_total'] = 0.0
+        else:
+            for i in range(1, 11):
+                fila[f'pregunta{i}'] = ''
+                fila[f'respuesta{i}'] = ''
+                fila[f'puntaje{i}'] = 0.0
+            fila['puntaje_total'] = 0.0
+
+    def extraer_score_data(self, fila):
+        score_data = fila.get('saex_scoreData')
+        if score_data:
+            try:
+                score_dict = json.loads(score_data)
+                fila['saex_scoreData_sum'] = float(score_dict.get('sum', 0))
+                fila['saex_scoreData_item'] = int(score_dict.get('item', 0))
+                fila['saex_scoreData_avg'] = float(score_dict.get('avg', 0.0))
+            except json.JSONDecodeError as e:
+                registrar_error_fila('saex_scoreData', e)
+                fila['saex_scoreData_sum'] = 0.0
+                fila['saex_scoreData_item'] = 0
+                fila['saex_scoreData_avg'] = 0.0
+        else:
+            fila['saex_scoreData_sum'] = 0.0
+            fila['saex_scoreData_item'] = 0
+            fila['saex_scoreData_avg'] = 0.0
+
+    def extraer_closing_contents(self, fila):
+        # Procesar saex_closingContents para extraer preguntas y respuestas clave
+        saex_closingContents = fila.get('saex_closingContents')
+        if saex_closingContents:
+            key_data = extract_key_questions_answers(saex_closingContents)
+            fila.update(key_data)
+        else:
+            fila['veredicto_compra'] = ''
+            fila['veredicto_compra_resultado'] = ''
+            fila['min_puntos_compra'] = ''
+            fila['min_puntos_compra_resultado'] = ''
+            fila['puntaje_final_obtenido'] = 0
+            fila['max_puntaje'] = 0
+
+
+def procesar_bloque_bancoppel(filas, campos=None):
+    # Punto de entrada de los procesos del pool: no necesita conexión a la base de datos
+    return BancoppelDashboardModel(None, campos=campos).procesar_bloque(filas)
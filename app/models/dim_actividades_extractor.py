@@ -1,167 +1,302 @@
-import re
-import json
-from datetime import datetime
-from utils.logger import logger
-from bs4 import BeautifulSoup
-
-class DimActividadesExtractor:
-    def __init__(self, db_conn):
-        self.db_conn = db_conn
-        self.datos_finales = []
-
-    def get_data_paginated(self, ids, fecha_inicio=None, fecha_fin=None, page=1, page_size=10000):
-        """
-        Obtiene datos paginados de la tabla sale_exercises filtrados por saex_useCases y opcionalmente por saex_DateTime.
-        Luego procesa los resultados y almacena en self.datos_finales.
-        """
-        self.datos_finales = []
-    
-        offset = (page - 1) * page_size
-        format_strings = ','.join(['%s'] * len(ids))
-    
-        date_filter = ""
-        query_params = list(ids)
-        if fecha_inicio and fecha_fin:
-            date_filter = "AND saex_DateTime BETWEEN %s AND %s"
-            query_params.extend([fecha_inicio, fecha_fin])
-    
-        query = f"""
-            SELECT 
-                saex_id,
-                saex_user,
-                saex_useCases,
-                saex_useCasesTitle,
-                saex_username,
-                saex_retroContents,
-                saex_closingContents,
-                saex_DateTime,
-                saex_iterations,
-                saex_score,
-                saex_scoreData,
-                saex_sold,
-                saex_rp_id,
-                saex_rp_email,
-                saex_rp_activity,
-                saex_rp_client
-            FROM 
-                sale_exercises
-            WHERE 
-                saex_useCases IN ({format_strings})
-                {date_filter}
-            LIMIT %s OFFSET %s
-        """
-    
-        query_params.extend([page_size, offset])
-    
-        try:
-            logger.debug(f"Ejecutando la consulta: {query} con parámetros: {tuple(query_params)}")
-            resultado = self.db_conn.ejecutar_query(query, tuple(query_params))
-            if resultado:
-                self.procesar_resultados(resultado)
-                # Filtrar actividades válidas
-                datos_filtrados = [
-                    d for d in self.datos_finales
-                    if d.get("Actividad_Nombre") and d.get("Actividad_Nombre") != "No aplica"
-                ]
-                # Eliminar duplicados
-                datos_sin_duplicados = self.eliminar_duplicados_json(datos_filtrados)
-                return datos_sin_duplicados
-            else:
-                logger.info("No se encontraron resultados para los IDs proporcionados.")
-                return []
-        except Exception as e:
-            logger.error(f"Error al obtener datos paginados: {e}")
-            return []
-
-    def procesar_resultados(self, resultados):
-        for resultado_original in resultados:
-            resultado = resultado_original.copy()
-            self.convertir_fechas_a_iso(resultado)
-            actividades = self.extraer_dim_actividades(resultado)
-            resultado_final = self.construir_resultado_final(actividades)
-            self.datos_finales.append(resultado_final)
-
-    def convertir_fechas_a_iso(self, resultado):
-        for key, value in resultado.items():
-            if isinstance(value, datetime):
-                resultado[key] = value.isoformat()
-
-    def limpiar_valor(self, valor):
-        if isinstance(valor, str):
-            return re.sub(r'\s+', ' ', valor).strip()
-        return valor
-
-    def eliminar_duplicados_json(self, datos):
-        actividades_vistas = {}
-        for actividad in datos:
-            clave_unica = tuple((k, self.limpiar_valor(v)) for k, v in actividad.items() if k != "Actividad_Nombre")
-            if clave_unica in actividades_vistas:
-                if actividad.get("Actividad_Nombre"):
-                    actividades_vistas[clave_unica] = actividad
-            else:
-                actividades_vistas[clave_unica] = actividad
-        return list(actividades_vistas.values())
-
-    def extraer_dim_actividades(self, resultado):
-        actividades = {
-            'ID_Caso_de_Uso': resultado.get('saex_useCases', 'No aplica'),
-            'Caso_de_Uso': resultado.get('saex_useCasesTitle', 'No aplica'),
-            'Actividad_Nombre': resultado.get('saex_rp_activity', 'No aplica')
-        }
-
-        retro_contents_str = resultado.get('saex_retroContents', None)
-
-        if retro_contents_str:
-            try:
-                retro_contents = json.loads(retro_contents_str)
-
-                for key, value in retro_contents.items():
-                    retro_prompt = value.get('retroPrompt', '')
-                    retro_prompt = retro_prompt.replace("\r\n", " ").replace("\n", " ").replace("<br>", " ").replace("</br>", " ").strip()
-
-                    criterio_match = re.search(r'<b>Criterio a evaluar</b>:\s*(.*?)(?=<p>|</p>|\r|\n)', retro_prompt, re.DOTALL)
-                    if criterio_match:
-                        actividades[f'Criterio_{key}'] = criterio_match.group(1).strip()
-
-                    puntos_max_match = re.search(r'<b>Puntaje</b>:\s*\d+\s*pts\s*/\s*(\d+)\s*pts', retro_prompt)
-                    if puntos_max_match:
-                        actividades[f'Puntos_Max_{key}'] = puntos_max_match.group(1).strip()
-
-            except json.JSONDecodeError as e:
-                logger.error(f"Error al parsear saex_retroContents: {e}")
-
-        closing_contents_str = resultado.get('saex_closingContents', None)
-
-        if closing_contents_str:
-            try:
-                soup = BeautifulSoup(closing_contents_str, 'html.parser')
-                questions = soup.find_all('p', class_='question')
-
-                for i, question in enumerate(questions):
-                    pregunta = question.get_text(strip=True)
-                    actividades[f'Veredicto_Venta{i + 1}'] = pregunta
-
-            except Exception as e:
-                logger.error(f"Error al procesar saex_closingContents: {e}")
-
-        return actividades
-
-    def construir_resultado_final(self, actividades):
-        resultado_final = {
-            'ID_Caso_de_Uso': actividades.get('ID_Caso_de_Uso', 'No aplica'),
-            'Caso_de_Uso': actividades.get('Caso_de_Uso', 'No aplica'),
-            'Actividad_Nombre': actividades.get('Actividad_Nombre', 'No aplica'),
-        }
-
-        for key in actividades.keys():
-            if key.startswith('Criterio_') or key.startswith('Puntos_Max_') or key.startswith('Veredicto_Venta'):
-                resultado_final[key] = actividades.get(key, 'No aplica')
-
-        return resultado_final
-
-    def extraer_DimActividades(self):
-        datos_finales_sin_duplicados = self.eliminar_duplicados_json(self.datos_finales)
-        return datos_finales_sin_duplicados
-
-
-
+import json
+from functools import partial
+from hashlib import blake2b
+from mysql.connector.errors import PoolError
+from models.fragmentacion import leer_fragmentado
+from models.proyeccion import COLUMNAS_CLAVE, ETAPA_CLOSING_CONTENTS, ETAPA_RETRO_CONTENTS, Proyeccion
+from models.sale_exercises_query import (
+    construir_query_sale_exercises, construir_query_representantes_dimension, construir_query_por_ids,
+    codificar_cursor
+)
+from utils.cache_plantillas import analizar_retro_prompt, cache_preguntas_cierre
+from utils.fragmentos_html import extraer_fragmentos_cierre, texto_plano
+from utils.logger import logger, registrar_error_fila
+from utils.metricas import medir
+from utils.procesamiento_paralelo import procesar_en_bloques
+
+# Campos que admite fields=: columnas crudas y etapa que necesita cada uno
+CAMPOS_DIM_ACTIVIDADES = {
+    'ID_Caso_de_Uso': (('saex_useCases',), None),
+    'Caso_de_Uso': (('saex_useCasesTitle',), None),
+    'Actividad_Nombre': (('saex_rp_activity',), None),
+    'Criterio': (('saex_retroContents',), ETAPA_RETRO_CONTENTS),
+    'Puntos_Max': (('saex_retroContents',), ETAPA_RETRO_CONTENTS),
+    'Veredicto_Venta': (('saex_closingContents',), ETAPA_CLOSING_CONTENTS),
+}
+
+
+def normalizar_valor(valor):
+    # Espacios repetidos, saltos de línea y tabuladores cuentan como un solo espacio
+    if isinstance(valor, str):
+        return ' '.join(valor.split())
+    return valor
+
+
+def huella_actividad(actividad):
+    """
+    Huella de 16 bytes de una actividad: todos sus campos menos Actividad_Nombre, con los textos
+    normalizados y en el orden de la actividad. Dos actividades duplicadas tienen la misma huella.
+    """
+    clave = tuple((k, normalizar_valor(v)) for k, v in actividad.items() if k != "Actividad_Nombre")
+    return blake2b(repr(clave).encode('utf-8'), digest_size=16).digest()
+
+
+def es_actividad_valida(actividad):
+    return actividad.get("Actividad_Nombre") and actividad.get("Actividad_Nombre") != "No aplica"
+
+
+class DeduplicadorActividades:
+    """
+    Eliminación de duplicados incremental: se le agregan actividades a medida que se procesan las
+    filas y sólo guarda una por huella. Una actividad repetida conserva la posición de la primera
+    aparición y toma el valor de la última que tenga Actividad_Nombre. La memoria depende del número
+    de actividades distintas, no del de filas; las claves son las huellas, no los textos completos
+    de los criterios.
+    """
+    __slots__ = ('actividades',)
+
+    def __init__(self):
+        self.actividades = {}
+
+    def agregar(self, actividades):
+        for actividad in actividades:
+            self.agregar_par(huella_actividad(actividad), actividad)
+
+    def agregar_par(self, huella, actividad):
+        if huella not in self.actividades or actividad.get("Actividad_Nombre"):
+            self.actividades[huella] = actividad
+
+    def combinar(self, pares):
+        # Pares (huella, actividad) ya calculados, por ejemplo en los procesos del pool
+        for huella, actividad in pares:
+            self.agregar_par(huella, actividad)
+
+    def pares(self):
+        return list(self.actividades.items())
+
+    def resultado(self):
+        return list(self.actividades.values())
+
+
+class DimActividadesExtractor:
+    def __init__(self, db_conn, campos=None):
+        """
+        `campos` (parámetro fields=) limita la salida a esos campos y la consulta y el
+        procesamiento a lo que necesitan; None devuelve todos. Lanza ValueError si algún campo no
+        existe. Actividad_Nombre se lee siempre porque filtra las actividades válidas.
+        """
+        self.db_conn = db_conn
+        self.campos = tuple(campos) if campos else None
+        self.proyeccion = Proyeccion(
+            self.campos, CAMPOS_DIM_ACTIVIDADES, columnas_base=COLUMNAS_CLAVE + ('saex_rp_activity',)
+        ) if self.campos else None
+        self.columnas = self.proyeccion.columnas if self.proyeccion else None
+
+    def requiere(self, etapa):
+        return self.proyeccion is None or etapa in self.proyeccion.etapas
+
+    def get_data_paginated(self, ids, fecha_inicio=None, fecha_fin=None, page=1, page_size=10000):
+        """
+        Obtiene datos paginados de la tabla sale_exercises filtrados por saex_useCases y opcionalmente por saex_DateTime.
+        Luego procesa los resultados y devuelve las actividades válidas sin duplicados.
+        """
+        query, query_params = construir_query_sale_exercises(
+            ids, fecha_inicio=fecha_inicio, fecha_fin=fecha_fin, page=page, page_size=page_size,
+            columnas=self.columnas
+        )
+
+        try:
+            resultado = self.db_conn.ejecutar_query(query, query_params, como_tuplas=True)
+            if resultado:
+                return self.obtener_actividades(resultado)
+            else:
+                logger.info("No se encontraron resultados para los IDs proporcionados.")
+                return []
+        except PoolError:
+            # Sin conexión libre: la ruta responde 503
+            raise
+        except Exception as e:
+            logger.error("Error al obtener datos paginados: %s", e)
+            return []
+
+    def get_data_cursor(self, ids, fecha_inicio=None, fecha_fin=None, cursor=None, page_size=10000):
+        """
+        Paginación por keyset sobre (saex_DateTime, saex_id). `cursor` es la tupla devuelta por
+        decodificar_cursor (None para la primera página). Devuelve (actividades, next_cursor); el
+        cursor se calcula sobre las filas leídas, no sobre las actividades sin duplicados.
+        """
+        query, query_params = construir_query_sale_exercises(
+            ids, fecha_inicio=fecha_inicio, fecha_fin=fecha_fin, page_size=page_size, cursor=cursor, keyset=True,
+            columnas=self.columnas
+        )
+
+        try:
+            resultado = self.db_conn.ejecutar_query(query, query_params, como_tuplas=True)
+            if resultado:
+                next_cursor = codificar_cursor(resultado[-1]) if len(resultado) == page_size else None
+                return self.obtener_actividades(resultado), next_cursor
+            else:
+                logger.info("No se encontraron resultados para los IDs proporcionados.")
+                return [], None
+        except PoolError:
+            # Sin conexión libre: la ruta responde 503
+            raise
+        except Exception as e:
+            logger.error("Error al obtener datos por cursor: %s", e)
+            return [], None
+
+    def get_data_fragmentado(self, ids, fecha_inicio, fecha_fin, dias, cursor=None, page_size=10000, concurrencia=3,
+                             espera_conexion=5):
+        """
+        Misma página que get_data_cursor, pero el rango de fechas se lee dividido en fragmentos de
+        `dias` días consultados en paralelo (models/fragmentacion.py); cada fragmento se procesa
+        mientras se leen los siguientes. Devuelve (actividades, next_cursor).
+        """
+        deduplicador = DeduplicadorActividades()
+        leidas = 0
+        ultima = None
+        try:
+            for filas in leer_fragmentado(
+                self.db_conn, ids, fecha_inicio, fecha_fin, dias, page_size, cursor=cursor,
+                columnas=self.columnas, concurrencia=concurrencia, espera_conexion=espera_conexion
+            ):
+                leidas += len(filas)
+                ultima = filas[-1]
+                self.acumular_actividades(filas, deduplicador)
+        except PoolError:
+            # Sin conexión libre: la ruta responde 503
+            raise
+        except Exception as e:
+            logger.error("Error al obtener datos fragmentados: %s", e)
+            return [], None
+
+        if not leidas:
+            logger.info("No se encontraron resultados para los IDs proporcionados.")
+            return [], None
+        next_cursor = codificar_cursor(ultima) if leidas == page_size else None
+        return deduplicador.resultado(), next_cursor
+
+    def iterar_lotes(self, ids, fecha_inicio=None, fecha_fin=None, page=1, page_size=10000, tam_lote=1000):
+        """
+        Versión en streaming de get_data_paginated: lee la página con un cursor sin buffer y procesa
+        lote a lote. Sólo se conservan las actividades distintas de los lotes ya leídos, que se
+        entregan en un único lote al terminar la lectura.
+        """
+        query, query_params = construir_query_sale_exercises(
+            ids, fecha_inicio=fecha_inicio, fecha_fin=fecha_fin, page=page, page_size=page_size,
+            columnas=self.columnas
+        )
+
+        deduplicador = DeduplicadorActividades()
+        for lote in self.db_conn.ejecutar_query_stream(query, query_params, tam_lote=tam_lote, como_tuplas=True):
+            self.acumular_actividades(lote, deduplicador)
+        yield deduplicador.resultado()
+
+    def get_dimension(self, ids, fecha_inicio=None, fecha_fin=None):
+        """
+        Construye la dimensión de actividades sin recorrer todos los ejercicios: primero obtiene
+        en SQL un ejercicio representativo (el primero y el último) por caso de uso, actividad y
+        variante de plantilla, y sólo esas filas se leen completas y se procesan. El tiempo de
+        respuesta depende del número de actividades y no del número de ejercicios.
+        """
+        query, query_params = construir_query_representantes_dimension(
+            ids, fecha_inicio=fecha_inicio, fecha_fin=fecha_fin,
+            variantes_retro=self.requiere(ETAPA_RETRO_CONTENTS), variantes_cierre=self.requiere(ETAPA_CLOSING_CONTENTS)
+        )
+
+        try:
+            representantes = self.db_conn.ejecutar_query(query, query_params)
+            saex_ids = sorted({fila[columna] for fila in representantes for columna in ('primer_id', 'ultimo_id')})
+            if not saex_ids:
+                logger.info("No se encontraron resultados para los IDs proporcionados.")
+                return []
+
+            logger.debug("Dimensión de actividades: %s grupos, %s filas representativas", len(representantes), len(saex_ids))
+            query, query_params = construir_query_por_ids(saex_ids, columnas=self.columnas)
+            resultado = self.db_conn.ejecutar_query(query, query_params, como_tuplas=True)
+            return self.obtener_actividades(resultado) if resultado else []
+        except PoolError:
+            # Sin conexión libre: la ruta responde 503
+            raise
+        except Exception as e:
+            logger.error("Error al construir la dimensión de actividades: %s", e)
+            return []
+
+    def obtener_actividades(self, resultado):
+        """
+        Procesa las filas leídas y devuelve las actividades válidas sin duplicados.
+        """
+        deduplicador = DeduplicadorActividades()
+        self.acumular_actividades(resultado, deduplicador)
+        return deduplicador.resultado()
+
+    def acumular_actividades(self, resultados, deduplicador):
+        """
+        Procesa un lote de filas y agrega sus actividades válidas a `deduplicador`. Cada bloque
+        (también en los procesos del pool) se filtra, se proyecta y se deduplica al procesarse y
+        llega con sus huellas: la lista completa de actividades de la página no llega a armarse.
+        """
+        with medir('procesar'):
+            pares = procesar_en_bloques(resultados, partial(procesar_bloque_actividades_unicas, campos=self.campos))
+        with medir('dedup'):
+            deduplicador.combinar(pares)
+
+    def actividades_unicas(self, resultados):
+        """
+        Actividades válidas y proyectadas de un bloque de filas, sin duplicados, como pares
+        (huella, actividad) en el orden de su primera aparición.
+        """
+        # Un generador de principio a fin: cada actividad se descarta apenas se calcula su huella
+        actividades = (
+            actividad for actividad in map(self.extraer_dim_actividades, resultados) if es_actividad_valida(actividad)
+        )
+        if self.proyeccion is not None:
+            actividades = map(self.proyeccion.filtrar, actividades)
+        deduplicador = DeduplicadorActividades()
+        deduplicador.agregar(actividades)
+        return deduplicador.pares()
+
+    def extraer_dim_actividades(self, resultado):
+        actividades = {
+            'ID_Caso_de_Uso': resultado.get('saex_useCases', 'No aplica'),
+            'Caso_de_Uso': resultado.get('saex_useCasesTitle', 'No aplica'),
+            'Actividad_Nombre': resultado.get('saex_rp_activity', 'No aplica')
+        }
+
+        retro_contents_str = resultado.get('saex_retroContents', None) if self.requiere(ETAPA_RETRO_CONTENTS) else None
+
+        if retro_contents_str:
+            try:
+                retro_contents = json.loads(retro_contents_str)
+
+                for key, value in retro_contents.items():
+                    plantilla = analizar_retro_prompt(value.get('retroPrompt', ''))
+
+                    if plantilla.criterio is not None:
+                        actividades[f'Criterio_{key}'] = plantilla.criterio
+
+                    if plantilla.puntos_max is not None:
+                        actividades[f'Puntos_Max_{key}'] = plantilla.puntos_max
+
+            except json.JSONDecodeError as e:
+                registrar_error_fila('saex_retroContents', e)
+
+        closing_contents_str = resultado.get('saex_closingContents', None) if self.requiere(ETAPA_CLOSING_CONTENTS) else None
+
+        if closing_contents_str:
+            try:
+                preguntas, _ = extraer_fragmentos_cierre(closing_contents_str)
+
+                for i, pregunta in enumerate(preguntas):
+                    actividades[f'Veredicto_Venta{i + 1}'] = cache_preguntas_cierre.obtener_o_calcular(pregunta, texto_plano)
+
+            except Exception as e:
+                registrar_error_fila('saex_closingContents', e)
+
+        return actividades
+
+
+def procesar_bloque_actividades_unicas(filas, campos=None):
+    # Punto de entrada de los procesos del pool (no necesita conexión a la base de datos): devuelve
+    # sólo las actividades distintas del bloque, así lo que vuelve es proporcional a las actividades
+    return DimActividadesExtractor(None, campos=campos).actividades_unicas(filas)
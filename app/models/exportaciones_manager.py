@@ -0,0 +1,360 @@
+import fcntl
+import gzip
+import json
+import os
+import subprocess
+import sys
+import threading
+import time
+import uuid
+from collections.abc import Mapping
+from contextlib import contextmanager
+from datetime import datetime
+from models.sale_exercises_query import construir_query_sale_exercises, codificar_cursor, decodificar_cursor
+from utils.logger import logger, resumir_errores_fila
+
+# Exportaciones masivas en segundo plano. Cada trabajo corre en un proceso independiente
+# (python -m models.exportaciones_manager), fuera de los workers de gunicorn, así que no ocupa un
+# worker ni lo corta el --timeout. Recorre los ejercicios por keyset (saex_DateTime, saex_id) y
+# escribe cada bloque en un archivo NDJSON comprimido con gzip:
+#
+#   <EXPORTACIONES_DIR>/<id>/estado.json        estado, progreso y cursor del último bloque escrito
+#   <EXPORTACIONES_DIR>/<id>/parte_00001.ndjson.gz
+#
+# El estado se guarda después de cada parte; si el proceso muere, el trabajo queda "interrumpida"
+# y se puede reanudar desde el cursor guardado sin repetir las partes ya escritas.
+#
+# - Mientras corre, el proceso renueva el campo "actualizado" de estado.json cada `latido`
+#   segundos desde un hilo propio. Un trabajo en curso cuyo "actualizado" tiene más de
+#   LATIDOS_PERDIDOS latidos se informa como "interrumpida" aunque su pid siga existiendo
+#   (proceso zombi, colgado o pid reutilizado).
+# - El worker que lanza el proceso lo espera desde un hilo, que lo recoge apenas termina: no
+#   quedan zombis hasta la siguiente consulta.
+# - El conteo de exportaciones en curso y el lanzamiento se hacen con un candado flock sobre el
+#   directorio de exportaciones, así dos workers no pueden pasar a la vez el límite max_activas.
+
+TIPOS_EXPORTACION = ('rol_play_sim', 'dim_actividades')
+
+# Latidos sin renovar "actualizado" tras los cuales un trabajo en curso se da por interrumpido
+LATIDOS_PERDIDOS = 4
+
+
+def valor_json(valor):
+    # Los registros compactos de los modelos se escriben como su dict; cualquier otro valor, como texto
+    return dict(valor.items()) if isinstance(valor, Mapping) else str(valor)
+
+
+def ahora_iso():
+    return datetime.now().isoformat(sep=' ', timespec='seconds')
+
+
+def nombre_parte(numero):
+    return f"parte_{numero:05d}.ndjson.gz"
+
+
+def proceso_vivo(pid):
+    if not pid:
+        return False
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+class ExportacionesManager:
+    def __init__(self, directorio, filas_por_parte=20000, max_activas=2, latido=30):
+        self.directorio = directorio
+        self.filas_por_parte = filas_por_parte
+        self.max_activas = max_activas
+        self.latido = latido
+        # guardar_estado desde el proceso de exportación y su hilo de latido
+        self._lock_estado = threading.Lock()
+
+    def _ruta(self, job_id, archivo=''):
+        return os.path.join(self.directorio, job_id, archivo)
+
+    @contextmanager
+    def _candado(self):
+        # Exclusión entre workers para contar las exportaciones en curso y lanzar una nueva
+        os.makedirs(self.directorio, exist_ok=True)
+        descriptor = os.open(os.path.join(self.directorio, '.candado'), os.O_RDWR | os.O_CREAT, 0o644)
+        try:
+            fcntl.flock(descriptor, fcntl.LOCK_EX)
+            yield
+        finally:
+            os.close(descriptor)
+
+    def leer_estado(self, job_id):
+        """
+        Estado del trabajo o None si no existe. Un trabajo pendiente o "en_proceso" cuyo proceso
+        ya no existe, o que no renovó "actualizado" en LATIDOS_PERDIDOS latidos, se informa como
+        "interrumpida".
+        """
+        if not job_id.isalnum():
+            return None
+        try:
+            with open(self._ruta(job_id, 'estado.json'), encoding='utf-8') as archivo:
+                estado = json.load(archivo)
+        except (OSError, ValueError):
+            return None
+        if estado['estado'] in ('pendiente', 'en_proceso'):
+            pid = self._leer_pid(job_id)
+            if (pid is not None and not proceso_vivo(pid)) or self._sin_latido(estado):
+                estado['estado'] = 'interrumpida'
+        return estado
+
+    def _sin_latido(self, estado):
+        try:
+            actualizado = datetime.fromisoformat(estado['actualizado'])
+        except (KeyError, TypeError, ValueError):
+            return False
+        return (datetime.now() - actualizado).total_seconds() > self.latido * LATIDOS_PERDIDOS
+
+    def _leer_pid(self, job_id):
+        # El pid lo escribe el worker que lanzó el proceso; None si todavía no se escribió
+        try:
+            with open(self._ruta(job_id, 'proceso.pid'), encoding='utf-8') as archivo:
+                return int(archivo.read())
+        except (OSError, ValueError):
+            return None
+
+    def guardar_estado(self, estado):
+        with self._lock_estado:
+            estado['actualizado'] = ahora_iso()
+            ruta = self._ruta(estado['id'], 'estado.json')
+            temporal = ruta + '.tmp'
+            with open(temporal, 'w', encoding='utf-8') as archivo:
+                json.dump(estado, archivo, ensure_ascii=False)
+            os.replace(temporal, ruta)
+
+    def _latir(self, job_id, detener):
+        """
+        Hilo del proceso de exportación: renueva "actualizado" en estado.json cada self.latido
+        segundos hasta que se active `detener`. Relee el archivo para no serializar el estado
+        que el hilo principal está modificando.
+        """
+        while not detener.wait(self.latido):
+            with self._lock_estado:
+                ruta = self._ruta(job_id, 'estado.json')
+                try:
+                    with open(ruta, encoding='utf-8') as archivo:
+                        estado = json.load(archivo)
+                    estado['actualizado'] = ahora_iso()
+                    with open(ruta + '.tmp', 'w', encoding='utf-8') as archivo:
+                        json.dump(estado, archivo, ensure_ascii=False)
+                    os.replace(ruta + '.tmp', ruta)
+                except (OSError, ValueError) as e:
+                    logger.warning("No se pudo renovar el estado de la exportación %s: %s", job_id, e)
+
+    def activas(self):
+        if not os.path.isdir(self.directorio):
+            return 0
+        return sum(
+            1 for job_id in os.listdir(self.directorio)
+            if (self.leer_estado(job_id) or {}).get('estado') in ('pendiente', 'en_proceso')
+        )
+
+    def crear(self, tipo, ids, fecha_inicio='', fecha_fin=''):
+        """
+        Registra un trabajo nuevo y lanza su proceso. Lanza ValueError si el tipo no es válido y
+        RuntimeError si ya hay max_activas exportaciones en curso.
+        """
+        if tipo not in TIPOS_EXPORTACION:
+            raise ValueError(f"Tipo de exportación no válido: {tipo}. Disponibles: {', '.join(TIPOS_EXPORTACION)}")
+
+        with self._candado():
+            if self.activas() >= self.max_activas:
+                raise RuntimeError(f"Ya hay {self.max_activas} exportaciones en curso")
+
+            job_id = uuid.uuid4().hex
+            os.makedirs(self._ruta(job_id), exist_ok=True)
+            estado = {
+                'id': job_id,
+                'tipo': tipo,
+                'parametros': {'ids': ids, 'fecha_inicio': fecha_inicio, 'fecha_fin': fecha_fin},
+                'estado': 'pendiente',
+                'creado': ahora_iso(),
+                'filas': 0,
+                'partes': [],
+                'cursor': None,
+                'error': None,
+            }
+            self.guardar_estado(estado)
+            self._lanzar(job_id)
+        return self.leer_estado(job_id)
+
+    def reanudar(self, job_id):
+        """
+        Relanza un trabajo interrumpido o fallido desde el cursor de la última parte escrita.
+        Devuelve None si el trabajo no existe; lanza RuntimeError si no se puede reanudar.
+        """
+        with self._candado():
+            estado = self.leer_estado(job_id)
+            if estado is None:
+                return None
+            if estado['estado'] not in ('interrumpida', 'fallida'):
+                raise RuntimeError(f"La exportación está {estado['estado']} y no se puede reanudar")
+            if self.activas() >= self.max_activas:
+                raise RuntimeError(f"Ya hay {self.max_activas} exportaciones en curso")
+            estado['estado'] = 'pendiente'
+            estado['error'] = None
+            self.guardar_estado(estado)
+            self._lanzar(job_id)
+        return self.leer_estado(job_id)
+
+    def ruta_parte(self, job_id, numero):
+        estado = self.leer_estado(job_id)
+        if estado is None or not any(parte['numero'] == numero for parte in estado['partes']):
+            return None
+        return self._ruta(job_id, nombre_parte(numero))
+
+    def _lanzar(self, job_id):
+        directorio_app = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+        proceso = subprocess.Popen(
+            [sys.executable, '-m', 'models.exportaciones_manager', self.directorio, job_id],
+            cwd=directorio_app,
+            start_new_session=True,
+        )
+        with open(self._ruta(job_id, 'proceso.pid'), 'w', encoding='utf-8') as archivo:
+            archivo.write(str(proceso.pid))
+        # Lo recoge apenas termina, para que no quede como zombi del worker
+        threading.Thread(target=proceso.wait, name=f"exportacion-{job_id}", daemon=True).start()
+        logger.info("Exportación %s lanzada en el proceso %s", job_id, proceso.pid)
+
+    def ejecutar(self, job_id, db_conn):
+        """
+        Cuerpo del proceso de exportación: continúa desde el cursor guardado y escribe una parte
+        por cada bloque de filas_por_parte filas.
+        """
+        estado = self.leer_estado(job_id)
+        estado['estado'] = 'en_proceso'
+        estado.setdefault('iniciado', ahora_iso())
+        self.guardar_estado(estado)
+
+        detener_latido = threading.Event()
+        threading.Thread(target=self._latir, args=(job_id, detener_latido), daemon=True).start()
+        try:
+            self._exportar(job_id, estado, db_conn)
+        finally:
+            detener_latido.set()
+
+    def _exportar(self, job_id, estado, db_conn):
+        parametros = estado['parametros']
+        cursor = decodificar_cursor(estado['cursor']) if estado['cursor'] else None
+        procesar = self._procesador(estado['tipo'], db_conn)
+        # dim_actividades elimina duplicados sobre todo el conjunto: se acumula y se escribe al final
+        # y siempre arranca desde el principio (no guarda cursor intermedio)
+        dimension = procesar.nuevo_deduplicador() if estado['tipo'] == 'dim_actividades' else None
+        if dimension is not None:
+            cursor = None
+            estado['filas'] = 0
+
+        try:
+            # Un resumen de errores de parseo por exportación en lugar de una línea por fila
+            with resumir_errores_fila(f"Exportación {job_id}"):
+                while True:
+                    query, query_params = construir_query_sale_exercises(
+                        parametros['ids'], fecha_inicio=parametros['fecha_inicio'], fecha_fin=parametros['fecha_fin'],
+                        page_size=self.filas_por_parte, cursor=cursor, keyset=True
+                    )
+                    # ejecutar_query_stream propaga los errores de MySQL; ejecutar_query devolvería una
+                    # lista vacía y la exportación terminaría como completada
+                    lotes = db_conn.ejecutar_query_stream(query, query_params, como_tuplas=True)
+                    filas = [fila for lote in lotes for fila in lote]
+                    if not filas:
+                        break
+
+                    siguiente = codificar_cursor(filas[-1])
+                    if dimension is None:
+                        self._escribir_parte(estado, procesar(filas))
+                    else:
+                        procesar.acumular(filas, dimension)
+                    estado['filas'] += len(filas)
+                    if dimension is None:
+                        estado['cursor'] = siguiente
+                    self.guardar_estado(estado)
+
+                    if len(filas) < self.filas_por_parte:
+                        break
+                    cursor = decodificar_cursor(siguiente)
+
+            if dimension is not None:
+                self._escribir_parte(estado, dimension.resultado())
+            estado['estado'] = 'completada'
+            estado['terminado'] = ahora_iso()
+            self.guardar_estado(estado)
+            logger.info("Exportación %s completada: %s filas en %s partes", job_id, estado['filas'], len(estado['partes']))
+        except Exception as e:
+            estado['estado'] = 'fallida'
+            estado['error'] = str(e)
+            self.guardar_estado(estado)
+            logger.error("Exportación %s fallida: %s", job_id, e)
+            raise
+
+    def _escribir_parte(self, estado, registros):
+        numero = len(estado['partes']) + 1
+        ruta = self._ruta(estado['id'], nombre_parte(numero))
+        temporal = ruta + '.tmp'
+        with gzip.open(temporal, 'wt', encoding='utf-8') as archivo:
+            for registro in registros:
+                archivo.write(json.dumps(registro, ensure_ascii=False, default=valor_json))
+                archivo.write('\n')
+        os.replace(temporal, ruta)
+        estado['partes'].append({
+            'numero': numero,
+            'archivo': nombre_parte(numero),
+            'filas': len(registros),
+            'bytes': os.path.getsize(ruta),
+        })
+
+    def _procesador(self, tipo, db_conn):
+        if tipo == 'rol_play_sim':
+            from models.rol_play_sim_extractor import RolPlaySimExtractor
+            return ProcesadorExportacion(RolPlaySimExtractor(db_conn))
+        from models.dim_actividades_extractor import DimActividadesExtractor
+        return ProcesadorExportacion(DimActividadesExtractor(db_conn))
+
+
+class ProcesadorExportacion:
+    """
+    Adapta el procesamiento de cada modelo a la exportación: filas crudas -> registros de una parte
+    (rol_play_sim) o, para dim_actividades, filas crudas acumuladas en un deduplicador con el mismo
+    filtro y la misma eliminación de duplicados que la API (acumular_actividades).
+    """
+
+    def __init__(self, extractor):
+        self.extractor = extractor
+
+    def __call__(self, filas):
+        self.extractor.datos_finales = []
+        self.extractor.procesar_resultados(filas)
+        procesadas, self.extractor.datos_finales = self.extractor.datos_finales, []
+        return procesadas
+
+    def acumular(self, filas, deduplicador):
+        self.extractor.acumular_actividades(filas, deduplicador)
+
+    def nuevo_deduplicador(self):
+        from models.dim_actividades_extractor import DeduplicadorActividades
+        return DeduplicadorActividades()
+
+
+if __name__ == '__main__':
+    from config.db_connection import DatabaseConnection
+    from config.settings import HOST, USER, PASSWORD, DATABASE, EXPORTACIONES_FILAS_POR_PARTE, EXPORTACIONES_LATIDO
+
+    directorio, job_id = sys.argv[1], sys.argv[2]
+    inicio = time.monotonic()
+    db_conn = DatabaseConnection(HOST, USER, PASSWORD, DATABASE, pool_size=1)
+    manager = ExportacionesManager(directorio, filas_por_parte=EXPORTACIONES_FILAS_POR_PARTE, latido=EXPORTACIONES_LATIDO)
+    try:
+        manager.ejecutar(job_id, db_conn)
+    except Exception:
+        # El error ya quedó en estado.json y en el log
+        sys.exit(1)
+    finally:
+        db_conn.pool.cerrar()
+        logger.info("Proceso de exportación %s terminado en %.1fs", job_id, time.monotonic() - inicio)
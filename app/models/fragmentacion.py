@@ -0,0 +1,117 @@
+import itertools
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+from models.sale_exercises_query import construir_query_sale_exercises
+from utils.logger import logger
+from utils.metricas import contar_filas_leidas, medir
+
+# Lectura de un rango de fechas amplio dividido en sub-rangos (fragmentos) de N días. Los fragmentos
+# se consultan en paralelo desde un pool de hilos, cada uno con su propia conexión del pool del
+# worker, y se entregan en orden: mientras el llamador procesa un fragmento, los siguientes ya se
+# están leyendo. Como el orden es (saex_DateTime, saex_id), el resultado es la misma página que
+# devolvería la paginación por keyset sobre el rango completo.
+#
+# Sólo hay `concurrencia` fragmentos en vuelo a la vez (FRAGMENTOS_CONCURRENCIA, a lo sumo
+# DB_POOL_SIZE - 1): al completarse la página, los que faltan no se consultan. Un fragmento espera
+# una conexión libre a lo sumo `espera_conexion` segundos y después falla con PoolError, que se
+# propaga como cualquier error de MySQL. Al cerrarse el generador (página completa, error o cliente
+# que se desconecta) las lecturas en vuelo se detienen en su siguiente lote y se esperan: ninguna
+# sigue ocupando una conexión después de que el llamador terminó.
+
+TAMANOS_FRAGMENTO = {'dia': 1, 'semana': 7, 'mes': 30}
+
+
+def dias_fragmento(valor):
+    """
+    Días por fragmento a partir del parámetro shard: 'dia', 'semana', 'mes' o un número de días.
+    Lanza ValueError si el valor no es válido.
+    """
+    valor = valor.strip().lower()
+    if valor in TAMANOS_FRAGMENTO:
+        return TAMANOS_FRAGMENTO[valor]
+    dias = int(valor)
+    if dias < 1:
+        raise ValueError(f"Tamaño de fragmento no válido: {valor}")
+    return dias
+
+
+def dividir_rango(desde, hasta, dias):
+    """
+    Sub-rangos consecutivos (inicio, fin, ultimo) de `dias` días entre desde y hasta. Todos excluyen
+    su fin salvo el último, que lo incluye igual que el BETWEEN del rango completo.
+    """
+    paso = timedelta(days=dias)
+    fragmentos = []
+    inicio = desde
+    while inicio + paso < hasta:
+        fragmentos.append((inicio, inicio + paso, False))
+        inicio += paso
+    fragmentos.append((inicio, hasta, True))
+    return fragmentos
+
+
+def leer_fragmentado(db_conn, ids, fecha_inicio, fecha_fin, dias, page_size, cursor=None, columnas=None,
+                     concurrencia=3, tam_lote=1000, espera_conexion=5):
+    """
+    Genera, en orden, las filas crudas de cada fragmento con filas (a lo sumo page_size en total)
+    ordenadas por (saex_DateTime, saex_id) y posteriores al cursor, si se recibe. Los errores de
+    MySQL se propagan al consumir el fragmento que falló.
+    """
+    desde = datetime.fromisoformat(fecha_inicio)
+    hasta = datetime.fromisoformat(fecha_fin)
+    if cursor:
+        # Los fragmentos anteriores al cursor no pueden tener filas de esta página
+        desde = max(desde, datetime.fromisoformat(cursor[0]))
+    fragmentos = dividir_rango(desde, hasta, dias)
+    logger.debug("Rango %s - %s dividido en %s fragmentos de %s días", fecha_inicio, fecha_fin, len(fragmentos), dias)
+
+    cancelada = threading.Event()
+
+    def leer(fragmento):
+        if cancelada.is_set():
+            return []
+        inicio, fin, ultimo = fragmento
+        query, query_params = construir_query_sale_exercises(
+            ids, fecha_inicio=inicio.isoformat(sep=' '), fecha_fin=fin.isoformat(sep=' '), page_size=page_size,
+            cursor=cursor, keyset=True, columnas=columnas, fin_exclusivo=not ultimo
+        )
+        # ejecutar_query devolvería una lista vacía ante un error y la página quedaría incompleta
+        lotes = db_conn.ejecutar_query_stream(
+            query, query_params, tam_lote=tam_lote, como_tuplas=True, pool_timeout=espera_conexion
+        )
+        filas = []
+        try:
+            for lote in lotes:
+                filas.extend(lote)
+                if cancelada.is_set():
+                    break
+        finally:
+            # Cortada a mitad de la lectura, la conexión se descarta (ejecutar_query_stream)
+            lotes.close()
+        return filas
+
+    ejecutor = ThreadPoolExecutor(max_workers=concurrencia, thread_name_prefix='fragmento')
+    siguientes = iter(fragmentos)
+    en_vuelo = deque(ejecutor.submit(leer, fragmento) for fragmento in itertools.islice(siguientes, concurrencia))
+    restantes = page_size
+    try:
+        while en_vuelo and restantes > 0:
+            with medir('fetch'):
+                filas = en_vuelo.popleft().result()
+            contar_filas_leidas(len(filas))
+            # El siguiente fragmento se lanza antes de entregar éste, para que su lectura se
+            # superponga con el procesamiento del llamador
+            fragmento = next(siguientes, None)
+            if fragmento is not None:
+                en_vuelo.append(ejecutor.submit(leer, fragmento))
+            filas = filas[:restantes]
+            restantes -= len(filas)
+            if filas:
+                yield filas
+    finally:
+        # Los fragmentos sin empezar se cancelan y los que se están leyendo paran en su siguiente
+        # lote; se espera a que devuelvan la conexión antes de terminar
+        cancelada.set()
+        ejecutor.shutdown(wait=True, cancel_futures=True)
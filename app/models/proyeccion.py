@@ -0,0 +1,56 @@
+import re
+from functools import lru_cache
+from models.sale_exercises_query import COLUMNAS_SALE_EXERCISES
+
+# Proyección de campos (parámetro fields=). Cada modelo declara un catálogo con las columnas crudas
+# y la etapa de procesamiento que necesita cada campo de salida; a partir de los campos pedidos se
+# arma la lista mínima de columnas del SELECT y el conjunto mínimo de etapas. Los campos que se
+# repiten por pregunta (Pregunta1, Criterio_2, ...) se piden por familia (Pregunta, Criterio) o
+# uno por uno (Pregunta3).
+
+# Etapas de procesamiento que dependen de los blobs de sale_exercises
+ETAPA_SCORE_DATA = 'extraer_score_data'
+ETAPA_RETRO_CONTENTS = 'extraer_retro_contents'
+ETAPA_CLOSING_CONTENTS = 'extraer_closing_contents'
+
+# Columnas que se leen siempre: las usan la paginación por cursor y el almacén incremental
+COLUMNAS_CLAVE = ('saex_id', 'saex_useCases', 'saex_DateTime')
+
+PATRON_CAMPO_NUMERADO = re.compile(r'^(.+?)_?(\d+)$')
+
+
+@lru_cache(maxsize=4096)
+def familia_campo(campo):
+    """
+    Familia de un campo numerado ('Pregunta3' -> 'Pregunta', 'Puntos_Max_2' -> 'Puntos_Max'),
+    o None si el campo no termina en número.
+    """
+    coincidencia = PATRON_CAMPO_NUMERADO.match(campo)
+    return coincidencia.group(1) if coincidencia else None
+
+
+class Proyeccion:
+    """
+    Campos pedidos a un modelo. `catalogo` asocia cada campo o familia con (columnas crudas, etapa);
+    la etapa es None si el campo sale directo de una columna. Lanza ValueError si algún campo no
+    existe en el catálogo.
+    """
+
+    def __init__(self, campos, catalogo, columnas_base=COLUMNAS_CLAVE):
+        desconocidos = [c for c in campos if c not in catalogo and familia_campo(c) not in catalogo]
+        if desconocidos:
+            raise ValueError(f"Campos no válidos: {', '.join(desconocidos)}. "
+                             f"Disponibles: {', '.join(catalogo)}")
+
+        self.campos = frozenset(campos)
+        entradas = [catalogo[c] if c in catalogo else catalogo[familia_campo(c)] for c in campos]
+        requeridas = set(columnas_base).union(*(columnas for columnas, _ in entradas))
+        # Mismo orden que la consulta completa
+        self.columnas = [c for c in COLUMNAS_SALE_EXERCISES if c in requeridas]
+        self.etapas = frozenset(etapa for _, etapa in entradas if etapa)
+
+    def incluye(self, clave):
+        return clave in self.campos or familia_campo(clave) in self.campos
+
+    def filtrar(self, registro):
+        return {clave: valor for clave, valor in registro.items() if self.incluye(clave)}
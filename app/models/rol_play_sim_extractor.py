@@ -1,239 +1,474 @@
-import re
-import json
-from datetime import datetime
-from utils.logger import logger
-
-class RolPlaySimExtractor:
-    def __init__(self, db_conn):
-        self.db_conn = db_conn
-        self.datos_finales = []
-
-    def get_data_paginated(self, ids, fecha_inicio=None, fecha_fin=None, page=1, page_size=10000):
-        self.datos_finales = []
-        offset = (page - 1) * page_size
-        format_strings = ','.join(['%s'] * len(ids))
-        date_filter = ""
-        query_params = list(ids)
-        if fecha_inicio and fecha_fin:
-            date_filter = "AND saex_DateTime BETWEEN %s AND %s"
-            query_params.extend([fecha_inicio, fecha_fin])
-
-        query = f"""
-            SELECT 
-                saex_id, saex_user, saex_useCases, saex_useCasesTitle,
-                saex_username, saex_retroContents, saex_closingContents,
-                saex_DateTime, saex_iterations, saex_score, saex_scoreData,
-                saex_sold, saex_rp_id, saex_rp_email, saex_rp_activity,
-                saex_rp_client
-            FROM sale_exercises
-            WHERE saex_useCases IN ({format_strings})
-            {date_filter}
-            LIMIT %s OFFSET %s"""
-
-        query_params.extend([page_size, offset])
-
-        try:
-            resultado = self.db_conn.ejecutar_query(query, tuple(query_params))
-            if resultado:
-                self.procesar_resultados(resultado)
-                return self.datos_finales
-            else:
-                logger.info("No se encontraron resultados para los IDs proporcionados.")
-                return []
-        except Exception as e:
-            logger.error(f"Error al obtener datos paginados: {e}")
-            return []
-
-    def procesar_resultados(self, resultados):
-        for resultado_original in resultados:
-            resultado = resultado_original.copy()
-            self.convertir_fechas_a_iso(resultado)
-            self.extraer_score_data(resultado)
-            self.extraer_retro_contents(resultado)
-            self.extraer_closing_contents(resultado)
-            resultado_final = self.construir_resultado_final(resultado)
-            self.datos_finales.append(resultado_final)
-
-    def convertir_fechas_a_iso(self, resultado):
-        for key, value in resultado.items():
-            if isinstance(value, datetime):
-                resultado[key] = value.isoformat()
-
-    def safe_parse_json(self, json_str, default_value=None):
-        if not json_str:
-            return default_value or {}
-        try:
-            return json.loads(json_str)
-        except json.JSONDecodeError as e:
-            logger.error(f"Error al parsear JSON: {e}")
-            return default_value or {}
-
-    def extraer_score_data(self, resultado):
-        score_data_str = resultado.get('saex_scoreData', None)
-        if score_data_str:
-            score_data = self.safe_parse_json(score_data_str, {})
-            resultado['Puntos_Totales'] = score_data.get('sum', "")
-            resultado['Calificación'] = score_data.get('avg', "")
-        else:
-            resultado['Puntos_Totales'] = ""
-            resultado['Calificación'] = ""
-
-    def contar_preguntas(self, retro_contents):
-        if not retro_contents:
-            return 0
-        numeros = [int(k) for k in retro_contents.keys() if k.isdigit()]
-        return max(numeros) if numeros else 0
-
-    def extraer_info_correcta(self, retro_prompt):
-        if not retro_prompt:
-            return "No aplica"
-        
-        texto_limpio = self.limpiar_texto_html(retro_prompt).lower()
-        
-        patrones_si = [
-            r'¿has cumplido satisfactoriamente.*?:\s*<span class="uppercase">si</span>',
-            r'¿has cumplido satisfactoriamente.*?:\s*<span class="uppercase">sí</span>',
-            r'¿la información fue correcta\?.*?:\s*<span class="uppercase">si</span>',
-            r'¿la información fue correcta\?.*?:\s*<span class="uppercase">sí</span>',
-            r'cumplido satisfactoriamente.*?si[\s\.<]',
-            r'información.*?correcta.*?si[\s\.<]',
-            r'criterios.*?evaluación.*?si[\s\.<]'
-        ]
-        
-        patrones_no = [
-            r'¿has cumplido satisfactoriamente.*?:\s*<span class="uppercase">no</span>',
-            r'¿la información fue correcta\?.*?:\s*<span class="uppercase">no</span>',
-            r'cumplido satisfactoriamente.*?no[\s\.<]',
-            r'información.*?correcta.*?no[\s\.<]',
-            r'criterios.*?evaluación.*?no[\s\.<]'
-        ]
-
-        for patron in patrones_si:
-            if re.search(patron, texto_limpio, re.IGNORECASE | re.DOTALL):
-                return "si"
-        
-        for patron in patrones_no:
-            if re.search(patron, texto_limpio, re.IGNORECASE | re.DOTALL):
-                return "no"
-
-        return "No aplica"
-
-    def extraer_puntos(self, retro_prompt):
-        if not retro_prompt:
-            return "No aplica"
-        
-        patrones_puntos = [
-            r'<b>puntaje</b>:\s*(\d+)\s*pts?(?:\s*/\s*\d+)?',
-            r'puntaje:\s*(\d+)\s*pts?(?:\s*/\s*\d+)?',
-            r'(\d+)\s*pts?(?:\s*/\s*\d+\s*pts?)',
-            r'puntuación:\s*(\d+)'
-        ]
-        
-        for patron in patrones_puntos:
-            match = re.search(patron, retro_prompt, re.IGNORECASE)
-            if match:
-                return match.group(1).strip()
-                
-        return "No aplica"
-
-    def limpiar_texto_html(self, texto):
-        if not texto:
-            return ""
-        texto = texto.lower()
-        texto = texto.replace('\r\n', ' ').replace('\n', ' ').replace('<br>', ' ').replace('</br>', ' ')
-        texto = re.sub(r'<[^>]+>', ' ', texto)
-        texto = ' '.join(texto.split())
-        texto = texto.replace('\u00a0', ' ').replace('&nbsp;', ' ')
-        texto = texto.replace('sí', 'si')
-        return texto.strip()
-
-    def extraer_retro_contents(self, resultado):
-        retro_contents_str = resultado.get('saex_retroContents', None)
-        retro_contents = self.safe_parse_json(retro_contents_str, {})
-        num_preguntas = self.contar_preguntas(retro_contents)
-
-        for i in range(1, num_preguntas + 1):
-            resultado[f'Pregunta{i}'] = "No aplica"
-            resultado[f'Respuesta{i}'] = "No aplica"
-            resultado[f'Resp_Modelo{i}'] = "No aplica"
-            resultado[f'Info_Correcta{i}'] = "No aplica"
-            resultado[f'Puntos{i}'] = "No aplica"
-
-        if retro_contents_str:
-            for i in range(1, num_preguntas + 1):
-                contenido_pregunta = retro_contents.get(str(i), {})
-                resultado[f'Pregunta{i}'] = contenido_pregunta.get('question', 'No aplica').strip()
-                respuesta = contenido_pregunta.get('answer', 'No aplica').strip()
-                resultado[f'Respuesta{i}'] = respuesta if respuesta else "No aplica"
-
-                retro_prompt = contenido_pregunta.get('retroPrompt', '')
-                if retro_prompt:
-                    retro_prompt = retro_prompt.replace("\r\n", " ").replace("\n", " ").replace("<br>", " ").replace("</br>", " ").strip()
-                    modelo_match = re.search(r'<b>respuesta modelo</b>:\s*(.*?)(?=<b>|$)', retro_prompt, re.IGNORECASE)
-                    resultado[f'Resp_Modelo{i}'] = modelo_match.group(1).strip() if modelo_match else "No aplica"
-                    resultado[f'Info_Correcta{i}'] = self.extraer_info_correcta(retro_prompt)
-                    resultado[f'Puntos{i}'] = contenido_pregunta.get('puntos', 'No aplica')
-
-    def extraer_closing_contents(self, resultado):
-        closing_contents_str = resultado.get('saex_closingContents', None)
-        retro_contents = self.safe_parse_json(resultado.get('saex_retroContents', '{}'), {})
-        num_preguntas = self.contar_preguntas(retro_contents)
-
-        for i in range(1, num_preguntas + 1):
-            resultado[f'Venta{i}'] = "No aplica"
-
-        if closing_contents_str:
-            try:
-                closing_contents_str = closing_contents_str.replace("\r\n", " ").replace("\n", " ").strip()
-                closing_contents = re.findall(r'<p class="answer">(.*?)</p>', closing_contents_str)
-
-                for i, respuesta in enumerate(closing_contents[:num_preguntas]):
-                    respuesta_limpia = self.limpiar_texto_html(respuesta)
-                    
-                    if not respuesta_limpia:
-                        continue
-
-                    if respuesta_limpia.lower().strip() in ['si', 'no']:
-                        resultado[f'Venta{i + 1}'] = respuesta_limpia.lower()
-                        continue
-
-                    puntos_match = re.search(r'(\d+)\s*/\s*(\d+)\s*pts', respuesta_limpia)
-                    if puntos_match:
-                        resultado[f'Venta{i + 1}'] = f"{puntos_match.group(1)}/{puntos_match.group(2)} pts"
-                        continue
-
-                    if len(respuesta_limpia) > 100:
-                        palabras = respuesta_limpia[:97].rsplit(' ', 1)[0]
-                        resultado[f'Venta{i + 1}'] = f"{palabras}..."
-                    else:
-                        resultado[f'Venta{i + 1}'] = respuesta_limpia
-
-            except Exception as e:
-                logger.error(f"Error al procesar saex_closingContents: {e}")
-
-    def construir_resultado_final(self, resultado):
-        resultado_final = {
-            'ID_Caso_de_Uso': resultado.get('saex_useCases', 'No aplica'),
-            'Cliente': resultado.get('saex_rp_client', 'No aplica'),
-            'Usuario': resultado.get('saex_rp_email', 'No aplica'),
-            'Usuario Nombre': resultado.get('saex_username', 'No aplica'),
-            'Fecha_y_Hora': resultado.get('saex_DateTime', 'No aplica'),
-            'Actividad_Nombre': resultado.get('saex_rp_activity', 'No aplica'),
-            'ID_Sim': resultado.get('saex_id', 'No aplica'),
-            'Puntos_Totales': resultado.get('Puntos_Totales', 'No aplica'),
-            'Calificacion': resultado.get('Calificación', 'No aplica'),
-            'Caso_de_Uso_Nombre': resultado.get('saex_useCasesTitle', 'No aplica'),
-        }
-
-        retro_contents = self.safe_parse_json(resultado.get('saex_retroContents', '{}'), {})
-        num_preguntas = self.contar_preguntas(retro_contents)
-
-        for i in range(1, num_preguntas + 1):
-            resultado_final[f'Pregunta{i}'] = resultado.get(f'Pregunta{i}', 'No aplica')
-            resultado_final[f'Respuesta{i}'] = resultado.get(f'Respuesta{i}', 'No aplica')
-            resultado_final[f'Resp_Modelo{i}'] = resultado.get(f'Resp_Modelo{i}', 'No aplica')
-            resultado_final[f'Info_Correcta{i}'] = resultado.get(f'Info_Correcta{i}', 'No aplica')
-            resultado_final[f'Puntos{i}'] = resultado.get(f'Puntos{i}', 'No aplica')
-            resultado_final[f'Venta{i}'] = resultado.get(f'Venta{i}', 'No aplica')
-
-        return resultado_final
+import re
+import json
+from collections.abc import ItemsView, Mapping
+from datetime import datetime
+from functools import lru_cache, partial
+from mysql.connector.errors import PoolError
+from models.fragmentacion import leer_fragmentado
+from models.proyeccion import ETAPA_CLOSING_CONTENTS, ETAPA_RETRO_CONTENTS, ETAPA_SCORE_DATA, Proyeccion
+from models.sale_exercises_query import (
+    construir_query_delta, construir_query_sale_exercises, codificar_cursor, decodificar_marca_agua
+)
+from utils.cache_plantillas import analizar_retro_prompt, cache_respuestas_cierre
+from utils.clasificador_retro import clasificar_info_correcta, extraer_puntos, limpiar_texto_html
+from utils.fragmentos_html import extraer_fragmentos_cierre
+from utils.logger import logger, registrar_error_fila
+from utils.metricas import medir
+from utils.procesamiento_paralelo import procesar_en_bloques
+
+PATRON_PUNTOS_VENTA = re.compile(r'(\d+)\s*/\s*(\d+)\s*pts')
+
+# Nombre con el que este modelo guarda sus filas en el almacén incremental
+MODELO_ALMACEN = 'rol_play_sim'
+# Versión de las filas guardadas en el almacén: subirla al cambiar el procesamiento o los campos
+# de salida hace que el almacén las reconstruya
+VERSION_ALMACEN = 1
+
+# Campos que admite fields=: columnas crudas y etapa que necesita cada uno. Las familias por
+# pregunta necesitan saex_retroContents para conocer el número de preguntas.
+CAMPOS_ROL_PLAY = {
+    'ID_Caso_de_Uso': (('saex_useCases',), None),
+    'Cliente': (('saex_rp_client',), None),
+    'Usuario': (('saex_rp_email',), None),
+    'Usuario Nombre': (('saex_username',), None),
+    'Fecha_y_Hora': (('saex_DateTime',), None),
+    'Actividad_Nombre': (('saex_rp_activity',), None),
+    'ID_Sim': (('saex_id',), None),
+    'Puntos_Totales': (('saex_scoreData',), ETAPA_SCORE_DATA),
+    'Calificacion': (('saex_scoreData',), ETAPA_SCORE_DATA),
+    'Caso_de_Uso_Nombre': (('saex_useCasesTitle',), None),
+    'Pregunta': (('saex_retroContents',), ETAPA_RETRO_CONTENTS),
+    'Respuesta': (('saex_retroContents',), ETAPA_RETRO_CONTENTS),
+    'Resp_Modelo': (('saex_retroContents',), ETAPA_RETRO_CONTENTS),
+    'Info_Correcta': (('saex_retroContents',), ETAPA_RETRO_CONTENTS),
+    'Puntos': (('saex_retroContents',), ETAPA_RETRO_CONTENTS),
+    'Venta': (('saex_retroContents', 'saex_closingContents'), ETAPA_CLOSING_CONTENTS),
+}
+
+# Claves de salida en orden: las fijas y, por cada pregunta i, las de la familia con sufijo i
+CAMPOS_FIJOS_ROL_PLAY = (
+    'ID_Caso_de_Uso', 'Cliente', 'Usuario', 'Usuario Nombre', 'Fecha_y_Hora', 'Actividad_Nombre', 'ID_Sim',
+    'Puntos_Totales', 'Calificacion', 'Caso_de_Uso_Nombre',
+)
+CAMPOS_PREGUNTA_ROL_PLAY = ('Pregunta', 'Respuesta', 'Resp_Modelo', 'Info_Correcta', 'Puntos', 'Venta')
+(POS_PREGUNTA, POS_RESPUESTA, POS_RESP_MODELO, POS_INFO_CORRECTA, POS_PUNTOS,
+ POS_VENTA) = range(len(CAMPOS_PREGUNTA_ROL_PLAY))
+POS_PUNTOS_TOTALES = CAMPOS_FIJOS_ROL_PLAY.index('Puntos_Totales')
+POS_CALIFICACION = CAMPOS_FIJOS_ROL_PLAY.index('Calificacion')
+
+
+class RolPlaySimExtractor:
+    def __init__(self, db_conn, campos=None):
+        """
+        `campos` (parámetro fields=) limita la salida a esos campos y la consulta y el
+        procesamiento a lo que necesitan; None devuelve todos. Lanza ValueError si algún campo no
+        existe.
+        """
+        self.db_conn = db_conn
+        self.datos_finales = []
+        self.campos = tuple(campos) if campos else None
+        self.proyeccion = Proyeccion(self.campos, CAMPOS_ROL_PLAY) if self.campos else None
+        self.columnas = self.proyeccion.columnas if self.proyeccion else None
+
+    def requiere(self, etapa):
+        return self.proyeccion is None or etapa in self.proyeccion.etapas
+
+    def get_data_paginated(self, ids, fecha_inicio=None, fecha_fin=None, page=1, page_size=10000, por_id=False):
+        self.datos_finales = []
+        query, query_params = construir_query_sale_exercises(
+            ids, fecha_inicio=fecha_inicio, fecha_fin=fecha_fin, page=page, page_size=page_size,
+            columnas=self.columnas, por_id=por_id
+        )
+
+        try:
+            resultado = self.db_conn.ejecutar_query(query, query_params, como_tuplas=True)
+            if resultado:
+                self.procesar_resultados(resultado)
+                return self.datos_finales
+            else:
+                logger.info("No se encontraron resultados para los IDs proporcionados.")
+                return []
+        except PoolError:
+            # Sin conexión libre: la ruta responde 503
+            raise
+        except Exception as e:
+            logger.error("Error al obtener datos paginados: %s", e)
+            return []
+
+    def get_data_cursor(self, ids, fecha_inicio=None, fecha_fin=None, cursor=None, page_size=10000):
+        """
+        Paginación por keyset sobre (saex_DateTime, saex_id). `cursor` es la tupla devuelta por
+        decodificar_cursor (None para la primera página). Devuelve (datos, next_cursor); next_cursor
+        es None cuando ya no hay más páginas.
+        """
+        self.datos_finales = []
+        query, query_params = construir_query_sale_exercises(
+            ids, fecha_inicio=fecha_inicio, fecha_fin=fecha_fin, page_size=page_size, cursor=cursor, keyset=True,
+            columnas=self.columnas
+        )
+
+        try:
+            resultado = self.db_conn.ejecutar_query(query, query_params, como_tuplas=True)
+            if resultado:
+                next_cursor = codificar_cursor(resultado[-1]) if len(resultado) == page_size else None
+                self.procesar_resultados(resultado)
+                return self.datos_finales, next_cursor
+            else:
+                logger.info("No se encontraron resultados para los IDs proporcionados.")
+                return [], None
+        except PoolError:
+            # Sin conexión libre: la ruta responde 503
+            raise
+        except Exception as e:
+            logger.error("Error al obtener datos por cursor: %s", e)
+            return [], None
+
+    def get_data_delta(self, ids, since, fecha_inicio=None, fecha_fin=None, page_size=10000, ventana=0):
+        """
+        Filas agregadas después de la marca de agua `since` (saex_id o fecha ISO, ver
+        decodificar_marca_agua), a lo sumo page_size, en orden de saex_id. Devuelve
+        (datos, marca_agua, hay_mas): marca_agua es el saex_id de la última fila entregada (o el
+        mismo since si no hubo filas nuevas) y es lo que el cliente envía en la siguiente consulta.
+        Lanza ValueError si since no es válido.
+
+        Con un saex_id como since también se entregan de nuevo las filas de los `ventana` saex_id
+        anteriores (ver construir_query_delta), para no perder las que se confirmaron tarde: el
+        cliente descarta por ID_Sim las que ya tenía.
+        """
+        desde_id, desde_fecha = decodificar_marca_agua(since)
+        query, query_params = construir_query_delta(
+            ids, desde_id=desde_id, desde_fecha=desde_fecha, fecha_inicio=fecha_inicio, fecha_fin=fecha_fin,
+            limite=page_size, columnas=self.columnas, ventana=ventana
+        )
+
+        # Ante un error ejecutar_query devuelve una lista vacía: la marca no avanza y el cliente
+        # vuelve a pedir lo mismo en la siguiente consulta
+        resultado = self.db_conn.ejecutar_query(query, query_params, como_tuplas=True)
+        if not resultado:
+            return [], desde_id if desde_id is not None else since, False
+        if desde_id is None:
+            nuevas = len(resultado)
+        else:
+            # La consulta pide page_size + ventana filas; si la ventana no las usa todas, sobran
+            # filas nuevas que se dejan para la siguiente consulta
+            repetidas = sum(1 for fila in resultado if fila['saex_id'] <= desde_id)
+            resultado = resultado[:repetidas + page_size]
+            nuevas = len(resultado) - repetidas
+        marca_agua = resultado[-1]['saex_id'] if nuevas else desde_id
+        self.datos_finales = []
+        self.procesar_resultados(resultado)
+        return self.datos_finales, marca_agua, nuevas == page_size
+
+    def get_data_fragmentado(self, ids, fecha_inicio, fecha_fin, dias, cursor=None, page_size=10000, concurrencia=3,
+                             espera_conexion=5):
+        """
+        Misma página que get_data_cursor, pero el rango de fechas se lee dividido en fragmentos de
+        `dias` días consultados en paralelo (models/fragmentacion.py); cada fragmento se procesa
+        mientras se leen los siguientes. Devuelve (datos, next_cursor).
+        """
+        self.datos_finales = []
+        leidas = 0
+        ultima = None
+        try:
+            for filas in leer_fragmentado(
+                self.db_conn, ids, fecha_inicio, fecha_fin, dias, page_size, cursor=cursor,
+                columnas=self.columnas, concurrencia=concurrencia, espera_conexion=espera_conexion
+            ):
+                leidas += len(filas)
+                ultima = filas[-1]
+                self.procesar_resultados(filas)
+        except PoolError:
+            # Sin conexión libre: la ruta responde 503
+            raise
+        except Exception as e:
+            logger.error("Error al obtener datos fragmentados: %s", e)
+            return [], None
+
+        if not leidas:
+            logger.info("No se encontraron resultados para los IDs proporcionados.")
+        next_cursor = codificar_cursor(ultima) if leidas == page_size else None
+        return self.datos_finales, next_cursor
+
+    def iterar_lotes(self, ids, fecha_inicio=None, fecha_fin=None, page=1, page_size=10000, tam_lote=1000):
+        """
+        Versión en streaming de get_data_paginated: lee la página con un cursor sin buffer y
+        entrega los resultados procesados lote a lote, sin acumular la página completa.
+        """
+        query, query_params = construir_query_sale_exercises(
+            ids, fecha_inicio=fecha_inicio, fecha_fin=fecha_fin, page=page, page_size=page_size,
+            columnas=self.columnas
+        )
+
+        for lote in self.db_conn.ejecutar_query_stream(query, query_params, tam_lote=tam_lote, como_tuplas=True):
+            self.datos_finales = []
+            self.procesar_resultados(lote)
+            yield self.datos_finales
+        self.datos_finales = []
+
+    def get_data_almacen(self, almacen, ids, fecha_inicio=None, fecha_fin=None, page=1, page_size=10000):
+        """
+        Igual que get_data_paginated, pero servido desde el almacén incremental: primero se
+        procesan sólo los ejercicios posteriores a la marca de agua de cada caso de uso y después
+        la página se lee del índice local. Si el almacén no alcanza a ponerse al día en esta
+        solicitud (ver AlmacenIncremental.sincronizar), la página se lee de MySQL. Lanza ValueError
+        si las fechas no tienen formato ISO. El almacén guarda las filas completas; la proyección
+        de campos se aplica al leer.
+        """
+        completo = RolPlaySimExtractor(self.db_conn) if self.proyeccion else self
+        if not almacen.sincronizar(MODELO_ALMACEN, ids, self.db_conn, completo.procesar_para_almacen,
+                                   version=VERSION_ALMACEN):
+            return self.get_data_paginated(ids, fecha_inicio=fecha_inicio, fecha_fin=fecha_fin, page=page,
+                                           page_size=page_size, por_id=True)
+        pagina = [RegistroRolPlay(valores) for valores in almacen.consultar(
+            MODELO_ALMACEN, ids, fecha_inicio=fecha_inicio, fecha_fin=fecha_fin, page=page, page_size=page_size
+        )]
+        return [self.proyeccion.filtrar(registro) for registro in pagina] if self.proyeccion else pagina
+
+    def procesar_para_almacen(self, filas_crudas):
+        # El almacén guarda sólo los valores de cada registro, en el orden de esquema_registro
+        self.datos_finales = []
+        self.procesar_resultados(filas_crudas)
+        procesadas, self.datos_finales = self.datos_finales, []
+        return [registro.valores for registro in procesadas]
+
+    def procesar_resultados(self, resultados):
+        """
+        Procesa las filas crudas y agrega los resultados a self.datos_finales. Las páginas grandes
+        se reparten en bloques entre el pool de procesos del worker, si está activo.
+        """
+        with medir('procesar'):
+            self.datos_finales.extend(
+                procesar_en_bloques(resultados, partial(procesar_bloque_rol_play, campos=self.campos))
+            )
+
+    def procesar_bloque(self, resultados):
+        """
+        Pipeline de una sola pasada: cada fila cruda se decodifica una vez (parsear_fila) y todas
+        las etapas reutilizan ese resultado intermedio para completar el resultado final. Con
+        proyección sólo corren las etapas de los campos pedidos.
+        """
+        score_data = self.requiere(ETAPA_SCORE_DATA)
+        retro_contents = self.requiere(ETAPA_RETRO_CONTENTS)
+        closing_contents = self.requiere(ETAPA_CLOSING_CONTENTS)
+        por_pregunta = retro_contents or closing_contents
+
+        procesados = []
+        for resultado_original in resultados:
+            fila = self.parsear_fila(resultado_original) if por_pregunta else FilaParseada(resultado_original, {}, 0)
+            resultado_final = self.construir_resultado_final(fila)
+            if score_data:
+                self.extraer_score_data(fila, resultado_final)
+            if retro_contents:
+                self.extraer_retro_contents(fila, resultado_final)
+            if closing_contents:
+                self.extraer_closing_contents(fila, resultado_final)
+            procesados.append(self.proyeccion.filtrar(resultado_final) if self.proyeccion else resultado_final)
+        return procesados
+
+    def parsear_fila(self, resultado):
+        retro_contents = self.safe_parse_json(resultado.get('saex_retroContents', None), {}, origen='saex_retroContents')
+        return FilaParseada(resultado, retro_contents, self.contar_preguntas(retro_contents))
+
+    def valor_iso(self, valor):
+        if isinstance(valor, datetime):
+            return valor.isoformat()
+        return valor
+
+    def safe_parse_json(self, json_str, default_value=None, origen='JSON'):
+        if not json_str:
+            return default_value or {}
+        try:
+            return json.loads(json_str)
+        except json.JSONDecodeError as e:
+            registrar_error_fila(origen, e)
+            return default_value or {}
+
+    def extraer_score_data(self, fila, resultado_final):
+        valores = resultado_final.valores
+        score_data_str = fila.fila.get('saex_scoreData', None)
+        if score_data_str:
+            score_data = self.safe_parse_json(score_data_str, {}, origen='saex_scoreData')
+            valores[POS_PUNTOS_TOTALES] = score_data.get('sum', "")
+            valores[POS_CALIFICACION] = score_data.get('avg', "")
+        else:
+            valores[POS_PUNTOS_TOTALES] = ""
+            valores[POS_CALIFICACION] = ""
+
+    def contar_preguntas(self, retro_contents):
+        if not retro_contents:
+            return 0
+        numeros = [int(k) for k in retro_contents.keys() if k.isdigit()]
+        return max(numeros) if numeros else 0
+
+    def extraer_info_correcta(self, retro_prompt):
+        return clasificar_info_correcta(retro_prompt)
+
+    def extraer_puntos(self, retro_prompt):
+        return extraer_puntos(retro_prompt)
+
+    def limpiar_texto_html(self, texto):
+        return limpiar_texto_html(texto)
+
+    def extraer_retro_contents(self, fila, resultado_final):
+        if not fila.fila.get('saex_retroContents', None):
+            return
+
+        retro_contents = fila.retro_contents
+        valores = resultado_final.valores
+        for i in range(1, fila.num_preguntas + 1):
+            base = posicion_pregunta(i)
+            contenido_pregunta = retro_contents.get(str(i), {})
+            valores[base + POS_PREGUNTA] = contenido_pregunta.get('question', 'No aplica').strip()
+            respuesta = contenido_pregunta.get('answer', 'No aplica').strip()
+            valores[base + POS_RESPUESTA] = respuesta if respuesta else "No aplica"
+
+            retro_prompt = contenido_pregunta.get('retroPrompt', '')
+            if retro_prompt:
+                plantilla = analizar_retro_prompt(retro_prompt)
+                valores[base + POS_RESP_MODELO] = plantilla.resp_modelo if plantilla.resp_modelo is not None else "No aplica"
+                valores[base + POS_INFO_CORRECTA] = plantilla.info_correcta
+                valores[base + POS_PUNTOS] = contenido_pregunta.get('puntos', 'No aplica')
+
+    def extraer_closing_contents(self, fila, resultado_final):
+        closing_contents_str = fila.fila.get('saex_closingContents', None)
+        num_preguntas = fila.num_preguntas
+
+        if closing_contents_str:
+            try:
+                # Los saltos de línea se cambian por espacios antes de buscar, como siempre se hizo
+                closing_contents_str = closing_contents_str.replace("\r\n", " ").replace("\n", " ")
+                _, respuestas = extraer_fragmentos_cierre(closing_contents_str, literal=True)
+
+                for i, respuesta in enumerate(respuestas[:num_preguntas]):
+                    venta = cache_respuestas_cierre.obtener_o_calcular(respuesta, self.clasificar_venta)
+                    resultado_final.valores[posicion_pregunta(i + 1) + POS_VENTA] = venta
+
+            except Exception as e:
+                registrar_error_fila('saex_closingContents', e)
+
+    def clasificar_venta(self, respuesta):
+        respuesta_limpia = self.limpiar_texto_html(respuesta)
+
+        if not respuesta_limpia:
+            return "No aplica"
+
+        if respuesta_limpia.lower().strip() in ['si', 'no']:
+            return respuesta_limpia.lower()
+
+        puntos_match = PATRON_PUNTOS_VENTA.search(respuesta_limpia)
+        if puntos_match:
+            return f"{puntos_match.group(1)}/{puntos_match.group(2)} pts"
+
+        if len(respuesta_limpia) > 100:
+            palabras = respuesta_limpia[:97].rsplit(' ', 1)[0]
+            return f"{palabras}..."
+        return respuesta_limpia
+
+    def construir_resultado_final(self, fila):
+        """
+        Crea el registro de salida con todas sus claves en el orden de salida; las columnas por
+        pregunta arrancan en "No aplica" y las etapas de extracción las van completando.
+        """
+        resultado = fila.fila
+        valores = [
+            self.valor_iso(resultado.get('saex_useCases', 'No aplica')),
+            self.valor_iso(resultado.get('saex_rp_client', 'No aplica')),
+            self.valor_iso(resultado.get('saex_rp_email', 'No aplica')),
+            self.valor_iso(resultado.get('saex_username', 'No aplica')),
+            self.valor_iso(resultado.get('saex_DateTime', 'No aplica')),
+            self.valor_iso(resultado.get('saex_rp_activity', 'No aplica')),
+            self.valor_iso(resultado.get('saex_id', 'No aplica')),
+            'No aplica',
+            'No aplica',
+            self.valor_iso(resultado.get('saex_useCasesTitle', 'No aplica')),
+        ]
+        valores.extend(['No aplica'] * (len(CAMPOS_PREGUNTA_ROL_PLAY) * fila.num_preguntas))
+        return RegistroRolPlay(valores)
+
+
+class FilaParseada:
+    """
+    Resultado intermedio de una fila cruda: saex_retroContents decodificado una sola vez y el
+    número de preguntas. La fila original no se copia ni se modifica.
+    """
+    __slots__ = ('fila', 'retro_contents', 'num_preguntas')
+
+    def __init__(self, fila, retro_contents, num_preguntas):
+        self.fila = fila
+        self.retro_contents = retro_contents
+        self.num_preguntas = num_preguntas
+
+
+def posicion_pregunta(i):
+    # Posición en RegistroRolPlay.valores del primer campo de la pregunta i (desde 1)
+    return len(CAMPOS_FIJOS_ROL_PLAY) + len(CAMPOS_PREGUNTA_ROL_PLAY) * (i - 1)
+
+
+@lru_cache(maxsize=None)
+def esquema_registro(num_preguntas):
+    """
+    Claves de salida de un registro con num_preguntas preguntas y su índice (clave -> posición).
+    Se calculan una vez por número de preguntas y las comparten todos los registros.
+    """
+    claves = CAMPOS_FIJOS_ROL_PLAY + tuple(
+        f'{campo}{i}' for i in range(1, num_preguntas + 1) for campo in CAMPOS_PREGUNTA_ROL_PLAY
+    )
+    return claves, {clave: posicion for posicion, clave in enumerate(claves)}
+
+
+class RegistroRolPlay(Mapping):
+    """
+    Registro de salida compacto: los valores en una lista, en el orden de las claves de salida;
+    las claves salen de esquema_registro. Se comporta como un dict de sólo lectura (get, items,
+    iteración en orden) y se serializa igual que el dict equivalente.
+    """
+    __slots__ = ('valores',)
+
+    def __init__(self, valores):
+        self.valores = valores
+
+    def _esquema(self):
+        return esquema_registro((len(self.valores) - len(CAMPOS_FIJOS_ROL_PLAY)) // len(CAMPOS_PREGUNTA_ROL_PLAY))
+
+    def __getitem__(self, clave):
+        return self.valores[self._esquema()[1][clave]]
+
+    def get(self, clave, default=None):
+        posicion = self._esquema()[1].get(clave)
+        return default if posicion is None else self.valores[posicion]
+
+    def __contains__(self, clave):
+        return clave in self._esquema()[1]
+
+    def __iter__(self):
+        return iter(self._esquema()[0])
+
+    def __len__(self):
+        return len(self.valores)
+
+    def items(self):
+        return ItemsRegistro(self)
+
+    def __eq__(self, otro):
+        if isinstance(otro, RegistroRolPlay):
+            return self.valores == otro.valores
+        return super().__eq__(otro)
+
+    __hash__ = None
+
+    def __reduce__(self):
+        return RegistroRolPlay, (self.valores,)
+
+    def __repr__(self):
+        return f"RegistroRolPlay({dict(self.items())!r})"
+
+
+class ItemsRegistro(ItemsView):
+    # Recorre claves y valores en paralelo, sin buscar cada clave en el índice
+    def __iter__(self):
+        return zip(self._mapping._esquema()[0], self._mapping.valores)
+
+
+def procesar_bloque_rol_play(filas, campos=None):
+    # Punto de entrada de los procesos del pool: no necesita conexión a la base de datos
+    return RolPlaySimExtractor(None, campos=campos).procesar_bloque(filas)
@@ -0,0 +1,375 @@
+import base64
+import binascii
+import json
+from datetime import datetime
+
+# Columnas que leen los extractores de la tabla sale_exercises
+COLUMNAS_SALE_EXERCISES = [
+    'saex_id',
+    'saex_user',
+    'saex_useCases',
+    'saex_useCasesTitle',
+    'saex_username',
+    'saex_retroContents',
+    'saex_closingContents',
+    'saex_DateTime',
+    'saex_iterations',
+    'saex_score',
+    'saex_scoreData',
+    'saex_sold',
+    'saex_rp_id',
+    'saex_rp_email',
+    'saex_rp_activity',
+    'saex_rp_client',
+]
+
+
+# Dimensiones de /api/aggregates: expresión SQL para GROUP BY y columna cruda equivalente
+DIMENSIONES_AGREGADOS = {
+    'use_case': ('saex_useCases', 'saex_useCases'),
+    'caso_de_uso': ('saex_useCasesTitle', 'saex_useCasesTitle'),
+    'actividad': ('saex_rp_activity', 'saex_rp_activity'),
+    'usuario': ('saex_rp_email', 'saex_rp_email'),
+    'dia': ('DATE(saex_DateTime)', 'saex_DateTime'),
+}
+
+# Métricas de /api/aggregates que se resuelven completamente en MySQL
+_CALIFICACION = "CAST(JSON_UNQUOTE(JSON_EXTRACT(saex_scoreData, '$.avg')) AS DECIMAL(14,4))"
+_PUNTOS_TOTALES = "CAST(JSON_UNQUOTE(JSON_EXTRACT(saex_scoreData, '$.sum')) AS DECIMAL(14,4))"
+METRICAS_SQL_AGREGADOS = {
+    'conteo': "COUNT(*)",
+    'usuarios_distintos': "COUNT(DISTINCT saex_user)",
+    'promedio_score': "AVG(saex_score)",
+    'promedio_calificacion': f"AVG(CASE WHEN JSON_VALID(saex_scoreData) THEN {_CALIFICACION} END)",
+    'suma_puntos_totales': f"SUM(CASE WHEN JSON_VALID(saex_scoreData) THEN {_PUNTOS_TOTALES} END)",
+    'tasa_venta': "AVG(CASE WHEN saex_sold IS NULL THEN NULL WHEN saex_sold = 1 THEN 1 ELSE 0 END)",
+}
+
+
+# Variante de plantilla de la dimensión de actividades (construir_query_representantes_dimension).
+# Los blobs se reducen en MySQL a lo que usa la dimensión, de modo que dos ejercicios con la misma
+# reducción dan la misma actividad y los textos propios de cada ejercicio no separan grupos:
+#
+# - saex_retroContents: cada retroPrompt con la forma de la plantilla ("<p><b>Criterio a
+#   evaluar</b>: ...</p> <p><b>Puntaje</b>: N pts / M pts</p>...") se recorta a su criterio y su
+#   puntaje máximo, lo único que lee analizar_retro_prompt para la dimensión (el criterio no tiene
+#   "<" ni escapes, así que termina en su </p>, y no hay otro Puntaje antes). Los valores de
+#   "question", "answer" y "puntos" se reemplazan por "". Sólo se reemplazan cadenas y números JSON
+#   válidos por otro valor válido: un blob inválido sigue siéndolo. Un retroPrompt con otra forma
+#   queda completo (separa más grupos, pero no cambia el resultado).
+# - saex_closingContents: si el HTML es sólo una secuencia de <p class="question">texto</p>,
+#   <p class="answer">texto</p> (sin etiquetas dentro) y <div class="item"> que los envuelven, cada
+#   pregunta es exactamente su texto y se quitan las respuestas. Con cualquier otra forma el
+#   ejercicio forma su propio grupo y se lee completo.
+# Resto de una cadena JSON hasta su comilla de cierre, con los escapes válidos (en forma de bucle
+# desenrollado: sin alternar por carácter, que en blobs de varios KB es lo que más cuesta)
+_RESTO_CADENA_JSON = r'[^"\\\x00-\x1f]*(?:\\(?:["\\/bfnrt]|u[0-9a-fA-F]{4})[^"\\\x00-\x1f]*)*"'
+_CADENA_JSON = '"' + _RESTO_CADENA_JSON
+_NUMERO_JSON = r'-?(?:0|[1-9][0-9]*)(?:\.[0-9]+)?(?:[eE][+-]?[0-9]+)?'
+_PATRON_RETRO_PROMPT = (
+    r'("retroPrompt"\s*:\s*"<p><b>Criterio a evaluar</b>:[^<"\\\x00-\x1f]*</p>(?:\\[rn]| )*<p><b>Puntaje</b>: *)'
+    r'[0-9]+( *pts */ *[0-9]+ *pts</p>)' + _RESTO_CADENA_JSON
+)
+_REEMPLAZO_RETRO_PROMPT = '$1$2"'
+_PATRON_RETRO_POR_EJERCICIO = rf'("(?:question|answer|puntos)"\s*:\s*)(?:{_CADENA_JSON}|{_NUMERO_JSON})'
+_REEMPLAZO_RETRO_POR_EJERCICIO = '$1""'
+_FORMA_CIERRE = r'^(?:\s|<div class="item">|</div>|<p class="(?:question|answer)">[^<]*</p>)*$'
+_PATRON_RESPUESTAS_CIERRE = r'<p class="answer">[^<]*</p>'
+
+
+def filtros_base(ids, fecha_inicio=None, fecha_fin=None, fin_exclusivo=False):
+    """
+    Condiciones comunes a todas las consultas: saex_useCases IN (...) y, si se reciben ambas
+    fechas, saex_DateTime BETWEEN (o el intervalo semiabierto [inicio, fin) con fin_exclusivo,
+    para que los sub-rangos contiguos de un rango fragmentado no compartan filas).
+    Devuelve (lista de condiciones, lista de parámetros).
+    """
+    format_strings = ','.join(['%s'] * len(ids))
+    query_params = list(ids)
+
+    filtros = [f"saex_useCases IN ({format_strings})"]
+    if fecha_inicio and fecha_fin:
+        if fin_exclusivo:
+            filtros.append("saex_DateTime >= %s AND saex_DateTime < %s")
+        else:
+            filtros.append("saex_DateTime BETWEEN %s AND %s")
+        query_params.extend([fecha_inicio, fecha_fin])
+
+    return filtros, query_params
+
+
+def construir_query_sale_exercises(ids, fecha_inicio=None, fecha_fin=None, page=1, page_size=10000,
+                                   cursor=None, keyset=False, columnas=None, fin_exclusivo=False, por_id=False):
+    """
+    Construye la consulta sobre sale_exercises filtrada por saex_useCases y opcionalmente por saex_DateTime.
+
+    Con keyset=False pagina con LIMIT/OFFSET (comportamiento histórico), sin orden o, con
+    por_id=True, en orden de saex_id como las páginas del almacén incremental.
+    Con keyset=True ordena por (saex_DateTime, saex_id) y, si se recibe cursor (tupla fecha, id
+    devuelta por decodificar_cursor), continúa justo después de esa posición. El costo de cada
+    página es el mismo sin importar su profundidad. `columnas` reemplaza la lista completa de
+    COLUMNAS_SALE_EXERCISES (proyección de campos) y fin_exclusivo excluye fecha_fin del rango
+    (ver filtros_base). Devuelve (query, params).
+    """
+    filtros, query_params = filtros_base(ids, fecha_inicio, fecha_fin, fin_exclusivo=fin_exclusivo)
+
+    if keyset:
+        # Las filas sin fecha no se pueden ubicar con el cursor, así que no entran en este modo
+        filtros.append("saex_DateTime IS NOT NULL")
+        if cursor:
+            fecha_cursor, id_cursor = cursor
+            filtros.append("(saex_DateTime > %s OR (saex_DateTime = %s AND saex_id > %s))")
+            query_params.extend([fecha_cursor, fecha_cursor, id_cursor])
+        paginacion = "ORDER BY saex_DateTime, saex_id\n            LIMIT %s"
+        query_params.append(page_size)
+    else:
+        paginacion = "ORDER BY saex_id\n            LIMIT %s OFFSET %s" if por_id else "LIMIT %s OFFSET %s"
+        query_params.extend([page_size, (page - 1) * page_size])
+
+    columnas = ',\n                '.join(columnas or COLUMNAS_SALE_EXERCISES)
+    condiciones = '\n                AND '.join(filtros)
+
+    query = f"""
+            SELECT
+                {columnas}
+            FROM
+                sale_exercises
+            WHERE
+                {condiciones}
+            {paginacion}
+        """
+
+    return query, tuple(query_params)
+
+
+def construir_query_representantes_dimension(ids, fecha_inicio=None, fecha_fin=None, variantes_retro=True,
+                                             variantes_cierre=True):
+    """
+    Agrupa los ejercicios por (saex_useCases, saex_useCasesTitle, saex_rp_activity) y por variante
+    de plantilla, y devuelve el primer y el último saex_id de cada grupo. La variante es el MD5 de
+    los blobs reducidos a lo que usa la dimensión (ver _PATRON_RETRO_PROMPT y _FORMA_CIERRE): dos
+    ejercicios del mismo grupo dan la misma actividad. Con variantes_retro=False o
+    variantes_cierre=False (fields= sin Criterio/Puntos_Max o sin Veredicto_Venta) ese blob no
+    separa grupos. Sólo viajan enteros: los blobs nunca salen del servidor.
+    """
+    filtros, query_params = filtros_base(ids, fecha_inicio, fecha_fin)
+    # Mismo criterio que el filtro de actividades válidas de DimActividadesExtractor
+    filtros.append("saex_rp_activity IS NOT NULL AND saex_rp_activity NOT IN ('', 'No aplica')")
+    condiciones = '\n                AND '.join(filtros)
+
+    agrupar = ['saex_useCases', 'saex_useCasesTitle', 'saex_rp_activity']
+    parametros_agrupar = []
+    if variantes_retro:
+        agrupar.append("MD5(REGEXP_REPLACE(REGEXP_REPLACE(saex_retroContents, %s, %s), %s, %s))")
+        parametros_agrupar += [_PATRON_RETRO_PROMPT, _REEMPLAZO_RETRO_PROMPT,
+                               _PATRON_RETRO_POR_EJERCICIO, _REEMPLAZO_RETRO_POR_EJERCICIO]
+    if variantes_cierre:
+        agrupar.append(
+            "CASE WHEN REGEXP_LIKE(COALESCE(saex_closingContents, ''), %s)"
+            " THEN MD5(REGEXP_REPLACE(saex_closingContents, %s, ''))"
+            " ELSE CAST(saex_id AS CHAR) END"
+        )
+        parametros_agrupar += [_FORMA_CIERRE, _PATRON_RESPUESTAS_CIERRE]
+    # GROUP BY va después del WHERE: sus parámetros también
+    query_params.extend(parametros_agrupar)
+    agrupacion = ',\n                '.join(agrupar)
+
+    query = f"""
+            SELECT
+                MIN(saex_id) AS primer_id,
+                MAX(saex_id) AS ultimo_id
+            FROM
+                sale_exercises
+            WHERE
+                {condiciones}
+            GROUP BY
+                {agrupacion}
+        """
+
+    return query, tuple(query_params)
+
+
+def construir_query_por_ids(saex_ids, columnas=None):
+    """
+    Lee las filas de los saex_id indicados, en orden de saex_id, con todas las columnas o sólo
+    las de `columnas`.
+    """
+    format_strings = ','.join(['%s'] * len(saex_ids))
+    columnas = ',\n                '.join(columnas or COLUMNAS_SALE_EXERCISES)
+
+    query = f"""
+            SELECT
+                {columnas}
+            FROM
+                sale_exercises
+            WHERE
+                saex_id IN ({format_strings})
+            ORDER BY saex_id
+        """
+
+    return query, tuple(saex_ids)
+
+
+def construir_query_agregados(ids, dimensiones, metricas, fecha_inicio=None, fecha_fin=None):
+    """
+    GROUP BY de las dimensiones indicadas con las métricas de METRICAS_SQL_AGREGADOS. Cada
+    dimensión y métrica se devuelve con su nombre como alias.
+    """
+    filtros, query_params = filtros_base(ids, fecha_inicio, fecha_fin)
+    seleccion = [f"{DIMENSIONES_AGREGADOS[d][0]} AS {d}" for d in dimensiones]
+    seleccion += [f"{METRICAS_SQL_AGREGADOS[m]} AS {m}" for m in metricas]
+    columnas = ',\n                '.join(seleccion)
+    condiciones = '\n                AND '.join(filtros)
+    agrupacion = f"\n            GROUP BY {', '.join(dimensiones)}" if dimensiones else ''
+
+    query = f"""
+            SELECT
+                {columnas}
+            FROM
+                sale_exercises
+            WHERE
+                {condiciones}{agrupacion}
+        """
+
+    return query, tuple(query_params)
+
+
+def construir_query_blobs_agregados(ids, dimensiones, fecha_inicio=None, fecha_fin=None):
+    """
+    Columnas crudas de las dimensiones y saex_retroContents, para calcular en una sola pasada las
+    métricas que dependen del contenido de los blobs.
+    """
+    filtros, query_params = filtros_base(ids, fecha_inicio, fecha_fin)
+    columnas_dimensiones = list(dict.fromkeys(DIMENSIONES_AGREGADOS[d][1] for d in dimensiones))
+    columnas = ',\n                '.join(columnas_dimensiones + ['saex_retroContents'])
+    condiciones = '\n                AND '.join(filtros)
+
+    query = f"""
+            SELECT
+                {columnas}
+            FROM
+                sale_exercises
+            WHERE
+                {condiciones}
+        """
+
+    return query, tuple(query_params)
+
+
+def construir_query_delta(ids, desde_id=None, desde_fecha=None, fecha_inicio=None, fecha_fin=None,
+                          limite=10000, columnas=None, ventana=0):
+    """
+    Ejercicios agregados después de una marca de agua (parámetro since), en orden de saex_id: los
+    de saex_id mayor que desde_id o, si se recibe desde_fecha, los de saex_DateTime posterior. El
+    recorrido por llave primaria hace que el costo dependa de las filas nuevas y no del histórico.
+
+    Con desde_id también se vuelven a leer los `ventana` saex_id anteriores a la marca: un
+    saex_id se asigna al insertar y no al confirmar, así que una transacción lenta puede hacer
+    visible un saex_id menor que la marca ya entregada. Se piden `limite` + `ventana` filas para que
+    las de la ventana no quiten lugar a las nuevas; quien llama recorta las nuevas que sobren.
+    """
+    filtros, query_params = filtros_base(ids, fecha_inicio, fecha_fin)
+    if desde_fecha is not None:
+        filtros.append("saex_DateTime > %s")
+        query_params.append(desde_fecha)
+    else:
+        filtros.append("saex_id > %s")
+        query_params.append(max((desde_id or 0) - ventana, 0))
+        limite += ventana
+    query_params.append(limite)
+
+    columnas = ',\n                '.join(columnas or COLUMNAS_SALE_EXERCISES)
+    condiciones = '\n                AND '.join(filtros)
+
+    query = f"""
+            SELECT
+                {columnas}
+            FROM
+                sale_exercises
+            WHERE
+                {condiciones}
+            ORDER BY saex_id
+            LIMIT %s
+        """
+
+    return query, tuple(query_params)
+
+
+def decodificar_marca_agua(since):
+    """
+    Interpreta el parámetro since: un saex_id (entero) o una fecha ISO. Devuelve (desde_id, None)
+    o (None, 'YYYY-MM-DD HH:MM:SS'). Lanza ValueError si no es ninguna de las dos.
+    """
+    since = since.strip()
+    if since.isdigit():
+        return int(since), None
+    return None, datetime.fromisoformat(since).isoformat(sep=' ')
+
+
+def construir_query_incremental(use_case, ultimo_id, limite):
+    """
+    Ejercicios de un caso de uso posteriores a la marca de agua `ultimo_id`, en orden de saex_id.
+    Recorre la llave primaria, así que cada sincronización lee sólo las filas nuevas.
+    """
+    columnas = ',\n                '.join(COLUMNAS_SALE_EXERCISES)
+
+    query = f"""
+            SELECT
+                {columnas}
+            FROM
+                sale_exercises
+            WHERE
+                saex_useCases = %s
+                AND saex_id > %s
+            ORDER BY saex_id
+            LIMIT %s
+        """
+
+    return query, (use_case, ultimo_id, limite)
+
+
+def construir_query_ids_incremental(use_case, desde_id, hasta_id):
+    """
+    Sólo los saex_id de un caso de uso en (desde_id, hasta_id]: con ellos el almacén incremental
+    detecta los ejercicios confirmados después de que su marca de agua los pasara.
+    """
+    query = """
+            SELECT
+                saex_id
+            FROM
+                sale_exercises
+            WHERE
+                saex_useCases = %s
+                AND saex_id > %s
+                AND saex_id <= %s
+        """
+
+    return query, (use_case, desde_id, hasta_id)
+
+
+def codificar_cursor(fila):
+    """
+    Genera el cursor opaco que apunta a la posición (saex_DateTime, saex_id) de una fila cruda.
+    """
+    fecha = fila.get('saex_DateTime')
+    if isinstance(fecha, datetime):
+        fecha = fecha.isoformat(sep=' ')
+    contenido = json.dumps([fecha, fila.get('saex_id')], separators=(',', ':'))
+    return base64.urlsafe_b64encode(contenido.encode('utf-8')).decode('ascii').rstrip('=')
+
+
+def decodificar_cursor(cursor):
+    """
+    Convierte un cursor recibido por el cliente en la tupla (fecha, saex_id).
+    Lanza ValueError si el cursor no es válido.
+    """
+    try:
+        relleno = '=' * (-len(cursor) % 4)
+        fecha, saex_id = json.loads(base64.urlsafe_b64decode(cursor + relleno).decode('utf-8'))
+        if not isinstance(saex_id, int):
+            raise TypeError(saex_id)
+        datetime.fromisoformat(fecha)
+    except (binascii.Error, UnicodeDecodeError, TypeError, ValueError) as e:
+        raise ValueError(f"Cursor inválido: {cursor}") from e
+
+    return fecha, saex_id
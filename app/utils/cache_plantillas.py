@@ -0,0 +1,115 @@
+import hashlib
+import re
+import threading
+from collections import OrderedDict, namedtuple
+
+from config.settings import CACHE_PLANTILLAS_MAX_ENTRADAS
+from utils.clasificador_retro import clasificar_info_correcta
+
+# Memoización de lo que se extrae de los retroPrompt y de los fragmentos de saex_closingContents.
+# Los textos de plantilla (criterio, puntaje máximo, respuesta modelo, preguntas de cierre) se repiten
+# en casi todas las filas de un mismo caso de uso; aquí se analizan una vez y se reutilizan. Las
+# claves son huellas blake2b de 16 bytes, así que el cache no retiene los textos originales.
+
+PATRON_CRITERIO = re.compile(r'<b>Criterio a evaluar</b>:\s*(.*?)(?=<p>|</p>|\r|\n)', re.DOTALL)
+PATRON_PUNTOS_MAX = re.compile(r'<b>Puntaje</b>:\s*\d+\s*pts\s*/\s*(\d+)\s*pts')
+PATRON_RESP_MODELO = re.compile(r'<b>respuesta modelo</b>:\s*(.*?)(?=<b>|$)', re.IGNORECASE)
+
+# Campos que se obtienen de un retroPrompt; None cuando el patrón no aparece
+PlantillaRetro = namedtuple('PlantillaRetro', ['criterio', 'puntos_max', 'resp_modelo', 'info_correcta'])
+
+_AUSENTE = object()
+
+
+def huella(texto):
+    return hashlib.blake2b(texto.encode('utf-8', 'surrogatepass'), digest_size=16).digest()
+
+
+class CacheLRU:
+    """
+    Cache LRU acotado a max_entradas, seguro entre hilos, con contadores de aciertos y fallos.
+    """
+
+    def __init__(self, nombre, max_entradas):
+        self.nombre = nombre
+        self.max_entradas = max_entradas
+        self._datos = OrderedDict()
+        self._lock = threading.Lock()
+        self._aciertos = 0
+        self._fallos = 0
+        self._expulsiones = 0
+
+    def obtener_o_calcular(self, texto, calcular):
+        """
+        Devuelve el valor memoizado para `texto` o lo calcula con calcular(texto) y lo guarda.
+        """
+        clave = huella(texto)
+        with self._lock:
+            valor = self._datos.get(clave, _AUSENTE)
+            if valor is not _AUSENTE:
+                self._datos.move_to_end(clave)
+                self._aciertos += 1
+                return valor
+            self._fallos += 1
+
+        valor = calcular(texto)
+
+        with self._lock:
+            self._datos[clave] = valor
+            if len(self._datos) > self.max_entradas:
+                self._datos.popitem(last=False)
+                self._expulsiones += 1
+        return valor
+
+    def limpiar(self):
+        with self._lock:
+            self._datos.clear()
+
+    def estadisticas(self):
+        with self._lock:
+            consultas = self._aciertos + self._fallos
+            return {
+                'entradas': len(self._datos),
+                'max_entradas': self.max_entradas,
+                'aciertos': self._aciertos,
+                'fallos': self._fallos,
+                'expulsiones': self._expulsiones,
+                'tasa_aciertos': round(self._aciertos / consultas, 4) if consultas else 0.0,
+            }
+
+
+cache_retro_prompts = CacheLRU('retro_prompts', CACHE_PLANTILLAS_MAX_ENTRADAS)
+cache_preguntas_cierre = CacheLRU('preguntas_cierre', CACHE_PLANTILLAS_MAX_ENTRADAS)
+cache_respuestas_cierre = CacheLRU('respuestas_cierre', CACHE_PLANTILLAS_MAX_ENTRADAS)
+
+CACHES_PLANTILLAS = (cache_retro_prompts, cache_preguntas_cierre, cache_respuestas_cierre)
+
+
+def normalizar_retro_prompt(retro_prompt):
+    return retro_prompt.replace("\r\n", " ").replace("\n", " ").replace("<br>", " ").replace("</br>", " ").strip()
+
+
+def _analizar_retro_prompt(retro_prompt):
+    retro_prompt = normalizar_retro_prompt(retro_prompt)
+
+    criterio_match = PATRON_CRITERIO.search(retro_prompt)
+    puntos_max_match = PATRON_PUNTOS_MAX.search(retro_prompt)
+    modelo_match = PATRON_RESP_MODELO.search(retro_prompt)
+
+    return PlantillaRetro(
+        criterio=criterio_match.group(1).strip() if criterio_match else None,
+        puntos_max=puntos_max_match.group(1).strip() if puntos_max_match else None,
+        resp_modelo=modelo_match.group(1).strip() if modelo_match else None,
+        info_correcta=clasificar_info_correcta(retro_prompt),
+    )
+
+
+def analizar_retro_prompt(retro_prompt):
+    """
+    Criterio, puntaje máximo, respuesta modelo e Info_Correcta de un retroPrompt, memoizados.
+    """
+    return cache_retro_prompts.obtener_o_calcular(retro_prompt, _analizar_retro_prompt)
+
+
+def estadisticas_caches():
+    return {cache.nombre: cache.estadisticas() for cache in CACHES_PLANTILLAS}
@@ -0,0 +1,190 @@
+import hashlib
+import json
+import os
+import tempfile
+import threading
+import time
+from collections import namedtuple
+from utils.logger import logger
+
+# Cache de respuestas en disco compartido por todos los workers de gunicorn. Cada entrada es un
+# archivo <clave>.resp con una primera línea JSON de metadatos (etag, mimetype, creada) seguida del
+# cuerpo tal como se envió. Las escrituras son atómicas (archivo temporal + os.replace), así que un
+# worker nunca lee una entrada a medio escribir. La fecha de modificación se actualiza en cada
+# acierto y la expulsión por tamaño elimina primero las entradas usadas hace más tiempo.
+
+EXTENSION = '.resp'
+
+EntradaRespuesta = namedtuple('EntradaRespuesta', ['etag', 'mimetype', 'ruta', 'inicio_cuerpo'])
+
+
+def clave_respuesta(ruta, ids, fecha_inicio, fecha_fin, page, page_size, **extras):
+    """
+    Clave de cache a partir de los parámetros ya normalizados: el orden y las repeticiones de los
+    id no cambian el resultado (se consultan con IN) y un rango con una sola fecha equivale a no
+    filtrar por fecha. Los parámetros extra en None no forman parte de la clave.
+    """
+    if not (fecha_inicio and fecha_fin):
+        fecha_inicio = fecha_fin = ''
+    normalizados = {
+        'ruta': ruta,
+        'ids': sorted(set(ids)),
+        'fecha_inicio': fecha_inicio,
+        'fecha_fin': fecha_fin,
+        'page': page,
+        'page_size': page_size,
+    }
+    normalizados.update({nombre: valor for nombre, valor in extras.items() if valor is not None})
+    contenido = json.dumps(normalizados, sort_keys=True, separators=(',', ':'), default=str)
+    return hashlib.sha256(contenido.encode('utf-8')).hexdigest()
+
+
+def calcular_etag(cuerpo):
+    return hashlib.blake2b(cuerpo, digest_size=16).hexdigest()
+
+
+class CacheRespuestas:
+    """
+    Cache de respuestas con TTL y tamaño máximo en bytes. Con ttl=0 queda desactivado.
+    Los contadores son del worker que atiende la solicitud.
+    """
+
+    def __init__(self, directorio, ttl=300, max_bytes=512 * 1024 * 1024):
+        self.directorio = directorio
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._aciertos = 0
+        self._fallos = 0
+        self._no_modificadas = 0
+        self._guardadas = 0
+        self._expulsiones = 0
+
+    @property
+    def activo(self):
+        return self.ttl > 0
+
+    def _ruta(self, clave):
+        return os.path.join(self.directorio, clave + EXTENSION)
+
+    def _contar(self, contador):
+        with self._lock:
+            setattr(self, contador, getattr(self, contador) + 1)
+
+    def obtener(self, clave):
+        """
+        Devuelve la EntradaRespuesta vigente para `clave` o None. Sólo se leen los metadatos;
+        el cuerpo se lee con leer_cuerpo cuando hace falta enviarlo.
+        """
+        if not self.activo:
+            return None
+        ruta = self._ruta(clave)
+        try:
+            with open(ruta, 'rb') as archivo:
+                cabecera = archivo.readline()
+            metadatos = json.loads(cabecera)
+        except (OSError, ValueError):
+            self._contar('_fallos')
+            return None
+
+        if time.time() - metadatos['creada'] > self.ttl:
+            self._eliminar(ruta)
+            self._contar('_fallos')
+            return None
+
+        try:
+            os.utime(ruta)
+        except OSError:
+            pass
+        self._contar('_aciertos')
+        return EntradaRespuesta(metadatos['etag'], metadatos['mimetype'], ruta, len(cabecera))
+
+    def leer_cuerpo(self, entrada):
+        """
+        Cuerpo de una entrada; None si otro worker la expulsó entre obtener() y esta lectura.
+        """
+        try:
+            with open(entrada.ruta, 'rb') as archivo:
+                archivo.seek(entrada.inicio_cuerpo)
+                return archivo.read()
+        except OSError:
+            return None
+
+    def registrar_no_modificada(self):
+        self._contar('_no_modificadas')
+
+    def guardar(self, clave, cuerpo, mimetype):
+        if not self.activo:
+            return
+        metadatos = {'etag': calcular_etag(cuerpo), 'mimetype': mimetype, 'creada': time.time()}
+        try:
+            os.makedirs(self.directorio, exist_ok=True)
+            descriptor, temporal = tempfile.mkstemp(dir=self.directorio, suffix='.tmp')
+            with os.fdopen(descriptor, 'wb') as archivo:
+                archivo.write(json.dumps(metadatos).encode('utf-8') + b'\n')
+                archivo.write(cuerpo)
+            os.replace(temporal, self._ruta(clave))
+        except OSError as e:
+            logger.warning("No se pudo guardar la respuesta en el cache: %s", e)
+            return
+        self._contar('_guardadas')
+        self._expulsar()
+
+    def _eliminar(self, ruta):
+        try:
+            os.remove(ruta)
+            return True
+        except OSError:
+            return False
+
+    def _expulsar(self):
+        """
+        Elimina las entradas vencidas y, si el total supera max_bytes, las menos usadas
+        recientemente hasta dejar el directorio en el 90% del máximo.
+        """
+        ahora = time.time()
+        entradas = []
+        total = 0
+        try:
+            with os.scandir(self.directorio) as iterador:
+                for entrada in iterador:
+                    if not entrada.name.endswith(EXTENSION):
+                        continue
+                    try:
+                        estado = entrada.stat()
+                    except OSError:
+                        continue
+                    entradas.append((estado.st_mtime, estado.st_size, entrada.path))
+                    total += estado.st_size
+        except OSError:
+            return
+
+        # Al ordenar por fecha de modificación las vencidas quedan primero
+        entradas.sort()
+        objetivo = self.max_bytes * 0.9 if total > self.max_bytes else total
+        expulsadas = 0
+        for modificada, tamano, ruta in entradas:
+            if total <= objetivo and ahora - modificada <= self.ttl:
+                break
+            if self._eliminar(ruta):
+                expulsadas += 1
+            total -= tamano
+
+        if expulsadas:
+            with self._lock:
+                self._expulsiones += expulsadas
+
+    def estadisticas(self):
+        with self._lock:
+            consultas = self._aciertos + self._fallos
+            return {
+                'directorio': self.directorio,
+                'ttl_s': self.ttl,
+                'max_bytes': self.max_bytes,
+                'aciertos': self._aciertos,
+                'fallos': self._fallos,
+                'no_modificadas': self._no_modificadas,
+                'guardadas': self._guardadas,
+                'expulsiones': self._expulsiones,
+                'tasa_aciertos': round(self._aciertos / consultas, 4) if consultas else 0.0,
+            }
@@ -0,0 +1,126 @@
+import re
+
+# Patrones precompilados para clasificar los retroPrompt de saex_retroContents.
+#
+# El clasificador histórico lanzaba hasta 12 re.search con `.*?` y DOTALL sobre el texto ya limpio.
+# Los patrones que buscaban <span class="uppercase"> o "sí" nunca podían coincidir, porque
+# limpiar_texto_html elimina todas las etiquetas y normaliza "sí" a "si". Los que quedan se reducen
+# a: una frase ancla seguida, en cualquier punto posterior, de "si"/"no" y un espacio, punto o "<".
+# Basta con ubicar el final más temprano de cualquier ancla y buscar el veredicto a partir de ahí.
+
+_ETIQUETA_HTML = re.compile(r'<[^>]+>')
+
+# Cada ancla es una secuencia de frases que deben aparecer en orden
+_ANCLAS_INFO_CORRECTA = (
+    ('cumplido satisfactoriamente',),
+    ('información', 'correcta'),
+    ('criterios', 'evaluación'),
+)
+
+_VEREDICTO_SI = re.compile(r'si[\s\.<]')
+_VEREDICTO_NO = re.compile(r'no[\s\.<]')
+
+# Los patrones históricos usaban IGNORECASE. Sobre texto ya en minúsculas sólo cambia algo si
+# aparecen "ı" o "ſ" (equivalen a "i" y "s" sin distinguir mayúsculas); en ese caso poco común se
+# usan estas versiones, más lentas que str.find.
+_CARACTERES_PLEGABLES = ('ı', 'ſ')
+_ANCLAS_IGNORECASE = tuple(
+    tuple(re.compile(re.escape(frase), re.IGNORECASE) for frase in ancla)
+    for ancla in _ANCLAS_INFO_CORRECTA
+)
+_VEREDICTO_SI_IGNORECASE = re.compile(r'si[\s\.<]', re.IGNORECASE)
+_VEREDICTO_NO_IGNORECASE = re.compile(r'no[\s\.<]', re.IGNORECASE)
+
+# Se prueban en orden: gana el primer patrón que coincida, no la primera posición del texto
+_PATRONES_PUNTOS = (
+    re.compile(r'<b>puntaje</b>:\s*(\d+)\s*pts?(?:\s*/\s*\d+)?', re.IGNORECASE),
+    re.compile(r'puntaje:\s*(\d+)\s*pts?(?:\s*/\s*\d+)?', re.IGNORECASE),
+    re.compile(r'(\d+)\s*pts?(?:\s*/\s*\d+\s*pts?)', re.IGNORECASE),
+    re.compile(r'puntuación:\s*(\d+)', re.IGNORECASE),
+)
+
+
+def limpiar_texto_html(texto):
+    """
+    Pasa el texto a minúsculas, elimina etiquetas HTML y normaliza espacios y "sí".
+    """
+    if not texto:
+        return ""
+    texto = texto.lower()
+    texto = texto.replace('\r\n', ' ').replace('\n', ' ').replace('<br>', ' ').replace('</br>', ' ')
+    texto = _ETIQUETA_HTML.sub(' ', texto)
+    texto = ' '.join(texto.split())
+    texto = texto.replace('\u00a0', ' ').replace('&nbsp;', ' ')
+    texto = texto.replace('sí', 'si')
+    return texto.strip()
+
+
+def _fin_primera_ancla(texto):
+    fin = None
+    for ancla in _ANCLAS_INFO_CORRECTA:
+        posicion = 0
+        for frase in ancla:
+            posicion = texto.find(frase, posicion)
+            if posicion < 0:
+                break
+            posicion += len(frase)
+        else:
+            if fin is None or posicion < fin:
+                fin = posicion
+    return fin
+
+
+def _fin_primera_ancla_ignorecase(texto):
+    fin = None
+    for ancla in _ANCLAS_IGNORECASE:
+        posicion = 0
+        for frase in ancla:
+            coincidencia = frase.search(texto, posicion)
+            if coincidencia is None:
+                break
+            posicion = coincidencia.end()
+        else:
+            if fin is None or posicion < fin:
+                fin = posicion
+    return fin
+
+
+def clasificar_info_correcta(retro_prompt):
+    """
+    Devuelve "si", "no" o "No aplica" según el veredicto del retroPrompt.
+    Un "si" después de cualquier ancla tiene prioridad sobre un "no".
+    """
+    if not retro_prompt:
+        return "No aplica"
+
+    texto_limpio = limpiar_texto_html(retro_prompt).lower()
+
+    if any(caracter in texto_limpio for caracter in _CARACTERES_PLEGABLES):
+        inicio = _fin_primera_ancla_ignorecase(texto_limpio)
+        veredicto_si, veredicto_no = _VEREDICTO_SI_IGNORECASE, _VEREDICTO_NO_IGNORECASE
+    else:
+        inicio = _fin_primera_ancla(texto_limpio)
+        veredicto_si, veredicto_no = _VEREDICTO_SI, _VEREDICTO_NO
+
+    if inicio is None:
+        return "No aplica"
+    if veredicto_si.search(texto_limpio, inicio):
+        return "si"
+    if veredicto_no.search(texto_limpio, inicio):
+        return "no"
+    return "No aplica"
+
+
+def extraer_puntos(retro_prompt):
+    """
+    Devuelve los puntos obtenidos que declara el retroPrompt, o "No aplica".
+    """
+    if not retro_prompt:
+        return "No aplica"
+
+    for patron in _PATRONES_PUNTOS:
+        match = patron.search(retro_prompt)
+        if match:
+            return match.group(1).strip()
+
+    return "No aplica"
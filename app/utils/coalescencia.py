@@ -0,0 +1,198 @@
+import fcntl
+import hashlib
+import os
+import threading
+import time
+from utils.logger import logger
+
+# Coalescencia de solicitudes idénticas en curso (single-flight), en dos niveles:
+#
+# - Dentro del worker: la primera solicitud con una clave ejecuta la extracción y las que llegan
+#   mientras tanto esperan su resultado. Sólo actúa si el worker atiende varias solicitudes a la vez
+#   (workers gthread o gevent); con workers sync, los de omisión, nunca hay dos en curso.
+# - Entre workers (directorio_candados): el líder toma un candado flock sobre un archivo propio de
+#   la clave. Un worker que encuentra el candado tomado espera a lo sumo espera_maxima segundos y
+#   después vuelve a consultar el cache de respuestas (revisar), donde el líder deja el resultado;
+#   si no está, lo calcula él mismo. Depende del cache de respuestas: sin él no hay nada que revisar.
+#
+# El líder borra el archivo de la clave al terminar, con el resultado ya publicado y antes de
+# soltar el candado, así que el directorio sólo tiene los archivos de las extracciones en curso. Un
+# worker que obtiene el candado de un archivo ya borrado sabe que el líder terminó.
+
+# Intervalo entre intentos de tomar un candado ocupado: empieza corto y se duplica hasta el máximo
+ESPERA_INICIAL = 0.01
+ESPERA_ENTRE_INTENTOS = 0.1
+
+
+class _LlamadaEnCurso:
+    __slots__ = ('terminada', 'resultado', 'excepcion')
+
+    def __init__(self):
+        self.terminada = threading.Event()
+        self.resultado = None
+        self.excepcion = None
+
+
+class Coalescedor:
+    """
+    Single-flight por clave. Con directorio_candados=None sólo coalesce dentro del worker.
+    """
+
+    def __init__(self, directorio_candados=None, espera_maxima=10):
+        self.directorio_candados = directorio_candados
+        self.espera_maxima = espera_maxima
+        self._lock = threading.Lock()
+        self._en_curso = {}
+        self._ejecutadas = 0
+        self._coalescidas = 0
+        self._esperas_entre_workers = 0
+        self._aciertos_tras_espera = 0
+        self._esperas_agotadas = 0
+
+    def ejecutar(self, clave, calcular, revisar=None):
+        """
+        Devuelve calcular() para `clave`, compartiendo el resultado con las solicitudes
+        concurrentes que usen la misma clave. `revisar()` se llama al tomar el candado entre
+        workers y tras una espera agotada; si devuelve algo distinto de None, ese valor se usa sin
+        calcular. Si calcular() lanza una excepción, todas las solicitudes que esperaban la reciben.
+        """
+        with self._lock:
+            llamada = self._en_curso.get(clave)
+            lider = llamada is None
+            if lider:
+                llamada = self._en_curso[clave] = _LlamadaEnCurso()
+            else:
+                self._coalescidas += 1
+
+        if not lider:
+            llamada.terminada.wait()
+            if llamada.excepcion is not None:
+                raise llamada.excepcion
+            return llamada.resultado
+
+        try:
+            llamada.resultado = self._ejecutar_con_candado(clave, calcular, revisar)
+        except BaseException as e:
+            llamada.excepcion = e
+            raise
+        finally:
+            with self._lock:
+                del self._en_curso[clave]
+            llamada.terminada.set()
+        return llamada.resultado
+
+    def _ejecutar_con_candado(self, clave, calcular, revisar):
+        if not self.directorio_candados:
+            return self._calcular(calcular)
+
+        ruta = self._ruta_candado(clave)
+        limite = time.monotonic() + self.espera_maxima
+        espero = False
+        while True:
+            try:
+                os.makedirs(self.directorio_candados, exist_ok=True)
+                descriptor = os.open(ruta, os.O_RDWR | os.O_CREAT, 0o644)
+            except OSError as e:
+                logger.warning("No se pudo abrir el candado de coalescencia: %s", e)
+                return self._calcular(calcular)
+
+            estado = self._tomar_candado(descriptor, limite)
+            if estado is None:
+                os.close(descriptor)
+                with self._lock:
+                    self._esperas_agotadas += 1
+                logger.warning("Se agotó la espera del candado de coalescencia tras %ss; se calcula sin esperar más",
+                               self.espera_maxima)
+                return self._revisar_o_calcular(calcular, revisar, espero=True)
+            espero = espero or not estado
+
+            if self._archivo_vigente(descriptor, ruta):
+                break
+            # El líder terminó y borró el archivo mientras se esperaba: su resultado ya está
+            # publicado. Si no se encuentra (falló o no se guarda), se compite por un archivo nuevo.
+            os.close(descriptor)
+            if revisar is not None:
+                resultado = revisar()
+                if resultado is not None:
+                    with self._lock:
+                        self._aciertos_tras_espera += 1
+                    return resultado
+
+        try:
+            # Aun sin esperar: otro worker pudo publicar el resultado entre la consulta del cache
+            # de la solicitud y la toma del candado
+            return self._revisar_o_calcular(calcular, revisar, espero)
+        finally:
+            # Se borra con el resultado ya publicado y antes de soltar el candado (al cerrar)
+            try:
+                os.unlink(ruta)
+            except OSError:
+                pass
+            os.close(descriptor)
+
+    def _revisar_o_calcular(self, calcular, revisar, espero):
+        if revisar is not None:
+            resultado = revisar()
+            if resultado is not None:
+                if espero:
+                    with self._lock:
+                        self._aciertos_tras_espera += 1
+                return resultado
+        return self._calcular(calcular)
+
+    def _tomar_candado(self, descriptor, limite):
+        """
+        Toma el flock exclusivo. Devuelve True si estaba libre, False si hubo que esperar a otro
+        worker y None si se llegó al `limite` (time.monotonic) sin obtenerlo.
+        """
+        try:
+            fcntl.flock(descriptor, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            return True
+        except BlockingIOError:
+            pass
+
+        with self._lock:
+            self._esperas_entre_workers += 1
+        intervalo = ESPERA_INICIAL
+        while True:
+            restante = limite - time.monotonic()
+            if restante <= 0:
+                return None
+            time.sleep(min(intervalo, restante))
+            intervalo = min(intervalo * 2, ESPERA_ENTRE_INTENTOS)
+            try:
+                fcntl.flock(descriptor, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                return False
+            except BlockingIOError:
+                continue
+
+    @staticmethod
+    def _archivo_vigente(descriptor, ruta):
+        # El candado tomado es el del archivo que está en la ruta (no uno ya borrado por su líder)
+        try:
+            actual = os.stat(ruta)
+        except FileNotFoundError:
+            return False
+        tomado = os.fstat(descriptor)
+        return (actual.st_dev, actual.st_ino) == (tomado.st_dev, tomado.st_ino)
+
+    def _ruta_candado(self, clave):
+        nombre = hashlib.blake2b(clave.encode('utf-8'), digest_size=16).hexdigest()
+        return os.path.join(self.directorio_candados, f"{nombre}.lock")
+
+    def _calcular(self, calcular):
+        with self._lock:
+            self._ejecutadas += 1
+        return calcular()
+
+    def estadisticas(self):
+        with self._lock:
+            return {
+                'entre_workers': bool(self.directorio_candados),
+                'en_curso': len(self._en_curso),
+                'ejecutadas': self._ejecutadas,
+                'coalescidas': self._coalescidas,
+                'esperas_entre_workers': self._esperas_entre_workers,
+                'aciertos_tras_espera': self._aciertos_tras_espera,
+                'esperas_agotadas': self._esperas_agotadas,
+            }
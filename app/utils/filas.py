@@ -0,0 +1,36 @@
+# Representación compacta de las filas crudas leídas de MySQL. Un cursor normal entrega tuplas;
+# FilaTupla les agrega acceso por nombre de columna a través de un índice (columna -> posición)
+# que se calcula una sola vez por consulta y comparten todas las filas. A diferencia del cursor con
+# dictionary=True, los nombres de columna no se repiten en cada fila.
+
+
+class FilaTupla:
+    """
+    Vista de sólo lectura de una fila: fila['col'] y fila.get('col', default) como en un dict.
+    """
+    __slots__ = ('valores', 'indice')
+
+    def __init__(self, valores, indice):
+        self.valores = valores
+        self.indice = indice
+
+    def __getitem__(self, columna):
+        return self.valores[self.indice[columna]]
+
+    def get(self, columna, default=None):
+        posicion = self.indice.get(columna)
+        return default if posicion is None else self.valores[posicion]
+
+    def __contains__(self, columna):
+        return columna in self.indice
+
+    def __repr__(self):
+        return f"FilaTupla({dict(zip(self.indice, self.valores))!r})"
+
+
+def filas_tupla(columnas, filas):
+    """
+    Envuelve las tuplas de un cursor normal; `columnas` es cursor.column_names.
+    """
+    indice = {columna: posicion for posicion, columna in enumerate(columnas)}
+    return [FilaTupla(valores, indice) for valores in filas]
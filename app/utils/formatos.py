@@ -0,0 +1,132 @@
+import csv
+import gzip
+import io
+import zlib
+from collections.abc import Mapping
+from flask.json.provider import DefaultJSONProvider
+
+# Serializadores incrementales para respuestas en streaming.
+# Reciben un iterable de lotes (listas de filas ya procesadas) y una función dumps
+# (normalmente app.json.dumps, para producir exactamente el mismo JSON que jsonify).
+
+
+class ProveedorJSON(DefaultJSONProvider):
+    """
+    Proveedor JSON de la app (jsonify y app.json.dumps): además de los tipos habituales serializa
+    los registros compactos de los modelos (Mapping, p. ej. RegistroRolPlay) como el dict equivalente.
+    """
+
+    @staticmethod
+    def default(o):
+        if isinstance(o, Mapping):
+            return dict(o.items())
+        return DefaultJSONProvider.default(o)
+
+
+def generar_ndjson(lotes, dumps):
+    """
+    Un objeto JSON por línea (application/x-ndjson). Se emite un bloque por lote.
+    """
+    for lote in lotes:
+        if lote:
+            yield ''.join(dumps(fila) + '\n' for fila in lote)
+
+
+def generar_json_array(lotes, dumps):
+    """
+    Un único arreglo JSON enviado por partes (chunked), equivalente a jsonify(lista).
+    """
+    yield '['
+    primero = True
+    for lote in lotes:
+        if not lote:
+            continue
+        bloque = ','.join(dumps(fila) for fila in lote)
+        yield bloque if primero else ',' + bloque
+        primero = False
+    yield ']'
+
+
+# Formatos alternativos para páginas completas (parámetro format). Las filas de RolPlaySimExtractor
+# repiten en cada objeto los nombres de sus columnas y valores como "No aplica"; el formato columnar
+# envía cada nombre una sola vez y reemplaza los textos repetidos por índices a un diccionario.
+# Una columna de textos se codifica con diccionario si tiene a lo sumo esta fracción de valores distintos
+UMBRAL_DICCIONARIO = 0.5
+
+# Codificaciones de contenido admitidas, en orden de preferencia ante la misma calidad
+CODIFICACIONES = ('gzip', 'deflate')
+
+
+def columnas_registros(registros):
+    """
+    Unión de las columnas de todos los registros, en el orden en que aparecen por primera vez.
+    """
+    columnas = {}
+    for registro in registros:
+        for columna in registro:
+            if columna not in columnas:
+                columnas[columna] = None
+    return list(columnas)
+
+
+def a_columnar(registros):
+    """
+    {"columnas": [...], "filas": n, "valores": {columna: [...]}, "diccionarios": {columna: [...]}}.
+    Los registros que no tienen una columna llevan null en su posición. En las columnas con
+    diccionario, valores[columna][i] es el índice del texto en diccionarios[columna] (o null).
+    """
+    columnas = columnas_registros(registros)
+    valores = {}
+    diccionarios = {}
+    for columna in columnas:
+        lista = [registro.get(columna) for registro in registros]
+        textos = [valor for valor in lista if valor is not None]
+        if textos and all(isinstance(valor, str) for valor in textos):
+            distintos = dict.fromkeys(textos)
+            if len(distintos) <= UMBRAL_DICCIONARIO * len(textos):
+                indices = {texto: i for i, texto in enumerate(distintos)}
+                lista = [None if valor is None else indices[valor] for valor in lista]
+                diccionarios[columna] = list(distintos)
+        valores[columna] = lista
+    return {'columnas': columnas, 'filas': len(registros), 'valores': valores, 'diccionarios': diccionarios}
+
+
+def generar_csv(registros, tam_bloque=1000):
+    """
+    CSV con encabezado (la unión de las columnas) emitido en bloques de tam_bloque filas. Las
+    columnas que faltan en un registro y los None quedan vacíos. Los registros de los extractores
+    sólo tienen valores escalares, así que no se convierte celda por celda.
+    """
+    columnas = columnas_registros(registros)
+    salida = io.StringIO()
+    escritor = csv.writer(salida, lineterminator='\r\n')
+    escritor.writerow(columnas)
+    for inicio in range(0, len(registros), tam_bloque):
+        bloque = registros[inicio:inicio + tam_bloque]
+        escritor.writerows([registro.get(columna) for columna in columnas] for registro in bloque)
+        yield salida.getvalue()
+        salida.seek(0)
+        salida.truncate()
+    if salida.tell():
+        yield salida.getvalue()
+
+
+def comprimir(cuerpo, codificacion, nivel=6):
+    if codificacion == 'gzip':
+        return gzip.compress(cuerpo, compresslevel=nivel, mtime=0)
+    return zlib.compress(cuerpo, nivel)
+
+
+def comprimir_stream(partes, codificacion, nivel=6):
+    """
+    Comprime un cuerpo enviado por partes. Cada parte se vacía con Z_SYNC_FLUSH para que el cliente
+    pueda descomprimir los lotes a medida que llegan.
+    """
+    compresor = zlib.compressobj(nivel, zlib.DEFLATED, 31 if codificacion == 'gzip' else 15)
+    for parte in partes:
+        if isinstance(parte, str):
+            parte = parte.encode('utf-8')
+        bloque = compresor.compress(parte) + compresor.flush(zlib.Z_SYNC_FLUSH)
+        if bloque:
+            yield bloque
+    yield compresor.flush()
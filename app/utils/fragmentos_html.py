@@ -0,0 +1,203 @@
+import re
+from html import unescape
+from html.parser import HTMLParser
+
+# Extractor de fragmentos de saex_closingContents. Sustituye al árbol completo de BeautifulSoup y a
+# las búsquedas con re.findall que cada extractor hacía por separado sobre el mismo HTML, y conserva
+# lo que encontraba cada uno:
+#
+# - DimActividadesExtractor (Veredicto_Venta*) usaba BeautifulSoup: extraer_fragmentos_cierre(texto).
+# - RolPlaySimExtractor (Venta*) y extract_key_questions_answers (que también usa
+#   BancoppelManager) usaban re.findall(r'<p class="answer">(.*?)</p>'):
+#   extraer_fragmentos_cierre(texto, literal=True). Sólo cuentan los <p> escritos exactamente así y
+#   cada fragmento termina en el primer "</p>" que le sigue; un <p> con comillas simples, varias
+#   clases o en mayúsculas no cuenta, y uno sin cerrar (contenido truncado) tampoco.
+#
+# Sin literal encuentra los mismos <p> que BeautifulSoup(html, 'html.parser').find_all('p', class_=...):
+# atributos en cualquier orden y con cualquier comilla, mayúsculas (<P CLASS=...>) y varias clases
+# ("question x"). Un <p> sin cerrar termina donde lo cierra el árbol de BeautifulSoup: al cerrarse un
+# elemento que lo contiene o al final del texto (contenido truncado).
+#
+# El contenido con la forma que escribe la plataforma (<p class="question">texto</p>, sin otras
+# etiquetas dentro del fragmento) se lee con búsquedas de texto. Cualquier otra forma se lee con el
+# HTMLParser de la biblioteca estándar, el mismo tokenizador que usaba BeautifulSoup, más lento que
+# la lectura directa pero sin construir el árbol.
+
+_CLASES_FRAGMENTO = ('question', 'answer')
+_APERTURA_FRAGMENTO = re.compile(r'<p class="(question|answer)">')
+_CIERRE_FRAGMENTO = '</p>'
+# Cada apertura con su fragmento hasta el primer "</p>", sin consumirlo: así una recorrida encuentra
+# las preguntas y las respuestas aunque se solapen, como dos re.findall por separado
+_FRAGMENTO_LITERAL = re.compile(r'<p class="(question|answer)">(?=(.*?)</p>)', re.DOTALL)
+
+# Un "<" que no abre una etiqueta simple (sin "<" ni ">" en sus atributos); la búsqueda adelantada
+# evita retroceder por el interior de cada etiqueta
+_ETIQUETA_IRREGULAR = re.compile(r'<(?=([^<>]*))\1(?:<|\Z)')
+# Cualquier apertura de <p>, en cualquier forma
+_APERTURA_P = re.compile(r'<p[\s/>]', re.IGNORECASE)
+# Elementos cuyo contenido html.parser no lee como marcado (según la versión de Python)
+_CONTENIDO_CRUDO = re.compile(
+    r'<(?:script|style|textarea|title|xmp|iframe|noembed|noframes|noscript|plaintext)[\s/>]',
+    re.IGNORECASE,
+)
+
+# Elementos sin contenido: BeautifulSoup los cierra al abrirlos y su etiqueta de cierre no tiene efecto
+_ELEMENTOS_VACIOS = frozenset((
+    'area', 'base', 'br', 'col', 'embed', 'hr', 'img', 'input', 'keygen', 'link', 'menuitem', 'meta',
+    'param', 'source', 'spacer', 'track', 'wbr', 'basefont', 'bgsound', 'command', 'frame', 'image',
+    'isindex', 'nextid',
+))
+
+# Lo que html.parser reconoce como marcado: <script> y <style> con su contenido (get_text no lo
+# incluye), etiquetas que empiezan con una letra (con ">" entre comillas en sus atributos),
+# comentarios, declaraciones e instrucciones de procesamiento. Un "<" suelto se conserva como texto.
+_MARCADO_HTML = re.compile(
+    r'<(script|style)(?:[\s/][^>]*)?>.*?(?:</\1\s*>|$)'
+    r'|<!--.*?-->'
+    r'|</?[a-zA-Z](?:"[^"]*"|\'[^\']*\'|[^>"\'])*>|</?[a-zA-Z][^>]*>'
+    r'|<![^>]*>|<\?[^>]*>',
+    re.DOTALL | re.IGNORECASE,
+)
+
+
+def _leer_forma_simple(texto):
+    """
+    Lectura directa del contenido con la forma habitual. Devuelve None si el texto tiene otra forma:
+    etiquetas con "<" o ">" en los atributos (o comentarios con marcado), elementos de contenido
+    crudo, aperturas de <p> escritas de otra manera, o un fragmento con etiquetas dentro o sin cerrar.
+    Con esas condiciones cada fragmento termina en su primer "</p>", igual que en el árbol.
+    """
+    if _ETIQUETA_IRREGULAR.search(texto) or _CONTENIDO_CRUDO.search(texto):
+        return None
+
+    fragmentos = {'question': [], 'answer': []}
+    aperturas = 0
+    for apertura in _APERTURA_FRAGMENTO.finditer(texto):
+        fin = texto.find('<', apertura.end())
+        if fin < 0 or not texto.startswith(_CIERRE_FRAGMENTO, fin):
+            return None
+        fragmentos[apertura.group(1)].append(texto[apertura.end():fin])
+        aperturas += 1
+
+    if aperturas != len(_APERTURA_P.findall(texto)):
+        return None
+    return fragmentos['question'], fragmentos['answer']
+
+
+def _clases_fragmento(clase):
+    """
+    Clases de fragmento de un <p> con el atributo class dado, como las compara BeautifulSoup: por
+    palabra o por el valor completo.
+    """
+    if clase is None:
+        return ()
+    palabras = clase.split()
+    return tuple(nombre for nombre in _CLASES_FRAGMENTO if nombre in palabras or clase == nombre)
+
+
+class _LectorFragmentos(HTMLParser):
+    """
+    Lectura con html.parser y las reglas del árbol de BeautifulSoup: no hay cierres implícitos, una
+    etiqueta de cierre cierra el elemento abierto más reciente con ese nombre (y los que contiene) y
+    se ignora si no hay ninguno, y al final del texto se cierra todo. Las posiciones de getpos() se
+    convierten en índices del texto para devolver el HTML interno original de cada fragmento.
+    """
+
+    def __init__(self, texto):
+        super().__init__(convert_charrefs=False)
+        self.texto = texto
+        self.inicios_linea = [0]
+        self.inicios_linea.extend(salto.end() for salto in re.finditer('\n', texto))
+        self.abiertos = []  # (etiqueta, fragmento o None)
+        self.fragmentos = []  # [clases, inicio, fin]
+
+    def _posicion(self):
+        linea, columna = self.getpos()
+        return self.inicios_linea[linea - 1] + columna
+
+    def handle_starttag(self, tag, attrs):
+        if tag in _ELEMENTOS_VACIOS:
+            return
+        fragmento = None
+        if tag == 'p':
+            clase = None
+            for nombre, valor in attrs:
+                if nombre == 'class':
+                    clase = valor or ''
+            clases = _clases_fragmento(clase)
+            if clases:
+                fragmento = [clases, self._posicion() + len(self.get_starttag_text()), None]
+                self.fragmentos.append(fragmento)
+        self.abiertos.append((tag, fragmento))
+
+    def handle_startendtag(self, tag, attrs):
+        self.handle_starttag(tag, attrs)
+        if tag not in _ELEMENTOS_VACIOS:
+            self._cerrar(len(self.abiertos) - 1, self._posicion() + len(self.get_starttag_text()))
+
+    def handle_endtag(self, tag):
+        for indice in range(len(self.abiertos) - 1, -1, -1):
+            if self.abiertos[indice][0] == tag:
+                self._cerrar(indice, self._posicion())
+                return
+
+    def _cerrar(self, indice, posicion):
+        for _, fragmento in self.abiertos[indice:]:
+            if fragmento is not None:
+                fragmento[2] = posicion
+        del self.abiertos[indice:]
+
+    def resultado(self):
+        self._cerrar(0, len(self.texto))
+        fragmentos = {'question': [], 'answer': []}
+        for clases, inicio, fin in self.fragmentos:
+            for clase in clases:
+                fragmentos[clase].append(self.texto[inicio:fin])
+        return fragmentos['question'], fragmentos['answer']
+
+
+def _leer_html_parser(texto):
+    lector = _LectorFragmentos(texto)
+    lector.feed(texto)
+    lector.close()
+    return lector.resultado()
+
+
+def _leer_literal(texto):
+    fragmentos = {'question': [], 'answer': []}
+    # Por clase, dónde terminó el último fragmento: re.findall sigue buscando después de su "</p>"
+    siguiente = {'question': 0, 'answer': 0}
+    for apertura in _FRAGMENTO_LITERAL.finditer(texto):
+        clase = apertura.group(1)
+        if apertura.start() >= siguiente[clase]:
+            fragmentos[clase].append(apertura.group(2))
+            siguiente[clase] = apertura.end(2) + len(_CIERRE_FRAGMENTO)
+    return fragmentos['question'], fragmentos['answer']
+
+
+def extraer_fragmentos_cierre(closing_contents, literal=False):
+    """
+    Devuelve (preguntas, respuestas): el HTML interno de cada <p> con clase "question" y "answer",
+    en orden de aparición, de los mismos elementos que encuentra
+    BeautifulSoup(closing_contents, 'html.parser').find_all('p', class_=...). Con literal=True, los
+    mismos que re.findall(r'<p class="question">(.*?)</p>', closing_contents, re.DOTALL) y su par
+    con "answer", en una sola recorrida.
+    """
+    if not closing_contents:
+        return [], []
+    if literal:
+        return _leer_literal(closing_contents)
+    fragmentos = _leer_forma_simple(closing_contents)
+    if fragmentos is None:
+        fragmentos = _leer_html_parser(closing_contents)
+    return fragmentos
+
+
+def texto_plano(fragmento):
+    """
+    Texto de un fragmento HTML con el mismo resultado que BeautifulSoup(...).get_text(strip=True):
+    cada nodo de texto se decodifica, se recorta y se concatena sin separador.
+    """
+    # split intercala el grupo de <script>/<style>; el texto queda en las posiciones pares
+    partes = (unescape(texto).strip() for texto in _MARCADO_HTML.split(fragmento)[::2])
+    return ''.join(parte for parte in partes if parte)
@@ -1,17 +1,223 @@
-import logging
-import os
-
-# Create a directory for logs if it doesn't exist
-if not os.path.exists('logs'):
-    os.makedirs('logs')
-
-# Basic logging configuration for file and console
-logging.basicConfig(
-    level=logging.DEBUG,
-    format='%(asctime)s %(levelname)s: %(message)s',
-    handlers=[
-        logging.FileHandler("logs/app.log"),  # Save to file
-        logging.StreamHandler()  # Also output to console
-    ]
-)
-logger = logging.getLogger(__name__)
+import atexit
+import logging
+import os
+import queue
+from contextlib import contextmanager
+from contextvars import ContextVar
+from logging.handlers import QueueHandler, QueueListener
+
+from config.settings import LOG_LEVEL, MODO_COOPERATIVO
+
+# Logging asíncrono: los requests sólo encolan el registro (QueueHandler) y un hilo del proceso
+# (QueueListener) le da formato y lo escribe en el archivo y la consola, así la escritura en disco
+# no bloquea la solicitud. Los mensajes usan formato %-diferido (logger.debug("... %s", valor)): con
+# un nivel superior al del mensaje no se construye el texto.
+#
+# El hilo del listener no sobrevive a un fork (workers de gunicorn, procesos del pool paralelo): se
+# vuelve a crear en el hijo con una cola nueva. En los workers gevent se crea después del parche de
+# gevent (reiniciar_listener): un hilo nativo arrancado antes del parche no termina limpiamente. Al
+# terminar el proceso se vacía la cola (atexit).
+
+# Create a directory for logs if it doesn't exist
+if not os.path.exists('logs'):
+    os.makedirs('logs')
+
+# Nombres que acepta Logger.setLevel (logging.getLevelNamesMapping no existe en Python 3.9). Con
+# otro valor en LOG_LEVEL se registra una advertencia y se usa el nivel por omisión
+NIVELES_LOG = ('CRITICAL', 'FATAL', 'ERROR', 'WARNING', 'WARN', 'INFO', 'DEBUG', 'NOTSET')
+NIVEL_LOG_POR_OMISION = 'DEBUG'
+
+_formato = logging.Formatter('%(asctime)s %(levelname)s: %(message)s')
+_destinos = [
+    logging.FileHandler("logs/app.log"),  # Save to file
+    logging.StreamHandler()  # Also output to console
+]
+for _destino in _destinos:
+    _destino.setFormatter(_formato)
+
+_manejador = QueueHandler(queue.SimpleQueue())
+_listener = None
+_pid_listener = None
+
+
+def iniciar_listener():
+    """
+    Arranca el hilo que escribe los registros encolados. En un proceso hijo recién creado con fork
+    reemplaza la cola y el listener heredados (su hilo no existe en el hijo).
+    """
+    global _listener, _pid_listener
+    _manejador.queue = queue.SimpleQueue()
+    _listener = QueueListener(_manejador.queue, *_destinos, respect_handler_level=True)
+    _listener.start()
+    _pid_listener = os.getpid()
+
+
+def reiniciar_listener():
+    """
+    Vuelve a crear la cola y el listener, por ejemplo con las primitivas ya parcheadas por gevent.
+    Los registros encolados mientras tanto pasan a la cola nueva.
+    """
+    pendientes = _manejador.queue
+    iniciar_listener()
+    while not pendientes.empty():
+        _manejador.queue.put_nowait(pendientes.get_nowait())
+
+
+def _despues_de_fork():
+    global _listener, _pid_listener
+    if MODO_COOPERATIVO:
+        # Se encola hasta que activar_modo_cooperativo llame a reiniciar_listener
+        _manejador.queue = queue.SimpleQueue()
+        _listener = None
+        _pid_listener = None
+    else:
+        iniciar_listener()
+
+
+def detener_listener():
+    # Escribe lo que quede en la cola; sólo el proceso que arrancó el listener puede detenerlo
+    global _listener
+    if _listener is not None and _pid_listener == os.getpid():
+        _listener.stop()
+    _listener = None
+
+
+_raiz = logging.getLogger()
+_raiz.setLevel(LOG_LEVEL if LOG_LEVEL in NIVELES_LOG else NIVEL_LOG_POR_OMISION)
+_raiz.addHandler(_manejador)
+iniciar_listener()
+os.register_at_fork(after_in_child=_despues_de_fork)
+atexit.register(detener_listener)
+
+logger = logging.getLogger(__name__)
+
+if LOG_LEVEL not in NIVELES_LOG:
+    logger.warning("LOG_LEVEL=%r no es un nivel válido (%s); se usa %s",
+                   LOG_LEVEL, ', '.join(NIVELES_LOG), NIVEL_LOG_POR_OMISION)
+
+
+# Errores de parseo por fila (JSON o HTML mal formados). Una página con muchas filas dañadas
+# escribiría una línea por fila; dentro de un ámbito (una solicitud, una exportación) se cuentan por
+# origen y se reporta una sola línea al terminar, con el primer error de cada origen como ejemplo.
+# Fuera de un ámbito cada error se registra de inmediato.
+
+_errores_fila = ContextVar('errores_fila', default=None)
+
+
+class ErroresFila:
+    __slots__ = ('conteos', 'ejemplos', 'diferido')
+
+    def __init__(self):
+        self.conteos = {}
+        self.ejemplos = {}
+        # En streaming el resumen lo escribe el generador al terminar, no el cierre de la solicitud
+        self.diferido = False
+
+    def registrar(self, origen, error):
+        self.conteos[origen] = self.conteos.get(origen, 0) + 1
+        if origen not in self.ejemplos:
+            self.ejemplos[origen] = str(error)
+
+    def combinar(self, otros):
+        for origen, conteo in otros.conteos.items():
+            self.conteos[origen] = self.conteos.get(origen, 0) + conteo
+            self.ejemplos.setdefault(origen, otros.ejemplos[origen])
+
+    def total(self):
+        return sum(self.conteos.values())
+
+    def __str__(self):
+        return '; '.join(
+            f"{origen}: {conteo} (p. ej. {self.ejemplos[origen]})" for origen, conteo in self.conteos.items()
+        )
+
+
+def iniciar_errores_fila():
+    errores = ErroresFila()
+    return errores, _errores_fila.set(errores)
+
+
+def terminar_errores_fila(token, contexto):
+    """
+    Cierra el ámbito abierto con iniciar_errores_fila y escribe el resumen si hubo errores.
+    """
+    errores = _errores_fila.get()
+    _errores_fila.reset(token)
+    if errores is not None and not errores.diferido:
+        reportar_errores_fila(errores, contexto)
+
+
+def reportar_errores_fila(errores, contexto):
+    if errores is not None and errores.conteos:
+        logger.error("%s: %s errores de parseo en filas: %s", contexto, errores.total(), errores)
+
+
+@contextmanager
+def resumir_errores_fila(contexto):
+    """
+    Ámbito de errores por fila para código fuera de una solicitud (exportaciones). Dentro de otro
+    ámbito no abre uno nuevo: los errores se suman al exterior.
+    """
+    if _errores_fila.get() is not None:
+        yield
+        return
+    _, token = iniciar_errores_fila()
+    try:
+        yield
+    finally:
+        terminar_errores_fila(token, contexto)
+
+
+def continuar_errores_fila(iterable, contexto):
+    """
+    Para las respuestas en streaming, cuyos lotes se procesan después de cerrar la solicitud: los
+    errores de cada lote se suman al ámbito de la solicitud y el resumen se escribe al terminar.
+    """
+    errores = _errores_fila.get()
+    if errores is None:
+        return iterable
+    errores.diferido = True
+    return _iterar_con_errores_fila(iter(iterable), errores, contexto)
+
+
+def _iterar_con_errores_fila(iterador, errores, contexto):
+    try:
+        while True:
+            token = _errores_fila.set(errores)
+            try:
+                elemento = next(iterador)
+            except StopIteration:
+                return
+            finally:
+                _errores_fila.reset(token)
+            yield elemento
+    finally:
+        reportar_errores_fila(errores, contexto)
+
+
+def registrar_error_fila(origen, error):
+    errores = _errores_fila.get()
+    if errores is None:
+        logger.error("Error al procesar %s: %s", origen, error)
+    else:
+        errores.registrar(origen, error)
+
+
+def capturar_errores_fila(funcion, *args):
+    """
+    Ejecuta funcion(*args) en un ámbito propio y devuelve (resultado, errores). Para los procesos
+    del pool paralelo, que no ven el ámbito de la solicitud: el padre los suma con acumular_errores_fila.
+    """
+    errores, token = iniciar_errores_fila()
+    try:
+        return funcion(*args), errores
+    finally:
+        _errores_fila.reset(token)
+
+
+def acumular_errores_fila(errores):
+    actuales = _errores_fila.get()
+    if actuales is None:
+        reportar_errores_fila(errores, "Procesamiento en paralelo")
+    else:
+        actuales.combinar(errores)
@@ -0,0 +1,335 @@
+import fcntl
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from config.settings import METRICAS_DIR
+
+# Medición por solicitud del tiempo de cada fase del camino caliente y su acumulación en
+# histogramas con formato de exposición de Prometheus.
+#
+# Cada solicitud a /api/ abre una MedicionSolicitud (app.before_request) en una ContextVar; el
+# código instrumentado llama a medir(fase) o contar(...) sin conocer la solicitud, y fuera de una
+# solicitud (benchmarks, procesos del pool) esas llamadas no hacen nada. Al terminar se escribe el
+# encabezado Server-Timing y se acumulan los histogramas del worker.
+#
+# Cada worker de gunicorn acumula en su propio registro y, tras cada solicitud, lo vuelca en
+# METRICAS_DIR/<pid>.json. /metrics, lo atienda el worker que lo atienda, suma los archivos de todos
+# los workers: las series no llevan pid. Cuando un worker termina, el master suma su archivo a
+# terminados.json (child_exit en gunicorn.conf.py) para que los contadores no retrocedan, y al
+# arrancar vacía el directorio. Sin METRICAS_DIR, /metrics expone sólo el worker que responde.
+
+# Fases en el orden en que se reportan
+FASES = ('connect', 'execute', 'fetch', 'procesar', 'dedup', 'serializar')
+
+BUCKETS_SEGUNDOS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+BUCKETS_BYTES = (1024, 10 * 1024, 100 * 1024, 1024 ** 2, 10 * 1024 ** 2, 50 * 1024 ** 2, 100 * 1024 ** 2)
+
+PREFIJO = 'lily_dashboard'
+
+_medicion_actual = ContextVar('medicion_actual', default=None)
+
+
+class MedicionSolicitud:
+    __slots__ = ('inicio', 'fases', 'filas_leidas', 'filas_emitidas')
+
+    def __init__(self):
+        self.inicio = time.perf_counter()
+        self.fases = {}
+        self.filas_leidas = 0
+        self.filas_emitidas = 0
+
+    def duracion(self):
+        return time.perf_counter() - self.inicio
+
+    def server_timing(self, total, bytes_respuesta=None):
+        """
+        Valor del encabezado Server-Timing: duración en milisegundos de cada fase medida y del total,
+        más las filas leídas y emitidas y los bytes de la respuesta como descripción.
+        """
+        partes = [f"{fase};dur={self.fases[fase] * 1000:.2f}" for fase in FASES if fase in self.fases]
+        partes.append(f"total;dur={total * 1000:.2f}")
+        partes.append(f'filas_leidas;desc="{self.filas_leidas}"')
+        partes.append(f'filas_emitidas;desc="{self.filas_emitidas}"')
+        if bytes_respuesta is not None:
+            partes.append(f'bytes;desc="{bytes_respuesta}"')
+        return ', '.join(partes)
+
+
+def iniciar_medicion():
+    medicion = MedicionSolicitud()
+    return medicion, _medicion_actual.set(medicion)
+
+
+def terminar_medicion(token):
+    _medicion_actual.reset(token)
+
+
+def medicion_actual():
+    return _medicion_actual.get()
+
+
+@contextmanager
+def medir(fase):
+    """
+    Suma a la fase `fase` de la solicitud en curso el tiempo del bloque. Si una fase se repite
+    (por ejemplo, fetchmany por lote) los tiempos se acumulan.
+    """
+    medicion = _medicion_actual.get()
+    if medicion is None:
+        yield
+        return
+    inicio = time.perf_counter()
+    try:
+        yield
+    finally:
+        medicion.fases[fase] = medicion.fases.get(fase, 0.0) + time.perf_counter() - inicio
+
+
+def contar_filas_leidas(cantidad):
+    medicion = _medicion_actual.get()
+    if medicion is not None:
+        medicion.filas_leidas += cantidad
+
+
+def contar_filas_emitidas(cantidad):
+    medicion = _medicion_actual.get()
+    if medicion is not None:
+        medicion.filas_emitidas += cantidad
+
+
+class Histograma:
+    """
+    Histograma acumulativo por combinación de etiquetas (tupla de valores).
+    """
+
+    def __init__(self, nombre, ayuda, etiquetas, buckets):
+        self.nombre = nombre
+        self.ayuda = ayuda
+        self.etiquetas = etiquetas
+        self.buckets = buckets
+        self._series = {}
+
+    def _serie(self, valores):
+        serie = self._series.get(valores)
+        if serie is None:
+            serie = self._series[valores] = [[0] * len(self.buckets), 0.0, 0]
+        return serie
+
+    def observar(self, valores, valor):
+        serie = self._serie(valores)
+        conteos = serie[0]
+        for i, limite in enumerate(self.buckets):
+            if valor <= limite:
+                conteos[i] += 1
+        serie[1] += valor
+        serie[2] += 1
+
+    def exportar(self):
+        return [[list(valores), conteos, suma, total] for valores, (conteos, suma, total) in self._series.items()]
+
+    def combinar(self, series):
+        for valores, conteos, suma, total in series:
+            if len(conteos) != len(self.buckets):
+                continue  # volcado con otros buckets (versión anterior)
+            serie = self._serie(tuple(valores))
+            serie[0] = [actual + conteo for actual, conteo in zip(serie[0], conteos)]
+            serie[1] += suma
+            serie[2] += total
+
+    def exponer(self):
+        lineas = [f"# HELP {self.nombre} {self.ayuda}", f"# TYPE {self.nombre} histogram"]
+        for valores, (conteos, suma, total) in sorted(self._series.items()):
+            etiquetas = _formatear_etiquetas(self.etiquetas, valores)
+            for limite, conteo in zip(self.buckets, conteos):
+                lineas.append(f'{self.nombre}_bucket{{{etiquetas},le="{limite}"}} {conteo}')
+            lineas.append(f'{self.nombre}_bucket{{{etiquetas},le="+Inf"}} {total}')
+            lineas.append(f"{self.nombre}_sum{{{etiquetas}}} {suma}")
+            lineas.append(f"{self.nombre}_count{{{etiquetas}}} {total}")
+        return lineas
+
+
+class Contador:
+    def __init__(self, nombre, ayuda, etiquetas):
+        self.nombre = nombre
+        self.ayuda = ayuda
+        self.etiquetas = etiquetas
+        self._series = {}
+
+    def incrementar(self, valores, cantidad=1):
+        self._series[valores] = self._series.get(valores, 0) + cantidad
+
+    def exportar(self):
+        return [[list(valores), valor] for valores, valor in self._series.items()]
+
+    def combinar(self, series):
+        for valores, valor in series:
+            self.incrementar(tuple(valores), valor)
+
+    def exponer(self):
+        lineas = [f"# HELP {self.nombre} {self.ayuda}", f"# TYPE {self.nombre} counter"]
+        for valores, valor in sorted(self._series.items()):
+            lineas.append(f"{self.nombre}{{{_formatear_etiquetas(self.etiquetas, valores)}}} {valor}")
+        return lineas
+
+
+def _formatear_etiquetas(nombres, valores):
+    def escapar(valor):
+        return str(valor).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+    return ','.join(f'{nombre}="{escapar(valor)}"' for nombre, valor in zip(nombres, valores))
+
+
+class RegistroMetricas:
+    """
+    Métricas del worker: duración por fase y total, filas leídas y emitidas y bytes por ruta. Con
+    `directorio` se vuelcan tras cada solicitud y exponer() suma las de todos los workers.
+    """
+
+    def __init__(self, directorio=None):
+        self.directorio = directorio
+        self._lock = threading.Lock()
+        self._lock_volcado = threading.Lock()
+        self.fases = Histograma(
+            f"{PREFIJO}_fase_segundos", "Duración de cada fase de la solicitud", ('ruta', 'fase'), BUCKETS_SEGUNDOS,
+        )
+        self.solicitudes = Histograma(
+            f"{PREFIJO}_solicitud_segundos", "Duración total de la solicitud", ('ruta', 'estado'), BUCKETS_SEGUNDOS,
+        )
+        self.bytes = Histograma(
+            f"{PREFIJO}_respuesta_bytes", "Tamaño del cuerpo de la respuesta", ('ruta',), BUCKETS_BYTES,
+        )
+        self.filas_leidas = Contador(f"{PREFIJO}_filas_leidas_total", "Filas leídas de la base de datos", ('ruta',))
+        self.filas_emitidas = Contador(f"{PREFIJO}_filas_emitidas_total", "Filas enviadas al cliente", ('ruta',))
+
+    def _metricas(self):
+        return {
+            'fases': self.fases, 'solicitudes': self.solicitudes, 'bytes': self.bytes,
+            'filas_leidas': self.filas_leidas, 'filas_emitidas': self.filas_emitidas,
+        }
+
+    def registrar(self, ruta, estado, medicion, total, bytes_respuesta=None):
+        with self._lock:
+            for fase, segundos in medicion.fases.items():
+                self.fases.observar((ruta, fase), segundos)
+            self.solicitudes.observar((ruta, estado), total)
+            if bytes_respuesta is not None:
+                self.bytes.observar((ruta,), bytes_respuesta)
+            self.filas_leidas.incrementar((ruta,), medicion.filas_leidas)
+            self.filas_emitidas.incrementar((ruta,), medicion.filas_emitidas)
+        if self.directorio:
+            self.volcar()
+
+    def exportar(self):
+        with self._lock:
+            return {nombre: metrica.exportar() for nombre, metrica in self._metricas().items()}
+
+    def combinar(self, datos):
+        with self._lock:
+            for nombre, metrica in self._metricas().items():
+                metrica.combinar(datos.get(nombre, ()))
+
+    def volcar(self):
+        """
+        Escribe las series del proceso en <directorio>/<pid>.json (reemplazo atómico: quien lee
+        ve el volcado anterior o el nuevo completo).
+        """
+        try:
+            with self._lock_volcado:
+                _escribir_volcado(_ruta_volcado(self.directorio, os.getpid()), self.exportar())
+        except OSError:
+            # Sin directorio escribible /metrics sólo pierde las series de este worker
+            pass
+
+    def exponer(self):
+        registro = self
+        if self.directorio:
+            registro = RegistroMetricas()
+            for datos in _leer_volcados(self.directorio):
+                registro.combinar(datos)
+        with registro._lock:
+            lineas = []
+            for metrica in registro._metricas().values():
+                lineas.extend(metrica.exponer())
+        return '\n'.join(lineas) + '\n'
+
+
+ARCHIVO_TERMINADOS = 'terminados.json'
+ARCHIVO_CANDADO = 'volcados.lock'
+
+
+def _ruta_volcado(directorio, pid):
+    return os.path.join(directorio, f"{pid}.json")
+
+
+def _escribir_volcado(ruta, datos):
+    os.makedirs(os.path.dirname(ruta), exist_ok=True)
+    temporal = f"{ruta}.{threading.get_ident()}.tmp"
+    with open(temporal, 'w', encoding='utf-8') as archivo:
+        json.dump(datos, archivo, separators=(',', ':'))
+    os.replace(temporal, ruta)
+
+
+@contextmanager
+def _candado_volcados(directorio, operacion):
+    # Leer todos los volcados (LOCK_SH) y sumar el de un worker terminado a terminados.json
+    # (LOCK_EX) se excluyen: la suma nunca cuenta un worker dos veces ni lo omite
+    os.makedirs(directorio, exist_ok=True)
+    descriptor = os.open(os.path.join(directorio, ARCHIVO_CANDADO), os.O_RDWR | os.O_CREAT, 0o644)
+    try:
+        fcntl.flock(descriptor, operacion)
+        yield
+    finally:
+        os.close(descriptor)
+
+
+def _leer_volcados(directorio):
+    try:
+        with _candado_volcados(directorio, fcntl.LOCK_SH):
+            nombres = [nombre for nombre in os.listdir(directorio) if nombre.endswith('.json')]
+            volcados = []
+            for nombre in nombres:
+                try:
+                    with open(os.path.join(directorio, nombre), encoding='utf-8') as archivo:
+                        volcados.append(json.load(archivo))
+                except (OSError, ValueError):
+                    continue
+            return volcados
+    except OSError:
+        return []
+
+
+def plegar_metricas_proceso(pid, directorio=METRICAS_DIR):
+    """
+    Suma el volcado de un worker terminado a terminados.json y lo borra. Lo llama el master
+    (child_exit), también para los workers que murieron sin poder avisar.
+    """
+    if not directorio:
+        return
+    ruta = _ruta_volcado(directorio, pid)
+    if not os.path.exists(ruta):
+        return
+    with _candado_volcados(directorio, fcntl.LOCK_EX):
+        registro = RegistroMetricas()
+        for nombre in (ARCHIVO_TERMINADOS, os.path.basename(ruta)):
+            try:
+                with open(os.path.join(directorio, nombre), encoding='utf-8') as archivo:
+                    registro.combinar(json.load(archivo))
+            except (OSError, ValueError):
+                continue
+        _escribir_volcado(os.path.join(directorio, ARCHIVO_TERMINADOS), registro.exportar())
+        os.remove(ruta)
+
+
+def limpiar_metricas(directorio=METRICAS_DIR):
+    # Al arrancar el servidor (on_starting): las métricas empiezan de cero con los workers nuevos
+    if not directorio or not os.path.isdir(directorio):
+        return
+    for nombre in os.listdir(directorio):
+        if nombre.endswith(('.json', '.tmp')):
+            os.remove(os.path.join(directorio, nombre))
+
+
+registro_metricas = RegistroMetricas(METRICAS_DIR or None)
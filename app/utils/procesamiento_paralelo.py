@@ -0,0 +1,141 @@
+import os
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+from utils.logger import acumular_errores_fila, capturar_errores_fila, logger, reiniciar_listener
+
+# Pool de procesos persistente por worker de gunicorn para procesar páginas grandes. El
+# procesamiento de filas es Python puro (json y regex), así que con hilos el GIL lo serializa; con
+# procesos cada bloque usa un núcleo. El pool se crea en post_worker_init (gunicorn.conf.py) antes
+# de abrir conexiones, para que los procesos hijos no hereden sockets de MySQL.
+#
+# Sólo se usa si PARALELO_PROCESOS > 0 y la página tiene al menos PARALELO_UMBRAL_FILAS filas; por
+# debajo de ese tamaño el costo de enviar las filas a otro proceso supera a la ganancia (ver
+# benchmarks/bench_paralelo.py).
+#
+# Con workers gevent (modo cooperativo) no se usa el pool de procesos: sus hilos internos pasan a ser
+# greenlets y la escritura bloqueante en los pipes hacia los procesos traba el worker. Tampoco sirven
+# los hilos nativos del hub, porque los locks parcheados (cache_plantillas) no se comparten entre
+# hilos. En su lugar cada página se procesa en bloques pequeños y entre bloque y bloque se cede el
+# control al hub, así que una página grande no detiene a los demás requests del worker.
+
+_pool = None
+_pid_pool = None
+_ceder = None
+_configuracion = {'umbral_filas': 5000, 'tam_bloque': 2000, 'tam_bloque_cooperativo': 100}
+# Con workers gthread varias solicitudes actualizan las estadísticas a la vez
+_lock_estadisticas = threading.Lock()
+_estadisticas = {'paginas_paralelas': 0, 'paginas_seriales': 0, 'paginas_cooperativas': 0, 'bloques': 0,
+                 'filas_paralelas': 0, 'tiempo_paralelo_total_s': 0.0}
+
+
+def _sumar_estadisticas(**incrementos):
+    with _lock_estadisticas:
+        for nombre, incremento in incrementos.items():
+            _estadisticas[nombre] += incremento
+
+
+def iniciar_pool(procesos, umbral_filas=5000, tam_bloque=2000):
+    """
+    Crea el pool de procesos del worker actual. Con procesos <= 0 no hace nada y todo el
+    procesamiento sigue siendo serial.
+    """
+    global _pool, _pid_pool
+    if procesos <= 0:
+        return None
+    cerrar_pool()
+    _configuracion['umbral_filas'] = umbral_filas
+    _configuracion['tam_bloque'] = tam_bloque
+    _pool = ProcessPoolExecutor(max_workers=procesos)
+    _pid_pool = os.getpid()
+    # La primera tarea arranca todos los procesos ahora, no a mitad de una solicitud
+    list(_pool.map(abs, range(procesos)))
+    logger.info("Pool de procesamiento paralelo iniciado con %s procesos en el worker %s", procesos, _pid_pool)
+    return _pool
+
+
+def activar_modo_cooperativo(tam_bloque=100):
+    """
+    Workers gevent: las páginas de más de tam_bloque filas se procesan por bloques, cediendo el
+    control a los demás greenlets entre bloques.
+    """
+    global _ceder
+    import gevent
+
+    _configuracion['tam_bloque_cooperativo'] = tam_bloque
+    _ceder = gevent.sleep
+    # El worker ya está parcheado: el listener del log pasa a ser un greenlet con una cola de gevent
+    reiniciar_listener()
+    logger.info("Procesamiento cooperativo en bloques de %s filas en el worker %s", tam_bloque, os.getpid())
+
+
+def cerrar_pool():
+    global _pool, _pid_pool
+    if _pool is not None and _pid_pool == os.getpid():
+        _pool.shutdown(wait=True)
+    _pool = None
+    _pid_pool = None
+
+
+def pool_disponible():
+    # Dentro de un proceso hijo del pool la referencia heredada no es válida: se procesa en serie
+    return _pool is not None and _pid_pool == os.getpid()
+
+
+def dividir_en_bloques(filas, tam_bloque):
+    return [filas[i:i + tam_bloque] for i in range(0, len(filas), tam_bloque)]
+
+
+def procesar_en_bloques(filas, procesar_bloque):
+    """
+    Aplica procesar_bloque(filas) a la página completa. Si hay pool y la página supera el umbral,
+    la divide en bloques, los procesa en el pool y concatena los resultados en el orden original;
+    si no, llama a procesar_bloque directamente en este proceso.
+    procesar_bloque debe ser una función de nivel de módulo (se envía al pool con pickle).
+    En modo cooperativo se procesa por bloques en este proceso (procesar_cooperativo).
+    """
+    tam_bloque_cooperativo = _configuracion['tam_bloque_cooperativo']
+    if _ceder is not None and len(filas) > tam_bloque_cooperativo:
+        _sumar_estadisticas(paginas_cooperativas=1)
+        return procesar_cooperativo(filas, procesar_bloque, tam_bloque_cooperativo)
+
+    if not pool_disponible() or len(filas) < _configuracion['umbral_filas']:
+        _sumar_estadisticas(paginas_seriales=1)
+        return procesar_bloque(filas)
+
+    inicio = time.perf_counter()
+    bloques = dividir_en_bloques(filas, _configuracion['tam_bloque'])
+    resultados = []
+    # Los errores de parseo de cada bloque vuelven con su resultado y se suman a los de la solicitud
+    for resultado_bloque, errores in _pool.map(partial(capturar_errores_fila, procesar_bloque), bloques):
+        resultados.extend(resultado_bloque)
+        acumular_errores_fila(errores)
+
+    _sumar_estadisticas(
+        paginas_paralelas=1, bloques=len(bloques), filas_paralelas=len(filas),
+        tiempo_paralelo_total_s=time.perf_counter() - inicio,
+    )
+    return resultados
+
+
+def procesar_cooperativo(filas, procesar_bloque, tam_bloque):
+    resultados = []
+    for inicio in range(0, len(filas), tam_bloque):
+        resultados.extend(procesar_bloque(filas[inicio:inicio + tam_bloque]))
+        # gevent.sleep(0) deja correr a los greenlets listos (requests cuya consulta ya respondió)
+        _ceder(0)
+    return resultados
+
+
+def estadisticas_paralelo():
+    with _lock_estadisticas:
+        estadisticas = dict(_estadisticas)
+    return {
+        'activo': pool_disponible(),
+        'modo_cooperativo': _ceder is not None,
+        'procesos': _pool._max_workers if pool_disponible() else 0,
+        **_configuracion,
+        **estadisticas,
+        'tiempo_paralelo_total_s': round(estadisticas['tiempo_paralelo_total_s'], 6),
+    }
@@ -0,0 +1,121 @@
+# base_datos_simulada.py
+# Sustituto local de MySQL para los benchmarks: una tabla sale_exercises en SQLite con la misma
+# interfaz que config.db_connection.DatabaseConnection (ejecutar_query y ejecutar_query_stream).
+#
+# Las consultas de models/sale_exercises_query.py se ejecutan tal cual (sólo se cambian los %s por
+# ?; MD5, REGEXP_REPLACE y REGEXP_LIKE, que SQLite no trae, se registran con hashlib y re, con
+# las referencias $n del reemplazo de MySQL traducidas a las de re). Para que el
+# paralelismo entre conexiones se note como en un servidor real, cada consulta espera
+# latencia_consulta segundos más latencia_fila por fila devuelta (red y lectura en el servidor);
+# time.sleep libera el GIL, igual que la espera de un socket.
+
+import hashlib
+import os
+import re
+import sqlite3
+import sys
+import threading
+import time
+from datetime import datetime
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'app'))
+
+from models.sale_exercises_query import COLUMNAS_SALE_EXERCISES
+from utils.filas import filas_tupla
+
+PATRON_FECHA = re.compile(r'^\d{4}-\d{2}-\d{2}([ T]\d{2}:\d{2}(:\d{2}(\.\d+)?)?)?$')
+
+
+def _parametro(valor):
+    # Las fechas se guardan como 'YYYY-MM-DD HH:MM:SS'; '2025-01-31' equivale a medianoche como en MySQL
+    if isinstance(valor, datetime):
+        return valor.isoformat(sep=' ')
+    if isinstance(valor, str) and PATRON_FECHA.match(valor):
+        return datetime.fromisoformat(valor).isoformat(sep=' ')
+    return valor
+
+
+def _md5(valor):
+    if valor is None:
+        return None
+    return hashlib.md5(valor.encode('utf-8') if isinstance(valor, str) else valor).hexdigest()
+
+
+def _regexp_replace(valor, patron, reemplazo):
+    if valor is None or patron is None:
+        return None
+    # MySQL usa $1 para los grupos del reemplazo y re usa \g<1>; cualquier otra barra es literal
+    reemplazo = re.sub(r'\$(\d)', r'\\g<\1>', reemplazo.replace('\\', '\\\\'))
+    return re.sub(patron, reemplazo, valor)
+
+
+def _regexp_like(valor, patron):
+    if valor is None or patron is None:
+        return None
+    return int(re.search(patron, valor) is not None)
+
+
+class BaseDatosSimulada:
+    def __init__(self, ruta, latencia_consulta=0.0, latencia_fila=0.0):
+        self.ruta = ruta
+        self.latencia_consulta = latencia_consulta
+        self.latencia_fila = latencia_fila
+        self.consultas = 0
+        self._local = threading.local()
+        self._lock = threading.Lock()
+
+    def _conexion(self):
+        conexion = getattr(self._local, 'conexion', None)
+        if conexion is None:
+            conexion = self._local.conexion = sqlite3.connect(self.ruta)
+            conexion.row_factory = sqlite3.Row
+            conexion.create_function('MD5', 1, _md5, deterministic=True)
+            conexion.create_function('REGEXP_REPLACE', 3, _regexp_replace, deterministic=True)
+            conexion.create_function('REGEXP_LIKE', 2, _regexp_like, deterministic=True)
+        return conexion
+
+    def cargar(self, filas):
+        """
+        Crea la tabla, con saex_id como llave primaria e índice por (saex_useCases, saex_DateTime,
+        saex_id) para que los filtros por caso de uso y rango de fechas no recorran toda la tabla,
+        y agrega las filas.
+        """
+        conexion = self._conexion()
+        columnas = ', '.join(COLUMNAS_SALE_EXERCISES)
+        definicion = ', '.join(
+            'saex_id INTEGER PRIMARY KEY' if columna == 'saex_id' else columna for columna in COLUMNAS_SALE_EXERCISES
+        )
+        conexion.execute(f"CREATE TABLE IF NOT EXISTS sale_exercises ({definicion})")
+        conexion.execute(
+            "CREATE INDEX IF NOT EXISTS idx_use_case_fecha ON sale_exercises (saex_useCases, saex_DateTime, saex_id)"
+        )
+        conexion.executemany(
+            f"INSERT INTO sale_exercises ({columnas}) VALUES ({', '.join('?' * len(COLUMNAS_SALE_EXERCISES))})",
+            ([_parametro(fila.get(columna)) for columna in COLUMNAS_SALE_EXERCISES] for fila in filas),
+        )
+        conexion.commit()
+
+    def ejecutar_query(self, query, params=None, como_tuplas=False):
+        with self._lock:
+            self.consultas += 1
+        inicio = time.perf_counter()
+        cursor = self._conexion().execute(query.replace('%s', '?'), [_parametro(p) for p in params or ()])
+        filas = [self._fila(fila) for fila in cursor.fetchall()]
+        if como_tuplas:
+            columnas = [descripcion[0] for descripcion in cursor.description]
+            filas = filas_tupla(columnas, [tuple(fila[columna] for columna in columnas) for fila in filas])
+        espera = self.latencia_consulta + self.latencia_fila * len(filas) - (time.perf_counter() - inicio)
+        if espera > 0:
+            time.sleep(espera)
+        return filas
+
+    def ejecutar_query_stream(self, query, params=None, tam_lote=1000, como_tuplas=False, pool_timeout=None):
+        filas = self.ejecutar_query(query, params, como_tuplas=como_tuplas)
+        for inicio in range(0, len(filas), tam_lote):
+            yield filas[inicio:inicio + tam_lote]
+
+    def _fila(self, fila):
+        fila = dict(fila)
+        if isinstance(fila.get('saex_DateTime'), str):
+            fila['saex_DateTime'] = datetime.fromisoformat(fila['saex_DateTime'])
+        return fila
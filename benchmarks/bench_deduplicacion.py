@@ -0,0 +1,91 @@
+# bench_deduplicacion.py
+# Eliminación de duplicados de DimActividadesExtractor: la anterior (lista completa de actividades
+# de la página y un dict con claves tupla de todos los campos, normalizados con re.sub) frente a la
+# incremental por huellas (DeduplicadorActividades, bloque a bloque en acumular_actividades).
+#
+# Para cada una mide el tiempo y el pico de memoria de tracemalloc de obtener actividades únicas a
+# partir de las filas crudas de una página, y el tiempo de eliminar duplicados por sí solo.
+#
+# Uso: python benchmarks/bench_deduplicacion.py [filas]
+
+import os
+import re
+import sys
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'app'))
+
+from datos_sinteticos import generar_filas
+from models.dim_actividades_extractor import DeduplicadorActividades, DimActividadesExtractor, es_actividad_valida
+from utils.filas import filas_tupla
+
+
+def limpiar_valor_anterior(valor):
+    if isinstance(valor, str):
+        return re.sub(r'\s+', ' ', valor).strip()
+    return valor
+
+
+def eliminar_duplicados_anterior(datos):
+    actividades_vistas = {}
+    for actividad in datos:
+        clave_unica = tuple((k, limpiar_valor_anterior(v)) for k, v in actividad.items() if k != "Actividad_Nombre")
+        if clave_unica in actividades_vistas:
+            if actividad.get("Actividad_Nombre"):
+                actividades_vistas[clave_unica] = actividad
+        else:
+            actividades_vistas[clave_unica] = actividad
+    return list(actividades_vistas.values())
+
+
+def pagina_anterior(filas):
+    # Como obtener_actividades antes: todas las actividades de la página, filtro y después dedup
+    extractor = DimActividadesExtractor(None)
+    actividades = [extractor.extraer_dim_actividades(fila) for fila in filas]
+    return eliminar_duplicados_anterior([d for d in actividades if es_actividad_valida(d)])
+
+
+def pagina_incremental(filas):
+    return DimActividadesExtractor(None).obtener_actividades(filas)
+
+
+def medir(funcion, *args):
+    tracemalloc.start()
+    inicio = time.perf_counter()
+    resultado = funcion(*args)
+    segundos = time.perf_counter() - inicio
+    _, pico = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return resultado, segundos, pico
+
+
+if __name__ == '__main__':
+    cantidad = int(sys.argv[1]) if len(sys.argv) > 1 else 10000
+    crudas = generar_filas(cantidad)
+    columnas = list(crudas[0])
+    filas = filas_tupla(columnas, [tuple(fila[columna] for columna in columnas) for fila in crudas])
+
+    # Calienta los caches de plantillas para que las dos versiones procesen igual
+    pagina_incremental(filas)
+
+    anterior, segundos_anterior, pico_anterior = medir(pagina_anterior, filas)
+    incremental, segundos_incremental, pico_incremental = medir(pagina_incremental, filas)
+    assert anterior == incremental
+
+    print(f"{cantidad:,} filas, {len(incremental)} actividades distintas")
+    print(f"{'página':<24} {'tiempo':>10} {'pico memoria':>14}")
+    print(f"{'anterior':<24} {segundos_anterior * 1000:>8.1f}ms {pico_anterior / 1024 / 1024:>11.2f} MB")
+    print(f"{'incremental':<24} {segundos_incremental * 1000:>8.1f}ms {pico_incremental / 1024 / 1024:>11.2f} MB")
+
+    extractor = DimActividadesExtractor(None)
+    actividades = [d for d in map(extractor.extraer_dim_actividades, filas) if es_actividad_valida(d)]
+    inicio = time.perf_counter()
+    eliminar_duplicados_anterior(actividades)
+    solo_anterior = time.perf_counter() - inicio
+    inicio = time.perf_counter()
+    deduplicador = DeduplicadorActividades()
+    deduplicador.agregar(actividades)
+    solo_incremental = time.perf_counter() - inicio
+    print(f"\nsólo eliminar duplicados de {len(actividades):,} actividades: "
+          f"anterior {solo_anterior * 1000:.1f}ms, huellas {solo_incremental * 1000:.1f}ms")
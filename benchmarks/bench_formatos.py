@@ -0,0 +1,77 @@
+# bench_formatos.py
+# Tamaño del cuerpo y tiempo de serialización de cada valor del parámetro format frente a la
+# respuesta actual (jsonify), sin comprimir y con gzip/deflate al nivel COMPRESION_NIVEL.
+#
+# Usa la misma ruta que app.py (serializar y comprimir) sobre páginas de RolPlaySimExtractor
+# procesadas a partir de filas sintéticas.
+#
+# Uso: python benchmarks/bench_formatos.py [filas] [repeticiones] [nivel]
+
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'app'))
+
+from datos_sinteticos import generar_filas
+from flask import Flask, jsonify
+from models.rol_play_sim_extractor import RolPlaySimExtractor
+from utils.formatos import ProveedorJSON, a_columnar, comprimir, generar_csv
+
+app = Flask('bench_formatos')
+app.json = ProveedorJSON(app)
+
+
+def serializar_json(registros):
+    return jsonify(registros).get_data()
+
+
+def serializar_columnar(registros):
+    return jsonify(a_columnar(registros)).get_data()
+
+
+def serializar_csv(registros):
+    return ''.join(generar_csv(registros)).encode('utf-8')
+
+
+FORMATOS = {
+    'json': serializar_json,
+    'columnar': serializar_columnar,
+    'csv': serializar_csv,
+}
+
+
+def mejor_tiempo(funcion, repeticiones):
+    mejor = float('inf')
+    resultado = None
+    for _ in range(repeticiones):
+        inicio = time.perf_counter()
+        resultado = funcion()
+        mejor = min(mejor, time.perf_counter() - inicio)
+    return mejor, resultado
+
+
+if __name__ == '__main__':
+    cantidad = int(sys.argv[1]) if len(sys.argv) > 1 else 10000
+    repeticiones = int(sys.argv[2]) if len(sys.argv) > 2 else 3
+    nivel = int(sys.argv[3]) if len(sys.argv) > 3 else 1
+
+    extractor = RolPlaySimExtractor(None)
+    extractor.procesar_resultados(generar_filas(cantidad))
+    registros = extractor.datos_finales
+    print(f"{len(registros)} registros de RolPlaySim, nivel de compresión {nivel}")
+    print(f"{'formato':<20} {'bytes':>12} {'vs json':>8} {'serializar':>11} {'total':>9}")
+
+    with app.app_context():
+        segundos_json, cuerpo_json = mejor_tiempo(lambda: serializar_json(registros), repeticiones)
+        for nombre, serializador in FORMATOS.items():
+            segundos, cuerpo = mejor_tiempo(lambda: serializador(registros), repeticiones)
+            variantes = [('', cuerpo, 0.0)]
+            for codificacion in ('gzip', 'deflate'):
+                segundos_compresion, comprimido = mejor_tiempo(
+                    lambda: comprimir(cuerpo, codificacion, nivel), repeticiones
+                )
+                variantes.append((f"+{codificacion}", comprimido, segundos_compresion))
+            for sufijo, datos, extra in variantes:
+                print(f"{nombre + sufijo:<20} {len(datos):>12,} {len(datos) / len(cuerpo_json):>7.1%} "
+                      f"{segundos:>10.3f}s {segundos + extra:>8.3f}s")
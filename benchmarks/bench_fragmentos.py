@@ -0,0 +1,60 @@
+# bench_fragmentos.py
+# Latencia de punta a punta de una página por keyset sobre un rango de fechas amplio, leída con una
+# sola consulta (get_data_cursor) y dividida en fragmentos paralelos (get_data_fragmentado) con
+# distintos tamaños de fragmento y concurrencias.
+#
+# Usa base_datos_simulada.py (SQLite con latencia de red simulada por consulta y por fila) como
+# sustituto de MySQL. La ganancia depende de cuánto pesa la transferencia frente al procesamiento:
+# con latencia_fila=0 sólo se superpone la latencia por consulta.
+#
+# Uso: python benchmarks/bench_fragmentos.py [filas] [latencia_consulta_s] [latencia_fila_s]
+
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'app'))
+
+from base_datos_simulada import BaseDatosSimulada
+from datos_sinteticos import generar_filas
+from models.rol_play_sim_extractor import RolPlaySimExtractor
+
+TAMANOS_FRAGMENTO = [1, 7, 30]
+CONCURRENCIAS = [1, 2, 4]
+IDS = [302, 303, 304, 305]
+
+
+def medir(funcion):
+    inicio = time.perf_counter()
+    datos, _ = funcion()
+    return time.perf_counter() - inicio, datos
+
+
+if __name__ == '__main__':
+    cantidad = int(sys.argv[1]) if len(sys.argv) > 1 else 20000
+    latencia_consulta = float(sys.argv[2]) if len(sys.argv) > 2 else 0.05
+    latencia_fila = float(sys.argv[3]) if len(sys.argv) > 3 else 0.0001
+
+    with tempfile.TemporaryDirectory() as directorio:
+        db = BaseDatosSimulada(os.path.join(directorio, 'sale_exercises.sqlite3'), latencia_consulta, latencia_fila)
+        filas = generar_filas(cantidad)
+        db.cargar(filas)
+        fecha_inicio = filas[0]['saex_DateTime'].isoformat(sep=' ')
+        fecha_fin = filas[-1]['saex_DateTime'].isoformat(sep=' ')
+        print(f"{cantidad} filas entre {fecha_inicio} y {fecha_fin}; "
+              f"latencia {latencia_consulta * 1000:.0f} ms/consulta + {latencia_fila * 1e6:.0f} us/fila")
+
+        segundos_base, referencia = medir(lambda: RolPlaySimExtractor(db).get_data_cursor(
+            IDS, fecha_inicio, fecha_fin, page_size=cantidad
+        ))
+        print(f"{'una consulta':<24} {segundos_base:>8.3f}s")
+
+        for dias in TAMANOS_FRAGMENTO:
+            for concurrencia in CONCURRENCIAS:
+                segundos, datos = medir(lambda: RolPlaySimExtractor(db).get_data_fragmentado(
+                    IDS, fecha_inicio, fecha_fin, dias, page_size=cantidad, concurrencia=concurrencia
+                ))
+                igual = 'igual' if datos == referencia else 'DISTINTO'
+                print(f"{f'{dias} días x {concurrencia} hilos':<24} {segundos:>8.3f}s "
+                      f"x{segundos_base / segundos:>5.2f} {igual}")
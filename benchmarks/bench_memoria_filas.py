@@ -0,0 +1,86 @@
+# bench_memoria_filas.py
+# Memoria y número de asignaciones de las representaciones de filas, medidas con tracemalloc.
+#
+#   filas crudas:        dict por fila (cursor dictionary=True) frente a FilaTupla (utils/filas.py)
+#   registros de salida: dict por registro frente a RegistroRolPlay (models/rol_play_sim_extractor.py)
+#
+# Un cursor normal también crea una tupla por fila antes del dict; las tuplas no se cuentan en
+# ninguno de los dos casos.
+#
+# Las dos representaciones de cada par comparten los mismos objetos de valor, así que la diferencia
+# medida es sólo la de los contenedores (nombres de columna y tablas hash repetidos en cada fila).
+#
+# Uso: python benchmarks/bench_memoria_filas.py [filas]
+
+import os
+import sys
+import tracemalloc
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'app'))
+
+from datos_sinteticos import generar_filas
+from models.rol_play_sim_extractor import (
+    CAMPOS_FIJOS_ROL_PLAY, CAMPOS_PREGUNTA_ROL_PLAY, RegistroRolPlay, RolPlaySimExtractor
+)
+from utils.filas import filas_tupla
+
+
+def registro_dict(registro):
+    # Como los armaba construir_resultado_final antes de RegistroRolPlay: un dict por registro con
+    # las claves por pregunta creadas con f-strings en cada fila
+    valores = iter(registro.valores)
+    resultado = dict(zip(CAMPOS_FIJOS_ROL_PLAY, valores))
+    for i in range(1, (len(registro) - len(CAMPOS_FIJOS_ROL_PLAY)) // len(CAMPOS_PREGUNTA_ROL_PLAY) + 1):
+        for campo in CAMPOS_PREGUNTA_ROL_PLAY:
+            resultado[f'{campo}{i}'] = next(valores)
+    return resultado
+
+
+def medir_memoria(construir):
+    """
+    Bytes y bloques que siguen asignados después de construir() (lo que ocupa su resultado).
+    """
+    tracemalloc.start()
+    antes = tracemalloc.take_snapshot()
+    resultado = construir()
+    despues = tracemalloc.take_snapshot()
+    tracemalloc.stop()
+    diferencias = despues.compare_to(antes, 'filename')
+    bytes_asignados = sum(d.size_diff for d in diferencias)
+    bloques = sum(d.count_diff for d in diferencias)
+    del resultado
+    return bytes_asignados, bloques
+
+
+def imprimir(titulo, anterior, compacto, cantidad):
+    print(titulo)
+    for nombre, (bytes_asignados, bloques) in (('dict', anterior), ('compacto', compacto)):
+        print(f"  {nombre:<10} {bytes_asignados / 1024 / 1024:>8.2f} MB  {bloques:>9,} bloques  "
+              f"{bytes_asignados / cantidad:>7.0f} B/fila")
+    print(f"  reducción: {1 - compacto[0] / anterior[0]:.0%} de la memoria, "
+          f"{1 - compacto[1] / anterior[1]:.0%} de los bloques")
+
+
+if __name__ == '__main__':
+    cantidad = int(sys.argv[1]) if len(sys.argv) > 1 else 10000
+    filas = generar_filas(cantidad)
+    columnas = list(filas[0])
+    tuplas = [tuple(fila[columna] for columna in columnas) for fila in filas]
+
+    print(f"{cantidad:,} filas, {len(columnas)} columnas")
+    imprimir(
+        'Filas crudas',
+        medir_memoria(lambda: [dict(zip(columnas, valores)) for valores in tuplas]),
+        medir_memoria(lambda: filas_tupla(columnas, tuplas)),
+        cantidad,
+    )
+
+    extractor = RolPlaySimExtractor(None)
+    extractor.procesar_resultados(filas_tupla(columnas, tuplas))
+    registros = extractor.datos_finales
+    imprimir(
+        'Registros de salida (RolPlaySimExtractor)',
+        medir_memoria(lambda: [registro_dict(registro) for registro in registros]),
+        medir_memoria(lambda: [RegistroRolPlay(list(registro.valores)) for registro in registros]),
+        cantidad,
+    )
@@ -0,0 +1,65 @@
+# bench_paralelo.py
+# Escalamiento del procesamiento paralelo (utils/procesamiento_paralelo.py) frente al serial.
+#
+# Para cada tamaño de página y número de procesos mide RolPlaySimExtractor.procesar_resultados
+# con el pool activo y sin él, e indica el tamaño mínimo a partir del cual el pool gana. Ese valor
+# es la referencia para PARALELO_UMBRAL_FILAS.
+#
+# Uso: python benchmarks/bench_paralelo.py [procesos_max] [repeticiones]
+
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'app'))
+
+from datos_sinteticos import generar_filas
+from models.rol_play_sim_extractor import RolPlaySimExtractor
+from utils.cache_plantillas import CACHES_PLANTILLAS
+from utils.procesamiento_paralelo import cerrar_pool, iniciar_pool
+
+TAMANOS = [500, 1000, 2000, 5000, 10000, 20000, 50000]
+TAM_BLOQUE = 2000
+
+
+def medir(filas, repeticiones):
+    mejor = float('inf')
+    for _ in range(repeticiones):
+        for cache in CACHES_PLANTILLAS:
+            cache.limpiar()
+        extractor = RolPlaySimExtractor(None)
+        inicio = time.perf_counter()
+        extractor.procesar_resultados(filas)
+        mejor = min(mejor, time.perf_counter() - inicio)
+    return mejor
+
+
+if __name__ == '__main__':
+    procesos_max = int(sys.argv[1]) if len(sys.argv) > 1 else (os.cpu_count() or 1)
+    repeticiones = int(sys.argv[2]) if len(sys.argv) > 2 else 3
+    niveles = sorted({1, 2, 4, 8, procesos_max} & set(range(1, procesos_max + 1)))
+    paginas = {cantidad: generar_filas(cantidad) for cantidad in TAMANOS}
+
+    print(f"CPUs disponibles: {os.cpu_count()}  bloque: {TAM_BLOQUE} filas")
+    seriales = {cantidad: medir(filas, repeticiones) for cantidad, filas in paginas.items()}
+
+    print(f"{'filas':>8} {'serial':>10}" + ''.join(f" {f'{n} proc':>14}" for n in niveles))
+    tiempos = {}
+    for procesos in niveles:
+        # Umbral 0: el pool se usa en todas las páginas para poder comparar
+        iniciar_pool(procesos, umbral_filas=0, tam_bloque=TAM_BLOQUE)
+        for cantidad, filas in paginas.items():
+            tiempos[(procesos, cantidad)] = medir(filas, repeticiones)
+        cerrar_pool()
+
+    for cantidad in TAMANOS:
+        fila = f"{cantidad:>8} {seriales[cantidad]:>9.3f}s"
+        for procesos in niveles:
+            segundos = tiempos[(procesos, cantidad)]
+            fila += f" {segundos:>7.3f}s x{seriales[cantidad] / segundos:>4.2f}"
+        print(fila)
+
+    for procesos in niveles:
+        ganadores = [c for c in TAMANOS if tiempos[(procesos, c)] < seriales[c]]
+        equilibrio = f"desde {ganadores[0]} filas" if ganadores else "no gana en ningún tamaño medido"
+        print(f"  {procesos} procesos: el pool gana {equilibrio}")
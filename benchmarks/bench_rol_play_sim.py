@@ -0,0 +1,37 @@
+# bench_rol_play_sim.py
+# Microbenchmark de RolPlaySimExtractor.procesar_resultados (filas por segundo).
+#
+# Uso: python benchmarks/bench_rol_play_sim.py [filas] [repeticiones]
+
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'app'))
+
+from datos_sinteticos import generar_filas
+from models.rol_play_sim_extractor import RolPlaySimExtractor
+from utils.cache_plantillas import CACHES_PLANTILLAS, estadisticas_caches
+
+
+def medir(filas, repeticiones):
+    mejor = float('inf')
+    for _ in range(repeticiones):
+        # Cada repetición arranca con los caches vacíos, como un worker recién iniciado
+        for cache in CACHES_PLANTILLAS:
+            cache.limpiar()
+        extractor = RolPlaySimExtractor(None)
+        inicio = time.perf_counter()
+        extractor.procesar_resultados(filas)
+        mejor = min(mejor, time.perf_counter() - inicio)
+    return mejor
+
+
+if __name__ == '__main__':
+    cantidad = int(sys.argv[1]) if len(sys.argv) > 1 else 5000
+    repeticiones = int(sys.argv[2]) if len(sys.argv) > 2 else 5
+    filas = generar_filas(cantidad)
+    segundos = medir(filas, repeticiones)
+    print(f"RolPlaySimExtractor: {cantidad} filas en {segundos:.3f}s -> {cantidad / segundos:,.0f} filas/s")
+    for nombre, estadisticas in estadisticas_caches().items():
+        print(f"  cache {nombre}: {estadisticas}")
@@ -0,0 +1,136 @@
+# carga_workers.py
+# Prueba de carga de los tipos de worker de gunicorn (GUNICORN_WORKER_CLASS): sync, gthread y
+# gevent, con el mismo número de procesos.
+#
+# Para cada tipo levanta gunicorn con app/gunicorn.conf.py sobre servidor_simulado.py (la app real
+# con BaseDatosSimulada y latencia de consulta), envía `solicitudes` requests a
+# /api/rol_play_sim_extractor desde `clientes` hilos concurrentes y mide el throughput y la
+# latencia. Cada request pide una página distinta para que no intervengan la coalescencia ni el
+# cache de respuestas (que además se desactiva con CACHE_RESPUESTAS_TTL=0).
+#
+# Uso: python benchmarks/carga_workers.py [--clases sync,gthread,gevent] [--workers 2] [--clientes 32]
+#                                         [--solicitudes 200] [--page-size 50] [--latencia 0.2]
+
+import argparse
+import os
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+
+DIRECTORIO = os.path.dirname(os.path.abspath(__file__))
+DIRECTORIO_APP = os.path.join(DIRECTORIO, '..', 'app')
+sys.path.insert(0, DIRECTORIO_APP)
+
+from base_datos_simulada import BaseDatosSimulada
+from datos_sinteticos import generar_filas
+
+RUTA = '/api/rol_play_sim_extractor'
+
+
+def puerto_libre():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+def percentil(valores, p):
+    ordenados = sorted(valores)
+    return ordenados[min(len(ordenados) - 1, int(len(ordenados) * p))] if ordenados else 0.0
+
+
+def iniciar_servidor(clase, args, base_datos, directorio):
+    puerto = puerto_libre()
+    entorno = {
+        **os.environ,
+        'PYTHONPATH': os.pathsep.join([DIRECTORIO_APP, DIRECTORIO]),
+        'GUNICORN_WORKER_CLASS': clase,
+        'GUNICORN_WORKERS': str(args.workers),
+        'GUNICORN_THREADS': str(args.clientes),
+        'GUNICORN_WORKER_CONNECTIONS': str(args.clientes * 2),
+        'DB_POOL_SIZE': str(args.clientes),
+        'CACHE_RESPUESTAS_TTL': '0',
+        'BENCH_BASE_DATOS': base_datos,
+        'BENCH_LATENCIA_CONSULTA': str(args.latencia),
+    }
+    # El directorio de trabajo es temporal: logs/, data/ y el almacén quedan fuera del repositorio
+    proceso = subprocess.Popen(
+        [sys.executable, '-m', 'gunicorn', '-c', os.path.join(DIRECTORIO_APP, 'gunicorn.conf.py'),
+         '-b', f'127.0.0.1:{puerto}', 'servidor_simulado:app'],
+        cwd=directorio, env=entorno, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+    )
+    url = f'http://127.0.0.1:{puerto}'
+    limite = time.monotonic() + 60
+    while time.monotonic() < limite:
+        try:
+            if requests.get(f'{url}/metrics', timeout=1).status_code == 200:
+                return proceso, url
+        except requests.RequestException:
+            pass
+        time.sleep(0.2)
+    proceso.terminate()
+    raise RuntimeError(f"gunicorn ({clase}) no respondió en 60s")
+
+
+def generar_carga(url, args):
+    local = threading.local()
+
+    def solicitud(numero):
+        sesion = getattr(local, 'sesion', None)
+        if sesion is None:
+            sesion = local.sesion = requests.Session()
+        inicio = time.perf_counter()
+        try:
+            respuesta = sesion.get(f'{url}{RUTA}', params={
+                'id': [302, 303, 304, 305], 'page': numero + 1, 'page_size': args.page_size,
+            }, timeout=600)
+            correcta = respuesta.status_code == 200
+        except requests.RequestException:
+            correcta = False
+        return time.perf_counter() - inicio, correcta
+
+    inicio = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.clientes) as ejecutor:
+        resultados = list(ejecutor.map(solicitud, range(args.solicitudes)))
+    total = time.perf_counter() - inicio
+    latencias = [latencia for latencia, correcta in resultados if correcta]
+    return {
+        'segundos': total,
+        'throughput': len(latencias) / total,
+        'p50': percentil(latencias, 0.5),
+        'p99': percentil(latencias, 0.99),
+        'errores': len(resultados) - len(latencias),
+    }
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Prueba de carga por tipo de worker de gunicorn')
+    parser.add_argument('--clases', default='sync,gthread,gevent')
+    parser.add_argument('--workers', type=int, default=2)
+    parser.add_argument('--clientes', type=int, default=32)
+    parser.add_argument('--solicitudes', type=int, default=200)
+    parser.add_argument('--page-size', type=int, default=50)
+    parser.add_argument('--latencia', type=float, default=0.2, help='segundos de espera por consulta')
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directorio:
+        base_datos = os.path.join(directorio, 'sale_exercises.sqlite3')
+        BaseDatosSimulada(base_datos).cargar(generar_filas(args.solicitudes * args.page_size))
+
+        print(f"{args.workers} workers, {args.clientes} clientes, {args.solicitudes} solicitudes de "
+              f"{args.page_size} filas, latencia de consulta {args.latencia}s")
+        print(f"{'worker':>8} {'total':>8} {'req/s':>8} {'p50':>8} {'p99':>8} {'errores':>8}")
+        for clase in args.clases.split(','):
+            proceso, url = iniciar_servidor(clase, args, base_datos, directorio)
+            try:
+                r = generar_carga(url, args)
+            finally:
+                proceso.terminate()
+                proceso.wait()
+            print(f"{clase:>8} {r['segundos']:>7.2f}s {r['throughput']:>8.1f} {r['p50']:>7.3f}s "
+                  f"{r['p99']:>7.3f}s {r['errores']:>8}")
@@ -0,0 +1,178 @@
+# datos_sinteticos.py
+# Generador de filas sintéticas de sale_exercises con blobs parecidos a los de producción
+# (saex_retroContents en JSON, saex_closingContents en HTML y saex_scoreData en JSON).
+
+import json
+import random
+from datetime import datetime, timedelta
+
+PALABRAS = (
+    "cliente asesor producto tarjeta crédito beneficio tasa plazo pago seguro cuenta ahorro "
+    "interés promoción necesidad objeción cierre venta atención empatía escucha propuesta "
+    "anualidad comisión límite saldo meses programa protección familia ingreso gasto"
+).split()
+
+CRITERIOS = [
+    "Presentó los beneficios principales del producto de forma clara",
+    "Identificó la necesidad del cliente antes de ofrecer el producto",
+    "Manejó la objeción del cliente con argumentos correctos",
+    "Explicó la tasa de interés y el costo anual total",
+    "Realizó el cierre de la venta solicitando la aceptación del cliente",
+    "Confirmó los datos del cliente y los siguientes pasos",
+]
+
+PREGUNTAS_CIERRE = [
+    "¿El cliente compraría el producto?",
+    "¿Por qué?",
+    "¿Alcanzó el mínimo de puntos para la compra?",
+    "Comentarios del evaluador",
+    "Puntaje final obtenido",
+]
+
+
+def _texto(rng, minimo, maximo):
+    return ' '.join(rng.choice(PALABRAS) for _ in range(rng.randint(minimo, maximo)))
+
+
+def generar_retro_prompt(rng, criterio, puntos, maximo):
+    veredicto = rng.choice(['SÍ', 'SI', 'NO'])
+    return (
+        f"<p><b>Criterio a evaluar</b>: {criterio}</p>\r\n"
+        f"<p><b>Puntaje</b>: {puntos} pts / {maximo} pts</p>\r\n"
+        f"<p><b>Respuesta modelo</b>: {_texto(rng, 25, 60)}.</p><br>"
+        f"<p>¿Has cumplido satisfactoriamente con los criterios de evaluación?: "
+        f"<span class=\"uppercase\">{veredicto}</span></p>\n"
+        f"<p><b>Retroalimentación</b>: {_texto(rng, 40, 120)}.</p>"
+    )
+
+
+def _plantillas_retro(rng, use_case, pregunta, variantes):
+    """
+    retroPrompt posibles para una pregunta de un caso de uso. En producción casi todas las filas
+    de un caso de uso repiten el mismo texto de plantilla, con pocas variantes de puntaje/veredicto.
+    """
+    clave = (use_case, pregunta)
+    if clave not in _PLANTILLAS:
+        semilla = random.Random(f"{use_case}-{pregunta}")
+        maximo = semilla.choice([5, 10, 20])
+        criterio = CRITERIOS[(pregunta - 1) % len(CRITERIOS)]
+        _PLANTILLAS[clave] = [
+            (str(puntos), generar_retro_prompt(semilla, criterio, puntos, maximo))
+            for puntos in (semilla.randint(0, maximo) for _ in range(variantes))
+        ]
+    return _PLANTILLAS[clave]
+
+
+_PLANTILLAS = {}
+
+
+def generar_retro_contents(rng, num_preguntas, use_case=302, variantes=8):
+    contenido = {}
+    for i in range(1, num_preguntas + 1):
+        puntos, retro_prompt = rng.choice(_plantillas_retro(rng, use_case, i, variantes))
+        contenido[str(i)] = {
+            'question': f"{CRITERIOS[(i - 1) % len(CRITERIOS)]}?",
+            'answer': _texto(rng, 10, 80),
+            'retroPrompt': retro_prompt,
+            'puntos': puntos,
+        }
+    return json.dumps(contenido, ensure_ascii=False)
+
+
+def generar_closing_contents(rng):
+    respuestas = [
+        rng.choice(['Sí', 'No', 'si', 'no']),
+        _texto(rng, 20, 60),
+        rng.choice(['Sí', 'No']),
+        _texto(rng, 5, 30),
+        f"{rng.randint(0, 60)} pts / 60 pts",
+    ]
+    partes = []
+    for pregunta, respuesta in zip(PREGUNTAS_CIERRE, respuestas):
+        partes.append(f'<div class="item">\r\n<p class="question">{pregunta}</p>\r\n<p class="answer">{respuesta}</p>\r\n</div>')
+    return '\r\n'.join(partes)
+
+
+def generar_fila(rng, saex_id, use_cases=(302, 303, 304, 305), inicio=datetime(2025, 1, 1)):
+    use_case = rng.choice(use_cases)
+    num_preguntas = rng.randint(3, 8)
+    score_sum = rng.randint(0, 60)
+    return {
+        'saex_id': saex_id,
+        'saex_user': rng.randint(1, 500),
+        'saex_useCases': use_case,
+        'saex_useCasesTitle': f"Caso de uso {use_case}",
+        'saex_username': f"Usuario {rng.randint(1, 500)}",
+        'saex_retroContents': generar_retro_contents(rng, num_preguntas, use_case),
+        'saex_closingContents': generar_closing_contents(rng),
+        'saex_DateTime': inicio + timedelta(minutes=7 * saex_id),
+        'saex_iterations': rng.randint(1, 5),
+        'saex_score': rng.randint(0, 100),
+        'saex_scoreData': json.dumps({'sum': score_sum, 'item': num_preguntas, 'avg': round(score_sum / num_preguntas, 2)}),
+        'saex_sold': rng.randint(0, 1),
+        'saex_rp_id': rng.randint(1, 50),
+        'saex_rp_email': f"asesor{rng.randint(1, 500)}@example.com",
+        'saex_rp_activity': f"Actividad {use_case}-{rng.randint(1, 4)}",
+        'saex_rp_client': f"Cliente {rng.randint(1, 20)}",
+    }
+
+
+def generar_filas(cantidad, semilla=1234):
+    rng = random.Random(semilla)
+    return [generar_fila(rng, i) for i in range(1, cantidad + 1)]
+
+
+# Blobs mal formados que aparecen en producción: JSON truncado o vacío, contenidos sin las claves
+# esperadas, preguntas faltantes y HTML de cierre cortado o sin las clases question/answer. Todos
+# deben procesarse sin excepciones (el campo afectado queda con su valor por omisión).
+def _retro_sin_campos(fila):
+    num_preguntas = len(json.loads(fila['saex_retroContents']))
+    return {**fila, 'saex_retroContents': json.dumps({str(i): {} for i in range(1, num_preguntas + 1)})}
+
+
+def _retro_con_huecos(fila):
+    contenido = json.loads(fila['saex_retroContents'])
+    return {**fila, 'saex_retroContents': json.dumps(
+        {clave: valor for clave, valor in contenido.items() if int(clave) % 2}, ensure_ascii=False
+    )}
+
+
+def _truncar(columna, divisor):
+    return lambda fila: {**fila, columna: fila[columna][:len(fila[columna]) // divisor]}
+
+
+def _reemplazar(columna, valor):
+    return lambda fila: {**fila, columna: valor}
+
+
+def _sin_clases_cierre(fila):
+    cierre = fila['saex_closingContents'].replace(' class="question"', '').replace(' class="answer"', '')
+    return {**fila, 'saex_closingContents': cierre}
+
+
+MALFORMACIONES = {
+    'retro_truncado': _truncar('saex_retroContents', 2),
+    'retro_vacio': _reemplazar('saex_retroContents', ''),
+    'retro_nulo': _reemplazar('saex_retroContents', None),
+    'retro_sin_campos': _retro_sin_campos,
+    'retro_con_huecos': _retro_con_huecos,
+    'cierre_truncado': _truncar('saex_closingContents', 3),
+    'cierre_sin_clases': _sin_clases_cierre,
+    'cierre_nulo': _reemplazar('saex_closingContents', None),
+    'score_truncado': _truncar('saex_scoreData', 5),
+    'score_nulo': _reemplazar('saex_scoreData', None),
+}
+
+
+def generar_filas_con_errores(cantidad, semilla=1234, fraccion_malformadas=0.02):
+    """
+    Las mismas filas que generar_filas(cantidad, semilla), con una fracción de ellas reemplazada por
+    una variante mal formada (MALFORMACIONES). La elección usa su propio generador, así que las filas
+    correctas no cambian con la fracción.
+    """
+    rng = random.Random(f"{semilla}-malformadas")
+    nombres = sorted(MALFORMACIONES)
+    return [
+        MALFORMACIONES[rng.choice(nombres)](fila) if rng.random() < fraccion_malformadas else fila
+        for fila in generar_filas(cantidad, semilla)
+    ]
@@ -0,0 +1,220 @@
+# reproducir_trafico.py
+# Prueba de carga con tráfico real: lee las líneas "Request to ... received with ids: ..." que
+# app.py escribe en logs/app.log (nivel DEBUG), las convierte en solicitudes y las reproduce contra
+# una instancia en ejecución respetando los intervalos originales entre ellas.
+#
+#   --velocidad    factor de aceleración sobre los tiempos del log (2 = al doble de ritmo); con 0 se
+#                  envían sin pausas, tan rápido como lo permita la concurrencia
+#   --concurrencia solicitudes en vuelo como máximo; si se llena, las siguientes salen tarde y el
+#                  retraso respecto del horario del log se reporta aparte
+#
+# Se reproducen las rutas de lectura (/api/rol_play_sim_extractor, /api/dim_actividades y
+# /api/aggregates). /api/exportaciones crea trabajos en el servidor y sólo se incluye si se pide
+# con --rutas. El log no registra cursor, stream ni format, así que se piden páginas JSON normales.
+#
+# Reporta throughput, latencia p50/p95/p99 y tasa de error (estado >= 400 o sin respuesta), en total
+# y por ruta.
+#
+# Uso: python benchmarks/reproducir_trafico.py --url http://localhost:7001 [logs/app.log ...]
+#                                              [--velocidad 1] [--concurrencia 16] [--limite 0]
+#                                              [--rutas /api/dim_actividades,...] [--salida r.json]
+
+import argparse
+import json
+import re
+import threading
+import time
+from collections import Counter, defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+import requests
+
+RUTAS_LECTURA = ('/api/rol_play_sim_extractor', '/api/dim_actividades', '/api/aggregates')
+
+# Formato de utils/logger.py: '%(asctime)s %(levelname)s: %(message)s'
+PATRON_SOLICITUD = re.compile(
+    r'^(?P<fecha>\d{4}-\d{2}-\d{2} \d{2}:\d{2}:\d{2},\d{3}) \w+: '
+    r'Request to (?P<ruta>/\S+) received with ids: \[(?P<ids>[^\]]*)\], '
+    r'date range: (?P<fecha_inicio>.*?) - (?P<fecha_fin>.*?), (?P<resto>\w+: .*)$'
+)
+PATRON_PAGINA = re.compile(r'^page: (?P<page>-?\d+), page_size: (?P<page_size>-?\d+)$')
+PATRON_AGREGADOS = re.compile(r'^agrupar: \[(?P<agrupar>[^\]]*)\], metricas: \[(?P<metricas>[^\]]*)\]$')
+PATRON_EXPORTACION = re.compile(r'^tipo: (?P<tipo>\S*)$')
+
+
+def lista_log(texto):
+    """
+    Elementos de una lista impresa por el log: "302, 303" o "'modulo', 'dia'".
+    """
+    return [valor.strip().strip("'\"") for valor in texto.split(',') if valor.strip()]
+
+
+def parsear_linea(linea):
+    """
+    Devuelve (instante, método, ruta, parámetros) para una línea de solicitud, o None si la línea
+    no es de una ruta conocida.
+    """
+    coincidencia = PATRON_SOLICITUD.match(linea.rstrip('\r\n'))
+    if not coincidencia:
+        return None
+    ruta = coincidencia['ruta']
+    parametros = {'id': lista_log(coincidencia['ids'])}
+    if coincidencia['fecha_inicio']:
+        parametros['fecha_inicio'] = coincidencia['fecha_inicio']
+    if coincidencia['fecha_fin']:
+        parametros['fecha_fin'] = coincidencia['fecha_fin']
+
+    resto = coincidencia['resto']
+    metodo = 'GET'
+    if (pagina := PATRON_PAGINA.match(resto)):
+        parametros['page'] = int(pagina['page'])
+        parametros['page_size'] = int(pagina['page_size'])
+    elif (agregados := PATRON_AGREGADOS.match(resto)):
+        parametros['agrupar'] = ','.join(lista_log(agregados['agrupar']))
+        parametros['metrica'] = ','.join(lista_log(agregados['metricas']))
+    elif (exportacion := PATRON_EXPORTACION.match(resto)):
+        metodo = 'POST'
+        parametros['tipo'] = exportacion['tipo']
+    else:
+        return None
+
+    instante = datetime.strptime(coincidencia['fecha'], '%Y-%m-%d %H:%M:%S,%f').timestamp()
+    return instante, metodo, ruta, parametros
+
+
+def cargar_solicitudes(rutas_log, rutas, limite=0):
+    """
+    Solicitudes de los logs ordenadas por instante, con el desplazamiento en segundos desde la
+    primera. Los logs rotados pueden pasarse en cualquier orden.
+    """
+    solicitudes = []
+    for ruta_log in rutas_log:
+        with open(ruta_log, encoding='utf-8', errors='replace') as archivo:
+            for linea in archivo:
+                if 'Request to ' not in linea:
+                    continue
+                solicitud = parsear_linea(linea)
+                if solicitud and solicitud[2] in rutas:
+                    solicitudes.append(solicitud)
+    solicitudes.sort(key=lambda solicitud: solicitud[0])
+    if limite:
+        solicitudes = solicitudes[:limite]
+    if not solicitudes:
+        return []
+    inicio = solicitudes[0][0]
+    return [(instante - inicio, metodo, ruta, parametros) for instante, metodo, ruta, parametros in solicitudes]
+
+
+def percentil(valores, p):
+    ordenados = sorted(valores)
+    return ordenados[min(len(ordenados) - 1, int(len(ordenados) * p))] if ordenados else 0.0
+
+
+def reproducir(url, solicitudes, velocidad, concurrencia, timeout):
+    """
+    Envía las solicitudes a su hora (desplazamiento / velocidad) con a lo sumo `concurrencia` en
+    vuelo. Devuelve por solicitud (ruta, estado o None, latencia, retraso sobre su horario).
+    """
+    local = threading.local()
+    cupos = threading.BoundedSemaphore(concurrencia)
+
+    def enviar(metodo, ruta, parametros, programada):
+        sesion = getattr(local, 'sesion', None)
+        if sesion is None:
+            sesion = local.sesion = requests.Session()
+        inicio = time.perf_counter()
+        try:
+            respuesta = sesion.request(metodo, f'{url}{ruta}', params=parametros, timeout=timeout)
+            # Se lee el cuerpo completo: la latencia incluye la transferencia de la página
+            respuesta.content
+            estado = respuesta.status_code
+        except requests.RequestException:
+            estado = None
+        finally:
+            cupos.release()
+        return ruta, estado, time.perf_counter() - inicio, inicio - programada
+
+    futuros = []
+    with ThreadPoolExecutor(max_workers=concurrencia) as ejecutor:
+        comienzo = time.perf_counter()
+        for desplazamiento, metodo, ruta, parametros in solicitudes:
+            programada = comienzo + (desplazamiento / velocidad if velocidad else 0)
+            espera = programada - time.perf_counter()
+            if espera > 0:
+                time.sleep(espera)
+            # Sin cupo libre la solicitud sale tarde; el retraso queda en el resultado. Sin pausas
+            # (velocidad 0) no hay horario: el retraso se mide desde que obtiene el cupo.
+            cupos.acquire()
+            if not velocidad:
+                programada = time.perf_counter()
+            futuros.append(ejecutor.submit(enviar, metodo, ruta, parametros, programada))
+        resultados = [futuro.result() for futuro in futuros]
+    return resultados, time.perf_counter() - comienzo
+
+
+def resumir(resultados, segundos):
+    latencias = [latencia for _, estado, latencia, _ in resultados if estado is not None and estado < 400]
+    errores = len(resultados) - len(latencias)
+    retrasos = [retraso for _, _, _, retraso in resultados]
+    return {
+        'solicitudes': len(resultados),
+        'throughput': round(len(latencias) / segundos, 2) if segundos else 0.0,
+        'p50_ms': round(percentil(latencias, 0.5) * 1000, 1),
+        'p95_ms': round(percentil(latencias, 0.95) * 1000, 1),
+        'p99_ms': round(percentil(latencias, 0.99) * 1000, 1),
+        'max_ms': round(max(latencias, default=0.0) * 1000, 1),
+        'errores': errores,
+        'tasa_error': round(errores / len(resultados), 4) if resultados else 0.0,
+        'retraso_p99_ms': round(percentil(retrasos, 0.99) * 1000, 1),
+        'estados': dict(Counter(str(estado or 'sin_respuesta') for _, estado, _, _ in resultados)),
+    }
+
+
+def imprimir(nombre, r):
+    print(f"{nombre:<30} {r['solicitudes']:>7} {r['throughput']:>8.1f} {r['p50_ms']:>8.0f}ms "
+          f"{r['p95_ms']:>8.0f}ms {r['p99_ms']:>8.0f}ms {r['tasa_error']:>7.1%} {r['retraso_p99_ms']:>8.0f}ms")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Reproduce el tráfico registrado en logs/app.log')
+    parser.add_argument('logs', nargs='*', default=['logs/app.log'], help='por omisión logs/app.log')
+    parser.add_argument('--url', required=True, help='instancia destino, p. ej. http://localhost:7001')
+    parser.add_argument('--velocidad', type=float, default=1.0, help='factor de aceleración; 0 = sin pausas')
+    parser.add_argument('--concurrencia', type=int, default=16)
+    parser.add_argument('--limite', type=int, default=0, help='reproducir sólo las primeras N solicitudes')
+    parser.add_argument('--rutas', default=','.join(RUTAS_LECTURA))
+    parser.add_argument('--timeout', type=float, default=600)
+    parser.add_argument('--salida', default=None, help='archivo JSON con el resumen')
+    args = parser.parse_args()
+
+    solicitudes = cargar_solicitudes(args.logs, set(args.rutas.split(',')), args.limite)
+    if not solicitudes:
+        parser.error('no se encontraron solicitudes en los logs (¿el nivel de log era DEBUG?)')
+
+    duracion = solicitudes[-1][0]
+    mezcla = Counter(ruta for _, _, ruta, _ in solicitudes)
+    print(f"{len(solicitudes):,} solicitudes en {duracion:.0f}s de log; velocidad "
+          f"{f'{args.velocidad:g}x ({duracion / args.velocidad:.0f}s)' if args.velocidad else 'sin pausas'}, "
+          f"concurrencia {args.concurrencia}")
+    for ruta, cantidad in mezcla.most_common():
+        print(f"  {ruta:<30} {cantidad:>7,}")
+
+    resultados, segundos = reproducir(args.url.rstrip('/'), solicitudes, args.velocidad, args.concurrencia, args.timeout)
+
+    print(f"\n{'ruta':<30} {'total':>7} {'req/s':>8} {'p50':>10} {'p95':>10} {'p99':>10} {'error':>7} {'retraso':>10}")
+    por_ruta = defaultdict(list)
+    for resultado in resultados:
+        por_ruta[resultado[0]].append(resultado)
+    resumen = {'total': resumir(resultados, segundos)}
+    for ruta in sorted(por_ruta):
+        resumen[ruta] = resumir(por_ruta[ruta], segundos)
+        imprimir(ruta, resumen[ruta])
+    imprimir('total', resumen['total'])
+    print(f"\n{segundos:.1f}s; estados: {resumen['total']['estados']}")
+
+    if args.salida:
+        with open(args.salida, 'w', encoding='utf-8') as archivo:
+            json.dump({'fecha': datetime.now().isoformat(timespec='seconds'), 'url': args.url,
+                       'velocidad': args.velocidad, 'concurrencia': args.concurrencia,
+                       'resumen': resumen}, archivo, indent=2)
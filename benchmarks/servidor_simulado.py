@@ -0,0 +1,24 @@
+# servidor_simulado.py
+# La app real (app/app.py) con la base de datos reemplazada por BaseDatosSimulada, para las pruebas
+# de carga sin un servidor MySQL. gunicorn la carga como servidor_simulado:app con app/ y
+# benchmarks/ en PYTHONPATH (ver carga_workers.py).
+#
+# Variables de entorno:
+#   BENCH_BASE_DATOS          archivo SQLite ya cargado con BaseDatosSimulada.cargar
+#   BENCH_LATENCIA_CONSULTA   segundos de espera por consulta (por omisión 0.2)
+#   BENCH_LATENCIA_FILA       segundos de espera por fila devuelta (por omisión 0.0001)
+#
+# La latencia simulada se espera con time.sleep, que con workers gevent queda parcheado y cede el
+# control igual que la lectura de un socket de MySQL con el driver de Python puro.
+
+import os
+
+import app as aplicacion
+from base_datos_simulada import BaseDatosSimulada
+
+aplicacion.db_conn = BaseDatosSimulada(
+    os.environ['BENCH_BASE_DATOS'],
+    latencia_consulta=float(os.getenv('BENCH_LATENCIA_CONSULTA', '0.2')),
+    latencia_fila=float(os.getenv('BENCH_LATENCIA_FILA', '0.0001')),
+)
+app = aplicacion.app
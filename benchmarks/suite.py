@@ -0,0 +1,253 @@
+# suite.py
+# Suite de benchmarks reproducible: genera filas sintéticas de sale_exercises con una semilla fija
+# (datos_sinteticos.py, incluida una fracción de blobs mal formados), las carga en el sustituto
+# SQLite de MySQL (base_datos_simulada.py) y mide cada caso por tamaño de página hasta MAX_PAGE_SIZE:
+#
+#   rol_play_sim                   GET /api/rol_play_sim_extractor (consulta, procesamiento y JSON)
+#   dim_actividades                GET /api/dim_actividades
+#   bancoppel                      BancoppelDashboardModel.get_data_paginated (no tiene ruta HTTP)
+#   extract_key_questions_answers  la función sobre los saex_closingContents de la página
+#
+# Para cada caso y tamaño reporta filas/s (sobre la mediana), latencia p50/p99 y RSS pico. Cada
+# combinación corre en un proceso aparte para que el RSS pico sea sólo el suyo; la primera ejecución
+# calienta los caches de plantillas, como en un worker que ya atendió solicitudes, y no se cuenta.
+# Con pocas repeticiones (páginas grandes) el p99 es prácticamente el máximo.
+#
+# El resultado se escribe en JSON (--salida) para comparar corridas: --comparar anterior.json
+# imprime la razón entre la corrida actual y la anterior para cada caso.
+#
+# Uso: python benchmarks/suite.py [--casos rol_play_sim,dim_actividades,...] [--page-sizes 100,1000,...]
+#                                 [--semilla 1234] [--malformadas 0.02] [--salida suite.json]
+#                                 [--comparar anterior.json]
+
+import argparse
+import json
+import os
+import platform
+import resource
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime
+
+DIRECTORIO = os.path.dirname(os.path.abspath(__file__))
+DIRECTORIO_APP = os.path.join(DIRECTORIO, '..', 'app')
+sys.path.insert(0, DIRECTORIO_APP)
+
+IDS = (302, 303, 304, 305)
+CASOS = ('rol_play_sim', 'dim_actividades', 'bancoppel', 'extract_key_questions_answers')
+RUTAS = {
+    'rol_play_sim': '/api/rol_play_sim_extractor',
+    'dim_actividades': '/api/dim_actividades',
+}
+
+
+def rss_pico_mb():
+    # VmHWM es el pico de la imagen actual del proceso. ru_maxrss en cambio conserva el del padre a
+    # través de fork/exec (el orquestador tiene en memoria todas las filas generadas).
+    try:
+        with open('/proc/self/status', encoding='ascii') as estado:
+            for linea in estado:
+                if linea.startswith('VmHWM:'):
+                    return int(linea.split()[1]) / 1024
+    except OSError:
+        pass
+    # ru_maxrss está en KB en Linux
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def percentil(valores, p):
+    ordenados = sorted(valores)
+    return ordenados[min(len(ordenados) - 1, int(len(ordenados) * p))]
+
+
+def repeticiones_por_omision(page_size):
+    return max(3, min(30, 30000 // page_size))
+
+
+def preparar_caso(caso, base_datos, page_size):
+    """
+    Devuelve una función sin argumentos que ejecuta una vez el caso y devuelve un código de estado
+    (el HTTP de la respuesta, o 200 para los casos sin ruta).
+    """
+    import app as aplicacion
+    from base_datos_simulada import BaseDatosSimulada
+
+    aplicacion.db_conn = BaseDatosSimulada(base_datos)
+
+    if caso in RUTAS:
+        cliente = aplicacion.app.test_client()
+        parametros = {'id': list(IDS), 'page': 1, 'page_size': page_size}
+        return lambda: cliente.get(RUTAS[caso], query_string=parametros).status_code
+
+    if caso == 'bancoppel':
+        from models.bancoppel_manager import BancoppelDashboardModel
+
+        def ejecutar_bancoppel():
+            modelo = BancoppelDashboardModel(aplicacion.db_conn)
+            modelo.get_data_paginated(list(IDS), page=1, page_size=page_size)
+            return 200
+        return ejecutar_bancoppel
+
+    if caso == 'extract_key_questions_answers':
+        from models.sale_exercises_query import construir_query_sale_exercises
+        from utils.functions_la import extract_key_questions_answers
+
+        query, query_params = construir_query_sale_exercises(
+            list(IDS), page=1, page_size=page_size, columnas=['saex_id', 'saex_closingContents']
+        )
+        cierres = [fila['saex_closingContents'] for fila in aplicacion.db_conn.ejecutar_query(query, query_params)]
+
+        def ejecutar_extraccion():
+            for cierre in cierres:
+                if cierre:
+                    extract_key_questions_answers(cierre)
+            return 200
+        return ejecutar_extraccion
+
+    raise ValueError(f"Caso desconocido: {caso}")
+
+
+def medir_caso(caso, base_datos, page_size, repeticiones):
+    """
+    Corre en el proceso hijo: calienta, repite el caso y devuelve sus métricas.
+    """
+    ejecutar = preparar_caso(caso, base_datos, page_size)
+    # Con la app importada y el caso listo, antes de la primera ejecución
+    rss_inicial = rss_pico_mb()
+    estados = {ejecutar()}
+    latencias = []
+    for _ in range(repeticiones):
+        inicio = time.perf_counter()
+        estados.add(ejecutar())
+        latencias.append(time.perf_counter() - inicio)
+    mediana = statistics.median(latencias)
+    return {
+        'caso': caso,
+        'page_size': page_size,
+        'repeticiones': repeticiones,
+        'filas_por_s': round(page_size / mediana, 1),
+        'p50_ms': round(mediana * 1000, 2),
+        'p99_ms': round(percentil(latencias, 0.99) * 1000, 2),
+        'rss_inicial_mb': round(rss_inicial, 1),
+        'rss_pico_mb': round(rss_pico_mb(), 1),
+        'estados': sorted(estados),
+    }
+
+
+def ejecutar_en_proceso(caso, base_datos, page_size, repeticiones, directorio):
+    # El hijo corre con el directorio temporal como cwd: logs/ y data/ de la app quedan fuera del repo
+    entorno = {**os.environ, 'CACHE_RESPUESTAS_TTL': '0'}
+    proceso = subprocess.run(
+        [sys.executable, os.path.abspath(__file__), '--medir', caso, '--base-datos', base_datos,
+         '--page-size', str(page_size), '--repeticiones', str(repeticiones)],
+        cwd=directorio, env=entorno, capture_output=True, text=True,
+    )
+    if proceso.returncode != 0:
+        raise RuntimeError(f"{caso} ({page_size} filas) falló:\n{proceso.stderr[-2000:]}")
+    return json.loads(proceso.stdout.strip().splitlines()[-1])
+
+
+def metadatos(args, filas):
+    try:
+        commit = subprocess.run(
+            ['git', 'rev-parse', '--short', 'HEAD'], cwd=DIRECTORIO, capture_output=True, text=True
+        ).stdout.strip() or None
+    except OSError:
+        commit = None
+    return {
+        'fecha': datetime.now().isoformat(timespec='seconds'),
+        'commit': commit,
+        'python': platform.python_version(),
+        'plataforma': platform.platform(),
+        'cpus': os.cpu_count(),
+        'semilla': args.semilla,
+        'filas': filas,
+        'fraccion_malformadas': args.malformadas,
+    }
+
+
+def comparar(resultados, ruta_anterior):
+    with open(ruta_anterior, encoding='utf-8') as archivo:
+        anteriores = {(r['caso'], r['page_size']): r for r in json.load(archivo)['resultados']}
+    print(f"\nComparación con {ruta_anterior} (actual / anterior)")
+    print(f"{'caso':<30} {'filas':>7} {'filas/s':>8} {'p50':>8} {'p99':>8} {'RSS':>8}")
+    for r in resultados:
+        anterior = anteriores.get((r['caso'], r['page_size']))
+        if anterior is None:
+            continue
+        print(f"{r['caso']:<30} {r['page_size']:>7} {r['filas_por_s'] / anterior['filas_por_s']:>7.2f}x "
+              f"{r['p50_ms'] / anterior['p50_ms']:>7.2f}x {r['p99_ms'] / anterior['p99_ms']:>7.2f}x "
+              f"{r['rss_pico_mb'] / anterior['rss_pico_mb']:>7.2f}x")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Suite de benchmarks con datos sintéticos de sale_exercises')
+    parser.add_argument('--casos', default=','.join(CASOS))
+    parser.add_argument('--page-sizes', default=None, help='por omisión 100,1000,10000 y MAX_PAGE_SIZE')
+    parser.add_argument('--repeticiones', type=int, default=None, help='por omisión según el tamaño de página')
+    parser.add_argument('--semilla', type=int, default=1234)
+    parser.add_argument('--malformadas', type=float, default=0.02, help='fracción de filas con blobs mal formados')
+    parser.add_argument('--salida', default=None, help='archivo JSON de resultados')
+    parser.add_argument('--comparar', default=None, help='JSON de una corrida anterior')
+    # Modo interno: un caso en este proceso, resultado en JSON por stdout
+    parser.add_argument('--medir', default=None, help=argparse.SUPPRESS)
+    parser.add_argument('--base-datos', default=None, help=argparse.SUPPRESS)
+    parser.add_argument('--page-size', type=int, default=None, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.medir:
+        print(json.dumps(medir_caso(args.medir, args.base_datos, args.page_size, args.repeticiones)))
+        return
+
+    from base_datos_simulada import BaseDatosSimulada
+    from datos_sinteticos import generar_filas_con_errores
+
+    salida = args.salida or f"suite_{datetime.now():%Y%m%d_%H%M%S}.json"
+    salida = os.path.abspath(salida)
+    directorio_inicial = os.getcwd()
+    casos = args.casos.split(',')
+    desconocidos = set(casos) - set(CASOS)
+    if desconocidos:
+        parser.error(f"casos desconocidos: {', '.join(sorted(desconocidos))}")
+
+    with tempfile.TemporaryDirectory() as directorio:
+        if args.page_sizes:
+            tamanos = [int(t) for t in args.page_sizes.split(',')]
+        else:
+            # La app crea logs/ y data/ en el directorio actual al importarse
+            os.chdir(directorio)
+            from app import MAX_PAGE_SIZE
+            os.chdir(directorio_inicial)
+            tamanos = sorted({100, 1000, 10000, MAX_PAGE_SIZE})
+
+        filas = max(tamanos)
+        base_datos = os.path.join(directorio, 'sale_exercises.sqlite3')
+        inicio = time.perf_counter()
+        BaseDatosSimulada(base_datos).cargar(
+            generar_filas_con_errores(filas, semilla=args.semilla, fraccion_malformadas=args.malformadas)
+        )
+        print(f"{filas:,} filas sintéticas cargadas en {time.perf_counter() - inicio:.1f}s")
+
+        print(f"{'caso':<30} {'filas':>7} {'filas/s':>10} {'p50':>10} {'p99':>10} {'RSS pico':>10}")
+        resultados = []
+        for caso in casos:
+            for page_size in tamanos:
+                repeticiones = args.repeticiones or repeticiones_por_omision(page_size)
+                r = ejecutar_en_proceso(caso, base_datos, page_size, repeticiones, directorio)
+                resultados.append(r)
+                print(f"{caso:<30} {page_size:>7} {r['filas_por_s']:>10,.0f} {r['p50_ms']:>8.1f}ms "
+                      f"{r['p99_ms']:>8.1f}ms {r['rss_pico_mb']:>8.1f}MB")
+
+    with open(salida, 'w', encoding='utf-8') as archivo:
+        json.dump({'metadatos': metadatos(args, filas), 'resultados': resultados}, archivo, indent=2)
+    print(f"Resultados en {salida}")
+
+    if args.comparar:
+        comparar(resultados, args.comparar)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,51 @@
+# verificar_clasificador_retro.py
+# Compara el clasificador precompilado contra el corpus dorado generado con la implementación
+# anterior de RolPlaySimExtractor.extraer_info_correcta / extraer_puntos, y mide su velocidad.
+#
+# Uso: python benchmarks/verificar_clasificador_retro.py
+
+import json
+import os
+import sys
+import time
+
+AQUI = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(AQUI, '..', 'app'))
+
+from utils.clasificador_retro import clasificar_info_correcta, extraer_puntos
+
+CORPUS = os.path.join(AQUI, 'golden', 'clasificador_retro.json')
+
+
+def verificar(casos):
+    diferencias = []
+    for caso in casos:
+        obtenido = {
+            'Info_Correcta': clasificar_info_correcta(caso['retroPrompt']),
+            'Puntos': extraer_puntos(caso['retroPrompt']),
+        }
+        for campo, valor in obtenido.items():
+            if valor != caso[campo]:
+                diferencias.append((caso['retroPrompt'], campo, caso[campo], valor))
+    return diferencias
+
+
+def medir(casos, repeticiones=20):
+    prompts = [caso['retroPrompt'] for caso in casos]
+    inicio = time.perf_counter()
+    for _ in range(repeticiones):
+        for prompt in prompts:
+            clasificar_info_correcta(prompt)
+    return len(prompts) * repeticiones / (time.perf_counter() - inicio)
+
+
+if __name__ == '__main__':
+    with open(CORPUS, encoding='utf-8') as archivo:
+        casos = json.load(archivo)
+
+    diferencias = verificar(casos)
+    for prompt, campo, esperado, obtenido in diferencias[:20]:
+        print(f"{campo}: esperado {esperado!r}, obtenido {obtenido!r} para {prompt[:120]!r}")
+    print(f"{len(casos)} casos, {len(diferencias)} diferencias")
+    print(f"clasificar_info_correcta: {medir(casos):,.0f} prompts/s")
+    sys.exit(1 if diferencias else 0)
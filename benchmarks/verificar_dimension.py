@@ -0,0 +1,150 @@
+# verificar_dimension.py
+# Comprueba que modo=dimension (DimActividadesExtractor.get_dimension, que procesa sólo el primer y
+# el último ejercicio de cada grupo de construir_query_representantes_dimension) devuelve las mismas
+# actividades, en el mismo orden, que procesar todos los ejercicios en orden de saex_id.
+#
+# Sobre filas sintéticas se editan ejercicios sueltos dentro de cada grupo: criterio y puntaje
+# máximo del retroPrompt, preguntas sin retroPrompt, claves renombradas y preguntas de cierre
+# distintas o agregadas. Ninguno de esos ejercicios es el primero ni el último de su actividad, así
+# que la dimensión sólo los ve si la variante de plantilla los separa en su propio grupo. Además se
+# incluyen filas mal formadas (MALFORMACIONES de datos_sinteticos), que deben quedar en grupos propios.
+#
+# También mide lo que justifica la consulta de representantes: cuántos grupos quedan frente al
+# número de ejercicios (las respuestas y puntajes obtenidos de cada ejercicio no deben separarlos) y
+# el tiempo frente a leer todo. La base simulada espera latencia_fila segundos por fila devuelta,
+# como la transferencia de los blobs desde MySQL.
+#
+# Uso: python benchmarks/verificar_dimension.py [filas] [fraccion_editadas] [latencia_fila]
+
+import json
+import os
+import random
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'app'))
+
+from base_datos_simulada import BaseDatosSimulada
+from datos_sinteticos import MALFORMACIONES, PREGUNTAS_CIERRE, generar_filas
+from models.dim_actividades_extractor import DimActividadesExtractor
+from models.sale_exercises_query import construir_query_por_ids, construir_query_representantes_dimension
+
+USE_CASES = [302, 303, 304, 305]
+CAMPOS = [None, ['Actividad_Nombre', 'Criterio'], ['Puntos_Max'], ['Caso_de_Uso', 'Veredicto_Venta']]
+
+
+def _editar_retro(fila, editar):
+    contenido = json.loads(fila['saex_retroContents'])
+    editar(contenido)
+    return {**fila, 'saex_retroContents': json.dumps(contenido, ensure_ascii=False)}
+
+
+def _prompt_editado(rng, contenido):
+    pregunta = contenido[rng.choice(sorted(contenido))]
+    pregunta['retroPrompt'] = pregunta['retroPrompt'].replace('</b>: ', '</b>: (revisado) ', 1)
+
+
+def _puntos_max_editado(rng, contenido):
+    pregunta = contenido[rng.choice(sorted(contenido))]
+    pregunta['retroPrompt'] = pregunta['retroPrompt'].replace(' pts</p>', '5 pts</p>', 1)
+
+
+def _sin_retro_prompt(rng, contenido):
+    contenido[rng.choice(sorted(contenido))].pop('retroPrompt')
+
+
+def _clave_renombrada(rng, contenido):
+    clave = rng.choice(sorted(contenido))
+    contenido['9'] = contenido.pop(clave)
+
+
+def _pregunta_cierre(fila, reemplazo):
+    pregunta = PREGUNTAS_CIERRE[1]
+    return {**fila, 'saex_closingContents': fila['saex_closingContents'].replace(pregunta, reemplazo, 1)}
+
+
+EDICIONES = {
+    'prompt_editado': lambda rng, fila: _editar_retro(fila, lambda c: _prompt_editado(rng, c)),
+    'puntos_max_editado': lambda rng, fila: _editar_retro(fila, lambda c: _puntos_max_editado(rng, c)),
+    'sin_retro_prompt': lambda rng, fila: _editar_retro(fila, lambda c: _sin_retro_prompt(rng, c)),
+    'clave_renombrada': lambda rng, fila: _editar_retro(fila, lambda c: _clave_renombrada(rng, c)),
+    'pregunta_cierre_editada': lambda rng, fila: _pregunta_cierre(fila, '¿Por qué no?'),
+    'pregunta_cierre_agregada': lambda rng, fila: _pregunta_cierre(
+        fila, f'¿Por qué?</p>\r\n<p class="answer">{rng.choice(["si", "no"])}</p>\r\n'
+              f'<p class="question">¿Volvería a comprar?'
+    ),
+}
+
+
+def filas_editadas(cantidad, fraccion, semilla=1234, fraccion_malformadas=0.01):
+    filas = generar_filas(cantidad, semilla)
+    extremos = {}
+    for fila in filas:
+        extremos.setdefault(fila['saex_rp_activity'], []).append(fila['saex_id'])
+    extremos = {saex_id for ids in extremos.values() for saex_id in (ids[0], ids[-1])}
+
+    rng = random.Random(semilla)
+    nombres = sorted(EDICIONES)
+    editadas = {nombre: 0 for nombre in nombres}
+    editadas['mal_formadas'] = 0
+    resultado = []
+    for fila in filas:
+        if fila['saex_id'] not in extremos and rng.random() < fraccion:
+            nombre = rng.choice(nombres)
+            fila = EDICIONES[nombre](rng, fila)
+            editadas[nombre] += 1
+        elif rng.random() < fraccion_malformadas:
+            # Como en generar_filas_con_errores; también puede tocar al primero o al último
+            fila = MALFORMACIONES[rng.choice(sorted(MALFORMACIONES))](fila)
+            editadas['mal_formadas'] += 1
+        resultado.append(fila)
+    return resultado, editadas
+
+
+def dimension_completa(db, saex_ids, campos):
+    # Todos los ejercicios en orden de saex_id, con el mismo procesamiento que la paginación
+    extractor = DimActividadesExtractor(db, campos=campos)
+    query, query_params = construir_query_por_ids(saex_ids, columnas=extractor.columnas)
+    return extractor.obtener_actividades(db.ejecutar_query(query, query_params, como_tuplas=True))
+
+
+if __name__ == '__main__':
+    cantidad = int(sys.argv[1]) if len(sys.argv) > 1 else 3000
+    fraccion = float(sys.argv[2]) if len(sys.argv) > 2 else 0.05
+    latencia_fila = float(sys.argv[3]) if len(sys.argv) > 3 else 0.0002
+    filas, editadas = filas_editadas(cantidad, fraccion)
+    print(f"{cantidad:,} filas; editadas: {editadas}")
+
+    diferencias = 0
+    lentas = 0
+    with tempfile.TemporaryDirectory() as directorio:
+        db = BaseDatosSimulada(os.path.join(directorio, 'sale_exercises.sqlite3'), latencia_fila=latencia_fila)
+        db.cargar(filas)
+        query, query_params = construir_query_representantes_dimension(USE_CASES)
+        grupos = db.ejecutar_query(query, query_params)
+        representantes = {fila[columna] for fila in grupos for columna in ('primer_id', 'ultimo_id')}
+        print(f"{len(grupos):,} grupos, {len(representantes):,} filas representativas de {cantidad:,} "
+              f"(latencia por fila {latencia_fila * 1000:.2f}ms)")
+
+        saex_ids = [fila['saex_id'] for fila in filas]
+        for campos in CAMPOS:
+            inicio = time.perf_counter()
+            dimension = DimActividadesExtractor(db, campos=campos).get_dimension(USE_CASES)
+            segundos_dimension = time.perf_counter() - inicio
+            inicio = time.perf_counter()
+            completa = dimension_completa(db, saex_ids, campos)
+            segundos_completa = time.perf_counter() - inicio
+
+            iguales = dimension == completa
+            diferencias += not iguales
+            lentas += segundos_dimension >= segundos_completa
+            faltantes = [actividad for actividad in completa if actividad not in dimension]
+            print(f"fields={','.join(campos) if campos else '(todos)':<32} {len(completa):>5} actividades "
+                  f"{'iguales' if iguales else f'DISTINTAS ({len(faltantes)} faltan)'}; "
+                  f"dimensión {segundos_dimension * 1000:.0f}ms, completa {segundos_completa * 1000:.0f}ms "
+                  f"(x{segundos_completa / segundos_dimension:.1f})")
+
+    if lentas:
+        print(f"La dimensión no fue más rápida que la lectura completa en {lentas} casos")
+    sys.exit(1 if diferencias or lentas else 0)
@@ -0,0 +1,103 @@
+# verificar_fragmentos_cierre.py
+# Compara utils.fragmentos_html en sus tres usos (DimActividadesExtractor, RolPlaySimExtractor y
+# extract_key_questions_answers) contra el corpus dorado, y mide el costo por fila frente a
+# BeautifulSoup si está instalado. Todas las salidas del corpus (Veredictos, Ventas y Claves) se
+# generaron ejecutando el código anterior al extractor compartido (commit 064d5eb:
+# BeautifulSoup en DimActividadesExtractor, re.findall en RolPlaySimExtractor y en
+# extract_key_questions_answers), así que los casos con <p> escritos de otra forma (comillas
+# simples, mayúsculas, varias clases, otros atributos) o sin cerrar (contenido truncado) comprueban
+# que cada uso conserva su propia lectura. El costo se mide sobre el corpus completo, que es casi
+# todo marcado irregular, y sobre contenido sintético con la forma habitual.
+#
+# Uso: python benchmarks/verificar_fragmentos_cierre.py
+
+import json
+import os
+import random
+import sys
+import time
+
+AQUI = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(AQUI, '..', 'app'))
+
+from models.dim_actividades_extractor import DimActividadesExtractor
+from models.rol_play_sim_extractor import RolPlaySimExtractor
+from utils.fragmentos_html import extraer_fragmentos_cierre, texto_plano
+from utils.functions_la import extract_key_questions_answers
+
+from datos_sinteticos import generar_closing_contents
+
+CORPUS = os.path.join(AQUI, 'golden', 'fragmentos_cierre.json')
+
+# retroContents con 5 preguntas para que RolPlaySimExtractor emita Venta1..Venta5
+RETRO_CONTENTS = json.dumps({str(i): {'question': 'q', 'answer': 'a', 'retroPrompt': ''} for i in range(1, 6)})
+
+
+def obtener_salidas(closing_contents):
+    fila = {
+        'saex_useCases': 1,
+        'saex_useCasesTitle': 't',
+        'saex_rp_activity': 'a',
+        'saex_retroContents': RETRO_CONTENTS,
+        'saex_closingContents': closing_contents,
+    }
+    dim = DimActividadesExtractor(None).extraer_dim_actividades(fila)
+    rol_play = RolPlaySimExtractor(None)
+    rol_play.procesar_resultados([fila])
+    return {
+        'Veredictos': {k: v for k, v in dim.items() if k.startswith('Veredicto')},
+        'Ventas': {k: v for k, v in rol_play.datos_finales[0].items() if k.startswith('Venta')},
+        'Claves': extract_key_questions_answers(closing_contents),
+    }
+
+
+def verificar(casos):
+    diferencias = []
+    for caso in casos:
+        obtenido = obtener_salidas(caso['saex_closingContents'])
+        for campo, valor in obtenido.items():
+            if valor != caso[campo]:
+                diferencias.append((caso['saex_closingContents'], campo, caso[campo], valor))
+    return diferencias
+
+
+def medir(funcion, blobs, repeticiones=20):
+    inicio = time.perf_counter()
+    for _ in range(repeticiones):
+        for blob in blobs:
+            funcion(blob)
+    return (time.perf_counter() - inicio) / (len(blobs) * repeticiones) * 1e6
+
+
+def preguntas_fragmentos(blob):
+    preguntas, _ = extraer_fragmentos_cierre(blob)
+    return [texto_plano(pregunta) for pregunta in preguntas]
+
+
+if __name__ == '__main__':
+    with open(CORPUS, encoding='utf-8') as archivo:
+        casos = json.load(archivo)
+
+    diferencias = verificar(casos)
+    for blob, campo, esperado, obtenido in diferencias[:20]:
+        print(f"{campo}: esperado {esperado!r}, obtenido {obtenido!r} para {blob[:120]!r}")
+    print(f"{len(casos)} casos, {len(diferencias)} diferencias")
+
+    blobs = [caso['saex_closingContents'] for caso in casos]
+    rng = random.Random(1234)
+    habituales = [generar_closing_contents(rng) for _ in range(len(blobs))]
+    print(f"extraer_fragmentos_cierre + texto_plano: {medir(preguntas_fragmentos, blobs):.1f} µs/fila corpus, "
+          f"{medir(preguntas_fragmentos, habituales):.1f} µs/fila forma habitual")
+    try:
+        from bs4 import BeautifulSoup
+    except ImportError:
+        print("beautifulsoup4 no está instalado; se omite la comparación")
+    else:
+        def preguntas_bs4(blob):
+            soup = BeautifulSoup(blob, 'html.parser')
+            return [p.get_text(strip=True) for p in soup.find_all('p', class_='question')]
+
+        print(f"BeautifulSoup html.parser: {medir(preguntas_bs4, blobs, repeticiones=3):.1f} µs/fila corpus, "
+              f"{medir(preguntas_bs4, habituales, repeticiones=3):.1f} µs/fila forma habitual")
+
+    sys.exit(1 if diferencias else 0)